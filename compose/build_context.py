@@ -0,0 +1,367 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from fnmatch import fnmatch
+import hashlib
+import json
+import logging
+import os
+import re
+import stat
+import tarfile
+import tempfile
+import threading
+import time
+import zlib
+
+log = logging.getLogger(__name__)
+
+# Files in the context which docker-py never excludes, as the daemon needs them
+ALWAYS_INCLUDED = ('Dockerfile', '.dockerignore')
+
+READ_SIZE = 64 * 1024
+
+# Size of the chunks a packed build context is sent in
+CHUNK_SIZE = 64 * 1024
+
+FROM_INSTRUCTION = re.compile(r'^\s*FROM\s+(\S+)', re.IGNORECASE | re.MULTILINE)
+
+
+def cache_dir():
+    """
+    The directory Compose keeps its caches in.
+    """
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'docker-compose')
+
+
+def read_dockerignore(path, dockerfile=None):
+    """
+    Return the exclude patterns in the `.dockerignore` file of the build
+    context at `path`, or None if there isn't one. The Dockerfile is never
+    excluded.
+    """
+    dockerignore = os.path.join(path, '.dockerignore')
+    if not os.path.exists(dockerignore):
+        return None
+
+    always_included = ALWAYS_INCLUDED + ((dockerfile,) if dockerfile else ())
+    with open(dockerignore, 'r') as f:
+        exclude = [pattern for pattern in f.read().splitlines() if pattern]
+    return [pattern for pattern in exclude if pattern not in always_included]
+
+
+def is_excluded(relpath, exclude):
+    return any(fnmatch(relpath, pattern) for pattern in exclude)
+
+
+def walk_context(path, exclude=None):
+    """
+    Yield the path, relative to `path`, of each file and directory which is
+    sent to the daemon as part of the build context, in a stable order.
+    Files are matched against `exclude` the same way docker-py does.
+    Directories which can't be listed raise an error.
+    """
+    exclude = exclude or []
+
+    def raise_error(error):
+        raise error
+
+    for dirpath, dirnames, filenames in os.walk(path, onerror=raise_error):
+        relpath = os.path.relpath(dirpath, path)
+        if relpath == '.':
+            relpath = ''
+
+        dirnames[:] = sorted(
+            name for name in dirnames
+            if not is_excluded(os.path.join(relpath, name), exclude))
+        filenames = sorted(
+            name for name in filenames
+            if not is_excluded(os.path.join(relpath, name), exclude))
+
+        for name in filenames + dirnames:
+            yield os.path.join(relpath, name)
+
+
+def context_digest(path, dockerfile=None, cache=None):
+    """
+    Return a SHA-256 digest of the build context at `path`: the name, type,
+    permissions and contents of each file which would be sent to the daemon,
+    and the name of the Dockerfile. Digests of file contents are looked up
+    in `cache`, a FileDigestCache, if given.
+    """
+    h = hashlib.sha256()
+    h.update(('dockerfile:%s\n' % (dockerfile or 'Dockerfile')).encode('utf-8'))
+
+    for relpath in walk_context(path, read_dockerignore(path, dockerfile)):
+        filename = os.path.join(path, relpath)
+        st = os.lstat(filename)
+
+        if stat.S_ISLNK(st.st_mode):
+            kind, content = 'l', os.readlink(filename)
+        elif stat.S_ISDIR(st.st_mode):
+            kind, content = 'd', ''
+        elif cache is not None:
+            kind, content = 'f', cache.digest(filename, st)
+        else:
+            kind, content = 'f', file_digest(filename)
+
+        h.update(('%s\0%s\0%o\0%s\n' % (relpath, kind, stat.S_IMODE(st.st_mode), content)).encode('utf-8'))
+
+    return h.hexdigest()
+
+
+def file_digest(filename):
+    h = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(READ_SIZE), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class JsonCache(object):
+    """
+    A dict kept in a JSON file. A missing or unreadable file is treated as
+    empty, and the file is replaced atomically on saving.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.load()
+
+    def load(self):
+        self.data = {}
+        try:
+            with open(self.path, 'r') as f:
+                self.data = json.load(f)
+        except (EnvironmentError, ValueError) as e:
+            log.debug("Not using cache %s: %s", self.path, e)
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            fd, tmp_path = tempfile.mkstemp(dir=directory)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.data, f)
+            os.rename(tmp_path, self.path)
+        except EnvironmentError as e:
+            log.debug("Couldn't save cache %s: %s", self.path, e)
+
+
+class FileDigestCache(JsonCache):
+    """
+    Digests of the files in a build context, keyed on their path and reused
+    while their modification time and size don't change. Only the files
+    looked up since loading are kept on saving.
+    """
+    def __init__(self, path):
+        super(FileDigestCache, self).__init__(path)
+        self.seen = {}
+
+    @classmethod
+    def for_context(cls, context_path):
+        name = hashlib.sha1(context_path.encode('utf-8')).hexdigest()
+        return cls(os.path.join(cache_dir(), 'contexts', name + '.json'))
+
+    def digest(self, filename, st):
+        entry = self.data.get(filename)
+        if entry is None or entry[:2] != [st.st_mtime, st.st_size]:
+            entry = [st.st_mtime, st.st_size, file_digest(filename)]
+        self.seen[filename] = entry
+        return entry[2]
+
+    def save(self):
+        self.data = self.seen
+        super(FileDigestCache, self).save()
+
+
+class BuildCache(JsonCache):
+    """
+    The context digest and ID of the last image built for each tag.
+    """
+    # Serialises updates from services built concurrently
+    lock = threading.Lock()
+
+    def __init__(self, path=None):
+        super(BuildCache, self).__init__(path or os.path.join(cache_dir(), 'builds.json'))
+
+    def get(self, tag, digest):
+        """
+        Return the ID of the image last built for `tag` from a context with
+        `digest`, or None.
+        """
+        entry = self.data.get(tag)
+        if entry and entry.get('digest') == digest:
+            return entry.get('image')
+        return None
+
+    def record(self, tag, digest, image_id):
+        with self.lock:
+            self.load()
+            self.data[tag] = {'digest': digest, 'image': image_id}
+            self.save()
+
+
+def dockerfile_base_image(path, dockerfile=None):
+    """
+    Return the image named by the FROM instruction of the Dockerfile in the
+    build context at `path`, or None if it can't be read.
+    """
+    try:
+        with open(os.path.join(path, dockerfile or 'Dockerfile')) as f:
+            match = FROM_INSTRUCTION.search(f.read())
+    except EnvironmentError as e:
+        log.debug("Can't read the Dockerfile in %s: %s", path, e)
+        return None
+    return match.group(1) if match else None
+
+
+def build_context_digest(path, dockerfile=None):
+    """
+    Return the digest of the build context at `path`, using and updating the
+    cache of file digests for it, or None if it can't be read.
+    """
+    cache = FileDigestCache.for_context(path)
+    try:
+        digest = context_digest(path, dockerfile, cache)
+    except EnvironmentError as e:
+        log.debug("Can't fingerprint build context %s: %s", path, e)
+        return None
+    cache.save()
+    return digest
+
+
+class ContextPacker(object):
+    """
+    Packs the build context at `path` into a tar archive, honouring
+    `.dockerignore`, and yields it in chunks of about CHUNK_SIZE bytes as it
+    goes, so it can be sent to the daemon without being held in memory or
+    written to disk. If `compress` is true, the archive is gzip-compressed.
+
+    Once the archive has been iterated over, `size` is its uncompressed size,
+    `sent` the number of bytes yielded and `elapsed` the seconds it took.
+    """
+    def __init__(self, path, dockerfile=None, compress=False, clock=time.time):
+        self.path = path
+        self.dockerfile = dockerfile
+        self.compress = compress
+        self.clock = clock
+        self.size = 0
+        self.sent = 0
+        self.elapsed = None
+
+    @property
+    def encoding(self):
+        return 'gzip' if self.compress else None
+
+    def __iter__(self):
+        start = self.clock()
+        compressor = None
+        if self.compress:
+            # wbits > 15 gives a gzip header and trailer
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+        for chunk in self._chunks():
+            self.size += len(chunk)
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                self.sent += len(chunk)
+                yield chunk
+
+        if compressor is not None:
+            chunk = compressor.flush()
+            self.sent += len(chunk)
+            yield chunk
+
+        self.elapsed = self.clock() - start
+
+    def _chunks(self):
+        buffered = []
+        buffered_size = 0
+
+        for block in self._blocks():
+            buffered.append(block)
+            buffered_size += len(block)
+            if buffered_size >= CHUNK_SIZE:
+                yield b''.join(buffered)
+                buffered = []
+                buffered_size = 0
+
+        if buffered:
+            yield b''.join(buffered)
+
+    def _blocks(self):
+        """
+        Yield the pieces of the archive: a header for each entry followed by
+        the contents of files padded to a whole block, then the end of
+        archive marker padded to a whole record.
+        """
+        written = 0
+
+        for relpath in walk_context(self.path, read_dockerignore(self.path, self.dockerfile)):
+            filename = os.path.join(self.path, relpath)
+            info = tar_info(filename, relpath)
+            if info is None:
+                continue
+
+            header = info.tobuf(format=tarfile.GNU_FORMAT, encoding='utf-8', errors='strict')
+            written += len(header)
+            yield header
+
+            if info.type == tarfile.REGTYPE:
+                for block in read_padded(filename, info.size):
+                    written += len(block)
+                    yield block
+
+        end = b'\0' * (2 * tarfile.BLOCKSIZE)
+        written += len(end)
+        remainder = written % tarfile.RECORDSIZE
+        if remainder:
+            end += b'\0' * (tarfile.RECORDSIZE - remainder)
+        yield end
+
+
+def tar_info(filename, arcname):
+    """
+    Return a TarInfo for a file, directory or symlink, or None for anything
+    else, which isn't packed.
+    """
+    st = os.lstat(filename)
+    info = tarfile.TarInfo(arcname)
+    info.mode = stat.S_IMODE(st.st_mode)
+    info.mtime = int(st.st_mtime)
+    info.uid = st.st_uid
+    info.gid = st.st_gid
+
+    if stat.S_ISREG(st.st_mode):
+        info.type = tarfile.REGTYPE
+        info.size = st.st_size
+    elif stat.S_ISDIR(st.st_mode):
+        info.type = tarfile.DIRTYPE
+    elif stat.S_ISLNK(st.st_mode):
+        info.type = tarfile.SYMTYPE
+        info.linkname = os.readlink(filename)
+    else:
+        return None
+
+    return info
+
+
+def read_padded(filename, size):
+    """
+    Yield exactly `size` bytes of a file, padded with zeros if it has shrunk
+    since it was measured, then padded to a whole tar block.
+    """
+    remaining = size
+    with open(filename, 'rb') as f:
+        while remaining > 0:
+            block = f.read(min(READ_SIZE, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+
+    padding = remaining + (-size % tarfile.BLOCKSIZE)
+    if padding:
+        yield b'\0' * padding
@@ -0,0 +1,156 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from collections import namedtuple
+import logging
+import shlex
+import sys
+import threading
+
+from docker.errors import APIError
+import six
+from six.moves.queue import Empty, Queue
+
+from .log_printer import ContainerExit, LogLine, TextSink
+from .utils import split_buffer
+
+log = logging.getLogger(__name__)
+
+JobResult = namedtuple('JobResult', 'command container exit_code error')
+
+
+def read_args_file(f):
+    """
+    Read one argument list per line from `f`, split like a shell would.
+    Blank lines and lines starting with `#` are skipped.
+    """
+    args = []
+    for line in f:
+        if isinstance(line, six.binary_type):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        args.append(split_command(line))
+    return args
+
+
+def split_command(command):
+    if six.PY2:
+        # shlex doesn't support unicode input on Python 2
+        return [arg.decode('utf-8') for arg in shlex.split(command.encode('utf-8'))]
+    return shlex.split(command)
+
+
+class BatchRunner(object):
+    """
+    Runs a one-off container of `service` for each of `commands`, at most
+    `parallel` at a time, writing their output to each of `sinks` (see
+    `LogPrinter`) as it arrives. Containers are numbered before any is
+    created, so that jobs running at once don't pick the same number.
+    """
+    def __init__(self,
+                 service,
+                 commands,
+                 container_options,
+                 parallel=1,
+                 sinks=None,
+                 remove=False,
+                 insecure_registry=False):
+        self.service = service
+        self.commands = commands
+        self.container_options = container_options
+        self.parallel = parallel
+        self.sinks = sinks or [TextSink(sys.stdout, [])]
+        self.remove = remove
+        self.insecure_registry = insecure_registry
+        self.lock = threading.Lock()
+
+    def run(self):
+        """
+        Run every command and return a JobResult for each, in the same order.
+        """
+        first_number = self.service._next_container_number(one_off=True)
+        queue = Queue()
+        for index, command in enumerate(self.commands):
+            queue.put((index, command))
+        results = [None] * len(self.commands)
+
+        def work():
+            while True:
+                try:
+                    index, command = queue.get_nowait()
+                except Empty:
+                    return
+                results[index] = self._run_job(command, first_number + index)
+
+        threads = [threading.Thread(target=work) for _ in range(min(self.parallel, len(self.commands)))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            # Join with a timeout so that KeyboardInterrupt is still delivered
+            while thread.is_alive():
+                thread.join(0.1)
+
+        for sink in self.sinks:
+            sink.close()
+
+        return results
+
+    def _run_job(self, command, number):
+        container = None
+        try:
+            container = self.service.create_container(
+                one_off=True,
+                insecure_registry=self.insecure_registry,
+                do_build=False,
+                number=number,
+                command=command,
+                **self.container_options
+            )
+            self.service.start_container(container)
+
+            output = container.attach(stdout=True, stderr=True, stream=True, logs=True)
+            for line in split_buffer(output, '\n'):
+                self._write(LogLine(container, None, line))
+
+            exit_code = container.wait()
+            self._write(ContainerExit(container, exit_code))
+            return JobResult(command, container, exit_code, None)
+        except APIError as e:
+            log.error("Couldn't run %s: %s" % (' '.join(command), e.explanation))
+            return JobResult(command, container, None, e.explanation)
+        except Exception as e:
+            # Any other failure fails this job alone, rather than leaving it
+            # without a result
+            log.error("Couldn't run %s: %s" % (' '.join(command), e))
+            return JobResult(command, container, None, six.text_type(e))
+        finally:
+            if self.remove and container is not None:
+                try:
+                    self.service.client.remove_container(container.id, force=True)
+                except APIError as e:
+                    log.debug("Couldn't remove %s: %s", container.name, e)
+
+    def _write(self, item):
+        with self.lock:
+            for sink in self.sinks:
+                sink.write(item)
+
+
+def summarize(results):
+    """
+    Return a summary of the results of a batch, and the exit code for it:
+    0 if every command succeeded, and 1 otherwise.
+    """
+    failed = [result for result in results if result.exit_code != 0]
+    lines = ["%d of %d commands succeeded" % (len(results) - len(failed), len(results))]
+
+    for result in failed:
+        if result.exit_code is None:
+            outcome = "failed to run: %s" % result.error
+        else:
+            outcome = "exited with code %s" % result.exit_code
+        lines.append("  %s %s" % (' '.join(result.command), outcome))
+
+    return '\n'.join(lines), 1 if failed else 0
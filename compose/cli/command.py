@@ -5,13 +5,17 @@ import logging
 import os
 import re
 import six
+import sys
 
 from .. import config
+from .. import trace
 from ..project import Project
 from ..service import ConfigError
 from .docopt_command import DocoptCommand
 from .utils import call_silently, is_mac, is_ubuntu, find_candidates_in_parent_dirs
 from .docker_client import docker_client
+from .profiling_proxy import ApiProfile, ProfilingProxy, TracingProxy
+from . import metrics
 from . import verbose_proxy
 from . import errors
 from .. import __version__
@@ -29,9 +33,39 @@ SUPPORTED_FILENAMES = [
 class Command(DocoptCommand):
     base_dir = '.'
 
-    def dispatch(self, *args, **kwargs):
+    # Set by `serve` to keep configs and clients loaded between commands
+    config_cache = None
+    client_cache = None
+
+    def dispatch(self, argv, global_options):
+        trace_file = os.environ.get('COMPOSE_TRACE_FILE')
+        metrics_dir = os.environ.get('COMPOSE_METRICS_DIR')
+        if not trace_file and not metrics_dir:
+            self.dispatch_command(argv, global_options)
+            return
+
+        tracer = trace.start()
+        succeeded = False
         try:
-            super(Command, self).dispatch(*args, **kwargs)
+            with trace.span('docker-compose', argv=argv):
+                self.dispatch_command(argv, global_options)
+            succeeded = True
+        except SystemExit as e:
+            succeeded = not e.code
+            raise
+        finally:
+            trace.stop()
+            if trace_file:
+                tracer.write(trace_file)
+            if metrics_dir:
+                try:
+                    metrics.write_textfile(metrics_dir, tracer, succeeded)
+                except EnvironmentError as e:
+                    log.warn("Couldn't write metrics to %s: %s", metrics_dir, e)
+
+    def dispatch_command(self, argv, global_options):
+        try:
+            super(Command, self).dispatch(argv, global_options)
         except SSLError as e:
             raise errors.UserError('SSL error: %s' % e)
         except ConnectionError:
@@ -48,7 +82,9 @@ class Command(DocoptCommand):
                 raise errors.ConnectionErrorGeneric(self.get_client().base_url)
 
     def perform_command(self, options, handler, command_options):
-        if options['COMMAND'] == 'help':
+        trace.tag('command', options['COMMAND'])
+
+        if options['COMMAND'] in ('help', 'serve'):
             # Skip looking up the compose file.
             handler(None, command_options)
             return
@@ -58,33 +94,58 @@ class Command(DocoptCommand):
             log.warn('Please use COMPOSE_FILE instead.')
 
         explicit_config_path = options.get('--file') or os.environ.get('COMPOSE_FILE') or os.environ.get('FIG_FILE')
+        profile = None
+        if options.get('--profile-api') or options.get('--profile-api-file'):
+            profile = ApiProfile()
+
         project = self.get_project(
             self.get_config_path(explicit_config_path),
             project_name=options.get('--project-name'),
-            verbose=options.get('--verbose'))
-
-        handler(project, command_options)
+            verbose=options.get('--verbose'),
+            profile=profile)
 
-    def get_client(self, verbose=False):
-        client = docker_client()
+        try:
+            handler(project, command_options)
+        finally:
+            if profile is not None:
+                profile.report(sys.stderr, options.get('--profile-api-file'))
+
+    def get_client(self, verbose=False, profile=None):
+        if self.client_cache is not None:
+            client = self.client_cache.get()
+        else:
+            client = docker_client()
         if verbose:
             version_info = six.iteritems(client.version())
             log.info("Compose version %s", __version__)
             log.info("Docker base_url: %s", client.base_url)
             log.info("Docker version: %s",
                      ", ".join("%s=%s" % item for item in version_info))
-            return verbose_proxy.VerboseProxy('docker', client)
+            client = verbose_proxy.VerboseProxy('docker', client)
+        if profile is not None:
+            client = ProfilingProxy('docker', client, profile)
+        if trace.enabled():
+            client = TracingProxy('docker', client)
         return client
 
-    def get_project(self, config_path, project_name=None, verbose=False):
+    def get_project(self, config_path, project_name=None, verbose=False, profile=None):
         try:
+            project_name = self.get_project_name(config_path, project_name)
+            trace.tag('project', project_name)
+            with trace.span('load_config'):
+                service_dicts = self.load_config(config_path)
             return Project.from_dicts(
-                self.get_project_name(config_path, project_name),
-                config.load(config_path),
-                self.get_client(verbose=verbose))
+                project_name,
+                service_dicts,
+                self.get_client(verbose=verbose, profile=profile))
         except ConfigError as e:
             raise errors.UserError(six.text_type(e))
 
+    def load_config(self, config_path):
+        if self.config_cache is not None:
+            return self.config_cache.load(config_path)
+        return config.load(config_path)
+
     def get_project_name(self, config_path, project_name=None):
         def normalize_name(name):
             return re.sub(r'[^a-z0-9]', '', name.lower())
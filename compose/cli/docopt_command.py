@@ -1,10 +1,16 @@
 from __future__ import unicode_literals
 from __future__ import absolute_import
+import os
 import sys
 
 from inspect import getdoc
 from docopt import docopt, DocoptExit
 
+from .utils import run_profiled
+
+# Number of functions listed when profiling a command
+PROFILE_TOP = 30
+
 
 def docopt_full_help(docstring, *args, **kwargs):
     try:
@@ -21,7 +27,13 @@ class DocoptCommand(object):
         self.dispatch(sys.argv[1:], None)
 
     def dispatch(self, argv, global_options):
-        self.perform_command(*self.parse(argv, global_options))
+        options, handler, command_options = self.parse(argv, global_options)
+
+        profile_path = options.get('--profile-python') or os.environ.get('COMPOSE_PROFILE_PYTHON')
+        if profile_path and is_profiled(options['COMMAND']):
+            run_profiled(profile_path, PROFILE_TOP, self.perform_command, options, handler, command_options)
+        else:
+            self.perform_command(options, handler, command_options)
 
     def perform_command(self, options, handler, command_options):
         handler(command_options)
@@ -48,6 +60,17 @@ class DocoptCommand(object):
         return options, handler, command_options
 
 
+def is_profiled(command):
+    """
+    Whether a command should be profiled: any command, unless
+    $COMPOSE_PROFILE_PYTHON_COMMANDS lists the commands to profile.
+    """
+    commands = os.environ.get('COMPOSE_PROFILE_PYTHON_COMMANDS')
+    if not commands:
+        return True
+    return command in [c.strip() for c in commands.split(',')]
+
+
 class NoSuchCommand(Exception):
     def __init__(self, command, supercommand):
         super(NoSuchCommand, self).__init__("No such command: %s" % command)
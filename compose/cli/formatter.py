@@ -1,7 +1,6 @@
 from __future__ import unicode_literals
 from __future__ import absolute_import
 import os
-import texttable
 
 
 def get_tty_width():
@@ -14,6 +13,8 @@ def get_tty_width():
 
 class Formatter(object):
     def table(self, headers, rows):
+        import texttable
+
         table = texttable.Texttable(max_width=get_tty_width())
         table.set_cols_dtype(['t' for h in headers])
         table.add_rows([headers] + rows)
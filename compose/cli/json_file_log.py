@@ -0,0 +1,179 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from bisect import bisect_left
+import json
+import logging
+import mmap
+import os
+
+import six
+
+from ..utils import is_local_daemon
+from .utils import normalize_timestamp
+
+log = logging.getLogger(__name__)
+
+# Bytes between two entries of the sparse time index
+INDEX_INTERVAL = 1024 * 1024
+
+
+def read_json_file_log(container, since=None, tail=None, timestamps=False, streams=None):
+    """
+    Return a generator of the lines logged by `container` so far, read
+    directly from its `json-file` log on disk, or None if that isn't possible
+    (remote daemon, other log driver, or the file can't be opened) and the
+    caller should fall back to the API.
+
+    If `timestamps` is true, (timestamp, line) pairs are generated instead.
+    If `streams` is given, only lines written to those streams are read.
+    """
+    if not is_local_daemon(container.client):
+        return None
+
+    log_config = container.log_config or {}
+    if log_config.get('Type', 'json-file') != 'json-file':
+        return None
+
+    path = container.log_path
+    if not path:
+        return None
+
+    try:
+        log_file = JsonFileLog(path)
+    except EnvironmentError as e:
+        log.debug("Can't read %s directly, falling back to the API: %s", path, e)
+        return None
+
+    return log_file.lines(since=since, tail=tail, timestamps=timestamps, streams=streams)
+
+
+class JsonFileLog(object):
+    """
+    A memory-mapped `json-file` container log. Each line of the file is a
+    JSON object with `log`, `stream` and `time` keys.
+    """
+    def __init__(self, path, index_interval=INDEX_INTERVAL):
+        self.path = path
+        self.index_interval = index_interval
+        self.data = None
+
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size > 0:
+                self.data = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+
+    def lines(self, since=None, tail=None, timestamps=False, streams=None):
+        """
+        Yield the `log` field of each entry as a utf-8 encoded string, or a
+        (normalized timestamp, line) pair if `timestamps` is true, then close
+        the file. Entries from streams not in `streams` are skipped.
+        """
+        try:
+            for entry in self.entries(since=since, tail=tail):
+                if streams is not None and entry.get('stream') not in streams:
+                    continue
+                line = entry['log'].encode('utf-8')
+                if timestamps:
+                    yield normalize_timestamp(entry['time']), line
+                else:
+                    yield line
+        finally:
+            self.close()
+
+    def entries(self, since=None, tail=None):
+        """
+        Yield each entry, starting from the first one logged at or after
+        `since` and/or from the last `tail` entries.
+        """
+        if self.data is None:
+            return
+
+        start = 0
+        if since is not None:
+            start = self.offset_since(normalize_timestamp(since))
+        if tail is not None:
+            start = max(start, self.offset_tail(tail))
+
+        for _, line in self._read_lines(start):
+            yield json.loads(line)
+
+    def offset_since(self, since):
+        """
+        Return the offset of the first entry logged at or after `since`,
+        which must be a normalized timestamp. The sparse index narrows the
+        search down to `index_interval` bytes, which are then scanned.
+        """
+        index = self.build_index()
+        position = bisect_left([timestamp for (timestamp, _) in index], since)
+        start = index[position - 1][1] if position > 0 else 0
+
+        for offset, line in self._read_lines(start):
+            if self._timestamp(line) >= since:
+                return offset
+
+        return len(self.data)
+
+    def offset_tail(self, count):
+        """
+        Return the offset of the `count`th entry from the end.
+        """
+        if count <= 0:
+            return len(self.data)
+
+        position = len(self.data)
+        if self.data[position - 1:position] == b'\n':
+            position -= 1
+
+        for _ in range(count):
+            position = self.data.rfind(b'\n', 0, position)
+            if position == -1:
+                return 0
+
+        return position + 1
+
+    def build_index(self):
+        """
+        Return a list of (timestamp, offset) pairs for the first entry
+        starting after each `index_interval` boundary.
+        """
+        index = []
+        offset = 0
+        size = len(self.data)
+
+        while offset < size:
+            end = self.data.find(b'\n', offset)
+            if end == -1:
+                break
+            index.append((self._timestamp(self.data[offset:end]), offset))
+
+            next_offset = self.data.find(b'\n', offset + self.index_interval)
+            if next_offset == -1:
+                break
+            offset = next_offset + 1
+
+        return index
+
+    def _read_lines(self, start):
+        """
+        Yield (offset, line) for each complete line from `start`. A partial
+        last line, still being written by the daemon, is skipped.
+        """
+        offset = start
+        size = len(self.data)
+
+        while offset < size:
+            end = self.data.find(b'\n', offset)
+            if end == -1:
+                break
+            yield offset, self.data[offset:end].decode('utf-8')
+            offset = end + 1
+
+    def _timestamp(self, line):
+        if isinstance(line, six.binary_type):
+            line = line.decode('utf-8')
+        return normalize_timestamp(json.loads(line)['time'])
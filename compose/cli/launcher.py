@@ -0,0 +1,110 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import json
+import logging
+import os
+import socket
+import sys
+
+import six
+
+from ..utils import json_stream
+
+log = logging.getLogger(__name__)
+
+RECV_SIZE = 64 * 1024
+
+# Commands which are run by the server named by $COMPOSE_SERVER, if it's set.
+# Commands which read from stdin or run until interrupted are always run here,
+# as are long ones, since the server runs one command at a time.
+FORWARDED_COMMANDS = ('kill', 'port', 'ps', 'restart', 'scale', 'start', 'stop')
+
+# Top-level options, which come before the command
+OPTIONS_WITH_VALUES = ('-f', '--file', '-p', '--project-name', '--profile-api-file', '--profile-python')
+FLAGS = ('--verbose', '--profile-api')
+
+
+def main():
+    """
+    The `docker-compose` entry point. Commands the compose server runs are
+    sent to it before the rest of the CLI, and the Docker client, have been
+    imported, so that forwarding them stays cheap.
+    """
+    socket_path = os.environ.get('COMPOSE_SERVER')
+    if socket_path and is_forwarded(sys.argv[1:]):
+        exit_code = forward(socket_path, sys.argv[1:])
+        if exit_code is not None:
+            sys.exit(exit_code)
+
+    from .main import main as run_main
+    run_main()
+
+
+def is_forwarded(argv):
+    return command_name(argv) in FORWARDED_COMMANDS
+
+
+def command_name(argv):
+    """
+    Return the command `argv` runs, or None if there's none or the top-level
+    options can't be read without the full CLI.
+    """
+    args = iter(argv)
+    for arg in args:
+        if not arg.startswith('-'):
+            return arg
+        if arg in OPTIONS_WITH_VALUES:
+            next(args, None)
+        elif arg.split('=', 1)[0] not in OPTIONS_WITH_VALUES + FLAGS:
+            return None
+    return None
+
+
+def send_message(conn, message):
+    conn.sendall((json.dumps(message) + '\n').encode('utf-8'))
+
+
+def forward(socket_path, argv, stdout=None, stderr=None):
+    """
+    Run a command on the server listening on `socket_path`, writing its
+    output to `stdout` and `stderr`. Return its exit status, or None if the
+    server can't be reached.
+    """
+    stdout = stdout or sys.stdout
+    stderr = stderr or sys.stderr
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except socket.error as e:
+        log.debug("Not using the compose server at %s: %s", socket_path, e)
+        sock.close()
+        return None
+
+    try:
+        send_message(sock, {
+            'argv': [decode(arg) for arg in argv],
+            'cwd': decode(os.getcwd()),
+            'env': dict((decode(k), decode(v)) for k, v in os.environ.items()),
+        })
+
+        for message in json_stream(iter(lambda: sock.recv(RECV_SIZE), b'')):
+            if 'exit' in message:
+                return message['exit']
+            output = stdout if message['stream'] == 'stdout' else stderr
+            data = message['data']
+            if six.PY2:
+                data = data.encode('utf-8')
+            output.write(data)
+            output.flush()
+    finally:
+        sock.close()
+
+    stderr.write("Lost connection to the compose server\n")
+    return 1
+
+
+def decode(value):
+    if isinstance(value, six.binary_type):
+        return value.decode('utf-8')
+    return value
@@ -1,82 +1,615 @@
 from __future__ import unicode_literals
 from __future__ import absolute_import
+from collections import namedtuple
+import gzip
+import json
+import logging
+import os
+import re
 import sys
+import threading
+import time
 
-from itertools import cycle
+from itertools import chain, cycle
 
-from .multiplexer import Multiplexer, STOP
+import six
+
+from .multiplexer import Multiplexer, STOP, merge_ordered
 from . import colors
-from .utils import split_buffer
+from .json_file_log import read_json_file_log
+from .utils import normalize_timestamp, split_buffer
+
+log = logging.getLogger(__name__)
+
+
+# A line of output from a container. `stream` is 'stdout' or 'stderr', or
+# None when both streams are read together.
+LogLine = namedtuple('LogLine', 'container stream line')
+
+
+ContainerExit = namedtuple('ContainerExit', 'container exit_code')
+
+
+STREAMS = ('stdout', 'stderr')
+
+
+# Seconds between checks for new containers while printing logs
+DISCOVER_INTERVAL = 1
 
 
 class LogPrinter(object):
-    def __init__(self, containers, attach_params=None, output=sys.stdout, monochrome=False):
+    def __init__(self,
+                 containers,
+                 attach_params=None,
+                 output=sys.stdout,
+                 monochrome=False,
+                 direct_read=False,
+                 since=None,
+                 tail=None,
+                 ordered=False,
+                 sinks=None,
+                 line_filter=None,
+                 streams=STREAMS,
+                 rate_limit=None,
+                 discover=None,
+                 discover_interval=DISCOVER_INTERVAL,
+                 states=None):
         self.containers = containers
         self.attach_params = attach_params or {}
-        self.prefix_width = self._calculate_prefix_width(containers)
-        self.generators = self._make_log_generators(monochrome)
-        self.output = output
+        self.direct_read = direct_read
+        self.since = since
+        self.tail = tail
+        self.ordered = ordered
+        self.sinks = sinks or [TextSink(output, containers, monochrome=monochrome)]
+        self.split_streams = any(sink.needs_streams for sink in self.sinks)
+        self.line_filter = line_filter
+        self.streams = streams
+        self.rate_limit = rate_limit
+        self.discover = discover
+        self.discover_interval = discover_interval
+        self.states = states
+        self.live = {}
+        self.stopped = threading.Event()
 
     def run(self):
-        mux = Multiplexer(self.generators)
-        for line in mux.loop():
-            self.output.write(line)
+        try:
+            if self.ordered:
+                self._write_history()
 
-    def _calculate_prefix_width(self, containers):
+            mux = Multiplexer([
+                self._make_log_generator(container)
+                for container in self.containers
+            ])
+            if self.discover is not None:
+                mux.add(self._watch(mux))
+            for item in mux.loop():
+                self._write(item)
+        finally:
+            self.stopped.set()
+            for sink in self.sinks:
+                sink.close()
+
+    def _watch(self, mux):
         """
-        Calculate the maximum width of container names so we can make the log
-        prefixes line up like so:
+        Call `discover` every `discover_interval` seconds and start reading
+        from any container which wasn't there before, such as one created by
+        `scale` or a restart policy. New containers are read from the start.
+        """
+        known = set(container.id for container in self.containers)
 
-        db_1  | Listening
-        web_1 | Listening
+        while not self.stopped.wait(self.discover_interval):
+            for container in self.discover():
+                if container.id in known:
+                    continue
+                known.add(container.id)
+                log.debug("Attaching to %s", container.name)
+                mux.add(self._make_log_generator(container, logs=True))
+
+        # Nothing to yield: the loop above only adds generators to `mux`
+        return
+        yield
+
+    def _write(self, item):
+        for sink in self.sinks:
+            sink.write(item)
+
+    def _streams(self):
         """
-        prefix_width = 0
-        for container in containers:
-            prefix_width = max(prefix_width, len(container.name_without_project))
-        return prefix_width
+        Return (stream, params) for each stream which is read separately,
+        where `params` selects it when attaching.
+        """
+        if self.split_streams or len(self.streams) == 1:
+            return [
+                (stream, dict((name, name == stream) for name in STREAMS))
+                for stream in self.streams
+            ]
+        return [(None, dict((name, True) for name in STREAMS))]
+
+    def _make_log_generator(self, container, **attach_params):
+        generators = [
+            self._make_stream_generator(container, stream, dict(params, **attach_params))
+            for stream, params in self._streams()
+        ]
+        if len(generators) == 1:
+            records = generators[0]
+        else:
+            records = Multiplexer(generators).loop()
+
+        if self.rate_limit:
+            records = rate_limited(records, RateLimiter(self.rate_limit))
+
+        for record in records:
+            yield record
+
+        # A container removed before it could be waited for has no exit code
+        exit_code = self._wait(container)
+        if exit_code is not None:
+            yield ContainerExit(container, exit_code)
+        yield STOP
+
+    def _wait(self, container):
+        """
+        Wait for `container` to exit, from `states` if it's given rather than
+        with a request per container.
+        """
+        if self.states is not None:
+            return self.states.wait(container.id)
+        return container.wait()
 
-    def _make_log_generators(self, monochrome):
-        color_fns = cycle(colors.rainbow())
-        generators = []
+    def _make_stream_generator(self, container, stream, params):
+        for line in self._filter(self._read_lines(container, **params)):
+            yield LogLine(container, stream, line)
 
-        def no_color(text):
-            return text
+    def _filter(self, lines):
+        if self.line_filter is None:
+            return lines
+        return (line for line in lines if self.line_filter.matches(line))
 
+    def _write_history(self):
+        """
+        Write the history of all containers merged in timestamp order. Each
+        stream is followed before its history is read, and what's logged
+        meanwhile is read from there once the history has been written.
+        Histories are streamed, so about one line of each is held at a time.
+        """
+        if self.tail == 0:
+            return
+
+        streams = []
         for container in self.containers:
-            if monochrome:
-                color_fn = no_color
-            else:
-                color_fn = next(color_fns)
-            generators.append(self._make_log_generator(container, color_fn))
+            for stream, params in self._streams():
+                watermark, live = self._follow(container, **params)
+                self.live[(container.id, params['stdout'], params['stderr'])] = live
+                history = watermark.track(self._read_history(container, **params))
+                streams.append(self._timestamped_records(container, stream, history))
 
-        return generators
+        for record in merge_ordered(streams):
+            self._write(record)
 
-    def _make_log_generator(self, container, color_fn):
-        prefix = color_fn(self._generate_prefix(container)).encode('utf-8')
-        # Attach to container before log printer starts running
-        line_generator = split_buffer(self._attach(container), '\n')
+    def _timestamped_records(self, container, stream, history):
+        for timestamp, line in history:
+            if self.line_filter is None or self.line_filter.matches(line):
+                yield timestamp, LogLine(container, stream, line)
 
-        for line in line_generator:
-            yield prefix + line
+    def _read_history(self, container, stdout=True, stderr=True):
+        """
+        Yield (timestamp, line) for each line logged by `container` so far.
+        """
+        if self.direct_read:
+            history = read_json_file_log(
+                container,
+                since=self.since,
+                tail=self.tail,
+                timestamps=True,
+                streams=select_streams(stdout, stderr))
+            if history is not None:
+                return history
 
-        exit_code = container.wait()
-        yield color_fn("%s exited with code %s\n" % (container.name, exit_code))
-        yield STOP
+        lines = read_log_history(container, tail=self.tail, stdout=stdout, stderr=stderr)
+        return skip_until(parse_timestamps(lines), self.since)
+
+    def _follow(self, container, stdout=True, stderr=True):
+        """
+        Start following what `container` logs before its history is read, so
+        that nothing logged in between is lost. Return a watermark to read the
+        history through, and the lines logged after the end of the history.
+        """
+        watermark = Watermark()
+        # The last line logged so far comes first, and is skipped as a
+        # duplicate unless the history is empty.
+        lines = parse_timestamps(split_buffer(container.logs(
+            stdout=stdout,
+            stderr=stderr,
+            stream=True,
+            timestamps=True,
+            tail=1,
+        ), '\n'))
+        live = watermark.after(skip_until(lines, self.since))
+        return watermark, (line for _, line in live)
+
+    def _read_lines(self, container, stdout=True, stderr=True, logs=None):
+        if logs:
+            return split_buffer(self._attach(container, logs=True, stdout=stdout, stderr=stderr), '\n')
+
+        if self.tail == 0:
+            # No history at all. It can't be asked for from the API, which
+            # reads a tail of 0 as the whole history.
+            return split_buffer(self._attach(container, logs=False, stdout=stdout, stderr=stderr), '\n')
+
+        if self.ordered:
+            return self.live.pop((container.id, stdout, stderr))
+
+        if self.direct_read:
+            watermark, live = self._follow(container, stdout=stdout, stderr=stderr)
+            history = read_json_file_log(
+                container,
+                since=self.since,
+                tail=self.tail,
+                timestamps=True,
+                streams=select_streams(stdout, stderr))
+            if history is not None:
+                return chain((line for _, line in watermark.track(history)), live)
+
+        if self.since is not None or self.tail is not None:
+            return self._follow_logs(container, stdout=stdout, stderr=stderr)
+
+        return split_buffer(self._attach(container, stdout=stdout, stderr=stderr), '\n')
 
-    def _generate_prefix(self, container):
+    def _follow_logs(self, container, stdout=True, stderr=True):
         """
-        Generate the prefix for a log line without colour
+        Read history through the logs endpoint, which supports `tail`, then
+        keep following. `since` isn't supported by the API version we use,
+        so older lines are skipped by their timestamp.
         """
-        name = container.name_without_project
-        padding = ' ' * (self.prefix_width - len(name))
-        return ''.join([name, padding, ' | '])
+        lines = split_buffer(container.logs(
+            stdout=stdout,
+            stderr=stderr,
+            stream=True,
+            timestamps=self.since is not None,
+            tail=self.tail if self.tail is not None else 'all',
+        ), '\n')
 
-    def _attach(self, container):
+        if self.since is None:
+            for line in lines:
+                yield line
+            return
+
+        for _, line in skip_until(parse_timestamps(lines), self.since):
+            yield line
+
+    def _attach(self, container, **override_params):
         params = {
             'stdout': True,
             'stderr': True,
             'stream': True,
         }
         params.update(self.attach_params)
+        params.update(override_params)
         params = dict((name, 1 if value else 0) for (name, value) in list(params.items()))
         return container.attach(**params)
+
+
+class Watermark(object):
+    """
+    The timestamp of the last line read from the history of a stream, up to
+    which lines followed from the same stream are skipped.
+    """
+    def __init__(self):
+        self.timestamp = None
+
+    def track(self, timestamped_lines):
+        for timestamp, line in timestamped_lines:
+            self.timestamp = timestamp
+            yield timestamp, line
+
+    def after(self, timestamped_lines):
+        for timestamp, line in timestamped_lines:
+            if self.timestamp is None or timestamp > self.timestamp:
+                yield timestamp, line
+
+
+class LineFilter(object):
+    """
+    Select lines which match `include` and don't match `exclude`. The
+    patterns are compiled once and matched against the raw bytes of each
+    line, before it's decoded or formatted.
+    """
+    def __init__(self, include=None, exclude=None):
+        self.include = compile_bytes_pattern(include)
+        self.exclude = compile_bytes_pattern(exclude)
+
+    def matches(self, line):
+        if self.include is not None and not self.include.search(line):
+            return False
+        if self.exclude is not None and self.exclude.search(line):
+            return False
+        return True
+
+
+class RateLimiter(object):
+    """
+    A token bucket which allows up to `rate` lines per second, with bursts
+    of up to `rate` lines.
+    """
+    def __init__(self, rate, clock=time.time):
+        self.rate = rate
+        self.clock = clock
+        self.allowance = rate
+        self.last_check = clock()
+
+    def allow(self):
+        now = self.clock()
+        self.allowance = min(self.rate, self.allowance + (now - self.last_check) * self.rate)
+        self.last_check = now
+
+        if self.allowance < 1:
+            return False
+
+        self.allowance -= 1
+        return True
+
+
+class TextSink(object):
+    """
+    Write each line prefixed with the name of its container, in the
+    container's colour.
+    """
+    needs_streams = False
+
+    def __init__(self, output, containers, monochrome=False):
+        self.output = output
+        self.monochrome = monochrome
+        self.prefix_width = self._calculate_prefix_width(containers)
+        self.color_fns = cycle(colors.rainbow())
+        self.prefixes = {}
+
+        for container in containers:
+            self._get_prefix(container)
+
+    def write(self, item):
+        prefix, color_fn = self._get_prefix(item.container)
+        if isinstance(item, ContainerExit):
+            self.output.write(color_fn("%s exited with code %s\n" % (item.container.name, item.exit_code)))
+        else:
+            self.output.write(prefix + item.line)
+
+    def close(self):
+        pass
+
+    def _calculate_prefix_width(self, containers):
+        """
+        Calculate the maximum width of container names so we can make the log
+        prefixes line up like so:
+
+        db_1  | Listening
+        web_1 | Listening
+        """
+        prefix_width = 0
+        for container in containers:
+            prefix_width = max(prefix_width, len(container.name_without_project))
+        return prefix_width
+
+    def _get_prefix(self, container):
+        if container not in self.prefixes:
+            if self.monochrome:
+                color_fn = no_color
+            else:
+                color_fn = next(self.color_fns)
+            prefix = color_fn(generate_prefix(container, self.prefix_width)).encode('utf-8')
+            self.prefixes[container] = (prefix, color_fn)
+
+        return self.prefixes[container]
+
+
+class JsonSink(object):
+    """
+    Write one JSON object per line, with the container, service, number and
+    stream of each line of output.
+    """
+    needs_streams = True
+
+    def __init__(self, output):
+        self.output = output
+
+    def write(self, item):
+        self.output.write(format_json(item))
+
+    def close(self):
+        pass
+
+
+class FileSink(object):
+    """
+    Write the output of each service, or each container if `per_container`
+    is set, to its own file in `directory`. Files can be rotated by size or
+    age, and gzip-compressed as they're written.
+    """
+    def __init__(self,
+                 directory,
+                 per_container=False,
+                 as_json=False,
+                 rotate_size=None,
+                 rotate_interval=None,
+                 compress=False):
+        self.directory = directory
+        self.per_container = per_container
+        self.as_json = as_json
+        self.rotate_size = rotate_size
+        self.rotate_interval = rotate_interval
+        self.compress = compress
+        self.needs_streams = as_json
+        self.files = {}
+
+    def write(self, item):
+        container = item.container
+        name = container.name_without_project if self.per_container else container.service
+
+        if name not in self.files:
+            self.files[name] = RotatingFile(
+                os.path.join(self.directory, '%s.log' % name),
+                max_size=self.rotate_size,
+                max_age=self.rotate_interval,
+                compress=self.compress)
+
+        self.files[name].write(self._format(item))
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+    def _format(self, item):
+        if self.as_json:
+            return format_json(item)
+
+        if isinstance(item, ContainerExit):
+            return "%s exited with code %s\n" % (item.container.name, item.exit_code)
+
+        if self.per_container:
+            return item.line
+
+        return generate_prefix(item.container, 0).encode('utf-8') + item.line
+
+
+class RotatingFile(object):
+    """
+    A file which is moved aside to `path.1`, `path.2`, etc. once `max_size`
+    bytes have been written to it or it has been open for `max_age` seconds.
+    """
+    def __init__(self, path, max_size=None, max_age=None, compress=False):
+        self.path = path + '.gz' if compress else path
+        self.max_size = max_size
+        self.max_age = max_age
+        self.compress = compress
+        self._open()
+
+    def write(self, data):
+        if isinstance(data, six.text_type):
+            data = data.encode('utf-8')
+
+        if self._should_rotate():
+            self.rotate()
+
+        self.file.write(data)
+        self.size += len(data)
+
+    def close(self):
+        self.file.close()
+
+    def rotate(self):
+        self.file.close()
+        os.rename(self.path, self._next_rotated_path())
+        self._open()
+
+    def _open(self):
+        if self.compress:
+            self.file = gzip.open(self.path, 'ab')
+        else:
+            self.file = open(self.path, 'ab')
+        self.size = 0
+        self.opened_at = time.time()
+
+    def _should_rotate(self):
+        if self.max_size and self.size >= self.max_size:
+            return True
+        if self.max_age and time.time() - self.opened_at >= self.max_age:
+            return True
+        return False
+
+    def _next_rotated_path(self):
+        base, ext = self.path, ''
+        if self.compress:
+            base, ext = self.path[:-len('.gz')], '.gz'
+
+        number = 1
+        while os.path.exists('%s.%d%s' % (base, number, ext)):
+            number += 1
+        return '%s.%d%s' % (base, number, ext)
+
+
+def no_color(text):
+    return text
+
+
+def generate_prefix(container, prefix_width):
+    """
+    Generate the prefix for a log line without colour
+    """
+    name = container.name_without_project
+    padding = ' ' * (prefix_width - len(name))
+    return ''.join([name, padding, ' | '])
+
+
+def format_json(item):
+    container = item.container
+    record = {
+        'container': container.name,
+        'service': container.service,
+        'number': container.number,
+    }
+    if isinstance(item, ContainerExit):
+        record['exit_code'] = item.exit_code
+    else:
+        record['stream'] = item.stream
+        record['log'] = item.line.decode('utf-8', 'replace')
+    return json.dumps(record) + '\n'
+
+
+def compile_bytes_pattern(pattern):
+    if pattern is None:
+        return None
+    if isinstance(pattern, six.text_type):
+        pattern = pattern.encode('utf-8')
+    return re.compile(pattern)
+
+
+def rate_limited(records, limiter):
+    for record in records:
+        if limiter.allow():
+            yield record
+
+
+def select_streams(stdout, stderr):
+    return tuple(
+        name for (name, selected) in zip(STREAMS, (stdout, stderr))
+        if selected)
+
+
+def read_log_history(container, tail=None, stdout=True, stderr=True):
+    """
+    Yield the lines logged by `container` so far, each prefixed with its
+    timestamp. The history is streamed, and only requested once the first
+    line is needed.
+    """
+    history = container.logs(
+        stdout=stdout,
+        stderr=stderr,
+        stream=True,
+        follow=False,
+        timestamps=True,
+        tail=tail if tail is not None else 'all')
+    for line in split_buffer(history, '\n'):
+        yield line
+
+
+def parse_timestamps(lines):
+    """
+    Split each line from the logs endpoint into (timestamp, line), with the
+    timestamp normalized so that it sorts chronologically.
+    """
+    for line in lines:
+        timestamp, _, line = line.partition(b' ')
+        yield normalize_timestamp(timestamp), line
+
+
+def skip_until(timestamped_lines, since):
+    """
+    Drop (timestamp, line) pairs logged before `since`.
+    """
+    if since is not None:
+        since = normalize_timestamp(since)
+
+    for timestamp, line in timestamped_lines:
+        if since is not None and timestamp < since:
+            continue
+        since = None
+        yield timestamp, line
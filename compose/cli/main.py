@@ -2,34 +2,51 @@ from __future__ import print_function
 from __future__ import unicode_literals
 from inspect import getdoc
 from operator import attrgetter
+import json
 import logging
+import os
 import re
 import signal
 import sys
 
 from docker.errors import APIError
-import dockerpty
+from docopt import docopt, DocoptExit
+import six
 
 from .. import __version__
 from .. import migration
+from .. import trace
+from ..image_cache import DEFAULT_MAX_SIZE, ImageCache
+from ..pool import ContainerPool
+from ..progress_stream import build_progress
 from ..project import NoSuchService, ConfigurationError
 from ..service import BuildError, CannotBeScaledError, NeedsBuildError
+from ..state import ContainerStates
 from ..config import parse_environment
 from .command import Command
 from .docopt_command import NoSuchCommand
 from .errors import UserError
 from .formatter import Formatter
-from .log_printer import LogPrinter
-from .utils import yesno
+from .batch import BatchRunner, read_args_file, split_command, summarize
+from .log_printer import FileSink, JsonSink, LineFilter, LogPrinter, STREAMS, TextSink
+from .launcher import FORWARDED_COMMANDS
+from .server import ClientCache, ComposeServer, ConfigCache, default_socket_path
+from .timings import format_timings, service_timings
+from .utils import normalize_timestamp, yesno
 
 log = logging.getLogger(__name__)
 
+PROGRESS_MODES = ('json', 'quiet', 'plain')
+
 
 def main():
     setup_logging()
+    run_command(TopLevelCommand(), sys.argv[1:])
+
+
+def run_command(command, argv):
     try:
-        command = TopLevelCommand()
-        command.sys_dispatch()
+        command.dispatch(argv, None)
     except KeyboardInterrupt:
         log.error("\nAborting.")
         sys.exit(1)
@@ -64,6 +81,14 @@ def setup_logging():
     logging.getLogger("requests").propagate = False
 
 
+def is_forwarded(argv):
+    try:
+        options = docopt(getdoc(TopLevelCommand), argv, options_first=True, help=False)
+    except DocoptExit:
+        return False
+    return options['COMMAND'] in FORWARDED_COMMANDS
+
+
 # stolen from docopt master
 def parse_doc_section(name, source):
     pattern = re.compile('^([^\n]*' + name + '[^\n]*\n?(?:[ \t].*?(?:\n|$))*)',
@@ -82,6 +107,9 @@ class TopLevelCommand(Command):
       -f, --file FILE           Specify an alternate compose file (default: docker-compose.yml)
       -p, --project-name NAME   Specify an alternate project name (default: directory name)
       --verbose                 Show more output
+      --profile-api             Print how long calls to the Docker API took
+      --profile-api-file FILE   Also write a record of each call to FILE
+      --profile-python FILE     Profile compose itself and write the stats to FILE
       -v, --version             Print version and exit
 
     Commands:
@@ -96,6 +124,7 @@ class TopLevelCommand(Command):
       rm                 Remove stopped containers
       run                Run a one-off command
       scale              Set number of containers for a service
+      serve              Run commands for other docker-compose processes
       start              Start services
       stop               Stop services
       up                 Create and start containers
@@ -118,10 +147,31 @@ class TopLevelCommand(Command):
         Usage: build [options] [SERVICE...]
 
         Options:
-            --no-cache  Do not use cache when building the image.
+            --no-cache         Do not use cache when building the image.
+            --pull             Build even if the build directory hasn't
+                               changed, pulling a newer base image if there
+                               is one.
+            --parallel         Build the images concurrently.
+            --layers           With --parallel, show each layer's progress.
+            --progress MODE    Show progress as json, plain text or not at
+                               all (quiet).
+            --build-cache DIR  Load images built from the same context
+                               from DIR, and save built images to it.
         """
         no_cache = bool(options.get('--no-cache', False))
-        project.build(service_names=options['SERVICE'], no_cache=no_cache)
+        progress = build_progress_board(options)
+        try:
+            project.build(
+                service_names=options['SERVICE'],
+                no_cache=no_cache,
+                pull=options.get('--pull', False),
+                parallel=options['--parallel'],
+                progress=progress,
+                build_cache=build_image_cache(options),
+            )
+        finally:
+            if progress is not None:
+                progress.close()
 
     def help(self, project, options):
         """
@@ -155,13 +205,64 @@ class TopLevelCommand(Command):
         Usage: logs [options] [SERVICE...]
 
         Options:
-            --no-color  Produce monochrome output.
+            --no-color              Produce monochrome output.
+            --direct                Read the history of containers using the
+                                    json-file log driver straight from disk
+                                    when the daemon is local, instead of
+                                    through the API.
+            --since TIME            Only show output logged since TIME
+                                    (RFC 3339 in UTC or a unix timestamp).
+            --tail N                Only show the last N lines of each
+                                    container's history.
+            --ordered               Print the history of all containers merged
+                                    in timestamp order before following live
+                                    output.
+            --json                  Write one JSON object per line of output.
+            --output-dir DIR        Write the output of each service to
+                                    DIR/SERVICE.log instead of the terminal.
+            --per-container         With --output-dir, write one file per
+                                    container instead of per service.
+            --rotate-size SIZE      With --output-dir, rotate files once SIZE
+                                    bytes have been written (e.g. 100M).
+            --rotate-interval SECS  With --output-dir, rotate files every
+                                    SECS seconds.
+            --gzip                  With --output-dir, gzip-compress files as
+                                    they are written.
+            --grep REGEX            Only show lines matching REGEX.
+            --exclude REGEX         Don't show lines matching REGEX.
+            --stream STREAM         Only show lines written to STREAM
+                                    (stdout or stderr).
+            --rate-limit N          Show at most N lines per second from each
+                                    container, dropping the rest.
         """
+        # Check the options before attaching to anything
+        sinks = build_log_sinks(options)
+        filters = build_log_filters(options)
+        since = parse_since(options['--since'])
+        tail = parse_tail(options['--tail'])
+
         containers = project.containers(service_names=options['SERVICE'], stopped=True)
 
         monochrome = options['--no-color']
-        print("Attaching to", list_containers(containers))
-        LogPrinter(containers, attach_params={'logs': True}, monochrome=monochrome).run()
+        if not options['--json']:
+            print("Attaching to", list_containers(containers))
+        states = ContainerStates(project.client, project.name).start()
+        try:
+            LogPrinter(
+                containers,
+                attach_params={'logs': True},
+                monochrome=monochrome,
+                sinks=sinks,
+                direct_read=options['--direct'],
+                since=since,
+                tail=tail,
+                ordered=options['--ordered'],
+                discover=lambda: states.containers(service_names=options['SERVICE']),
+                states=states,
+                **filters
+            ).run()
+        finally:
+            states.stop()
 
     def port(self, project, options):
         """
@@ -229,12 +330,24 @@ class TopLevelCommand(Command):
         Options:
             --allow-insecure-ssl    Allow insecure connections to the docker
                                     registry
+            --parallel              Pull the images concurrently.
+            --layers                With --parallel, show each layer's
+                                    progress.
+            --progress MODE         Show progress as json, plain text or not
+                                    at all (quiet).
         """
         insecure_registry = options['--allow-insecure-ssl']
-        project.pull(
-            service_names=options['SERVICE'],
-            insecure_registry=insecure_registry
-        )
+        progress = build_progress_board(options)
+        try:
+            project.pull(
+                service_names=options['SERVICE'],
+                insecure_registry=insecure_registry,
+                parallel=options['--parallel'],
+                progress=progress,
+            )
+        finally:
+            if progress is not None:
+                progress.close()
 
     def rm(self, project, options):
         """
@@ -288,6 +401,14 @@ class TopLevelCommand(Command):
                                   to the host.
             -T                    Disable pseudo-tty allocation. By default `docker-compose run`
                                   allocates a TTY.
+            --pool N              Keep N containers created ahead of time for
+                                  runs with the same options, and start one of
+                                  them instead of creating a container.
+            --args-file FILE      Run the command once for each line of FILE
+                                  (or stdin, if FILE is "-"), with the line's
+                                  arguments appended, and print a summary.
+            --parallel N          With --args-file, run up to N containers at
+                                  once [default: 1].
         """
         service = project.get_service(options['SERVICE'])
 
@@ -335,22 +456,42 @@ class TopLevelCommand(Command):
         if not options['--service-ports']:
             container_options['ports'] = []
 
-        container = service.create_container(
-            one_off=True,
-            insecure_registry=insecure_registry,
-            **container_options
-        )
+        if options.get('--args-file'):
+            run_batch(service, command, container_options, options)
+
+        pool = None
+        container = None
+        pool_size = parse_number('--pool', options.get('--pool') or os.environ.get('COMPOSE_RUN_POOL'))
+        if pool_size:
+            # The pool is keyed on the service's config hash, which needs the image
+            service.ensure_image_exists(insecure_registry=insecure_registry)
+            pool = ContainerPool(service, pool_size, container_options)
+            container = pool.take()
+            pool.refill_in_background()
+
+        if container is None:
+            container = service.create_container(
+                one_off=True,
+                insecure_registry=insecure_registry,
+                **container_options
+            )
 
-        if options['-d']:
-            service.start_container(container)
-            print(container.name)
-        else:
-            dockerpty.start(project.client, container.id, interactive=not options['-T'])
-            exit_code = container.wait()
-            if options['--rm']:
-                log.info("Removing %s..." % container.name)
-                project.client.remove_container(container.id)
-            sys.exit(exit_code)
+        try:
+            if options['-d']:
+                service.start_container(container)
+                print(container.name)
+            else:
+                # Only run needs dockerpty, so it isn't imported at startup
+                import dockerpty
+                dockerpty.start(project.client, container.id, interactive=not options['-T'])
+                exit_code = container.wait()
+                if options['--rm']:
+                    log.info("Removing %s..." % container.name)
+                    project.client.remove_container(container.id)
+                sys.exit(exit_code)
+        finally:
+            if pool is not None:
+                pool.wait()
 
     def scale(self, project, options):
         """
@@ -382,6 +523,33 @@ class TopLevelCommand(Command):
                     'port definition in docker-compose.yml so Docker can choose a random '
                     'port for each container.' % service_name)
 
+    def serve(self, project, options):
+        """
+        Keep configs and Docker connections loaded, and run the commands of
+        docker-compose processes started with COMPOSE_SERVER set to the
+        socket this listens on, so that they start faster.
+
+        Only kill, port, ps, restart, scale, start and stop are sent to the
+        server. Commands are run one at a time.
+
+        Usage: serve [options]
+
+        Options:
+            --socket PATH  Listen on this unix socket (default: $COMPOSE_SERVER,
+                           or server.sock in the cache directory).
+        """
+        socket_path = options['--socket'] or os.environ.get('COMPOSE_SERVER') or default_socket_path()
+
+        def run(argv):
+            if not is_forwarded(argv):
+                log.error("The compose server doesn't run: %s", " ".join(argv))
+                sys.exit(1)
+            run_command(self, argv)
+
+        self.config_cache = ConfigCache()
+        self.client_cache = ClientCache()
+        ComposeServer(socket_path, run).serve_forever()
+
     def start(self, project, options):
         """
         Start existing containers.
@@ -437,18 +605,48 @@ class TopLevelCommand(Command):
         Usage: up [options] [SERVICE...]
 
         Options:
-            --allow-insecure-ssl   Allow insecure connections to the docker
-                                   registry
-            -d                     Detached mode: Run containers in the background,
-                                   print new container names.
-            --no-color             Produce monochrome output.
-            --no-deps              Don't start linked services.
-            --x-smart-recreate     Only recreate containers whose configuration or
-                                   image needs to be updated. (EXPERIMENTAL)
-            --no-recreate          If containers already exist, don't recreate them.
-            --no-build             Don't build an image, even if it's missing
-            -t, --timeout TIMEOUT  When attached, use this timeout in seconds
-                                   for the shutdown. (default: 10)
+            --allow-insecure-ssl    Allow insecure connections to the docker
+                                    registry
+            -d                      Detached mode: Run containers in the background,
+                                    print new container names.
+            --no-color              Produce monochrome output.
+            --no-deps               Don't start linked services.
+            --x-smart-recreate      Only recreate containers whose configuration or
+                                    image needs to be updated. (EXPERIMENTAL)
+            --no-recreate           If containers already exist, don't recreate them.
+            --no-build              Don't build an image, even if it's missing
+            -t, --timeout TIMEOUT   When attached, use this timeout in seconds
+                                    for the shutdown. (default: 10)
+            --json                  When attached, write one JSON object per
+                                    line of output.
+            --output-dir DIR        When attached, write the output of each
+                                    service to DIR/SERVICE.log instead of the
+                                    terminal.
+            --per-container         With --output-dir, write one file per
+                                    container instead of per service.
+            --rotate-size SIZE      With --output-dir, rotate files once SIZE
+                                    bytes have been written (e.g. 100M).
+            --rotate-interval SECS  With --output-dir, rotate files every
+                                    SECS seconds.
+            --gzip                  With --output-dir, gzip-compress files as
+                                    they are written.
+            --grep REGEX            When attached, only show lines matching
+                                    REGEX.
+            --exclude REGEX         When attached, don't show lines matching
+                                    REGEX.
+            --stream STREAM         When attached, only show lines written to
+                                    STREAM (stdout or stderr).
+            --rate-limit N          When attached, show at most N lines per
+                                    second from each container.
+            --progress MODE         Show the progress of pulls and builds as
+                                    json, plain text or not at all (quiet).
+            --build-cache DIR       Load images built from the same context
+                                    from DIR, and save built images to it.
+            --timings               Print how long each service spent pulling
+                                    or building its image, creating, starting
+                                    and stopping containers.
+            --timings-file FILE     Write the timings of each service to FILE
+                                    as JSON.
 
         """
         insecure_registry = options['--allow-insecure-ssl']
@@ -460,25 +658,54 @@ class TopLevelCommand(Command):
         allow_recreate = not options['--no-recreate']
         smart_recreate = options['--x-smart-recreate']
         service_names = options['SERVICE']
+        # Check the output options before anything is started
+        sinks = None if detached else build_log_sinks(options)
+        filters = {} if detached else build_log_filters(options)
+        progress = build_progress_board(options)
+
+        def converge():
+            try:
+                project.up(
+                    service_names=service_names,
+                    start_deps=start_deps,
+                    allow_recreate=allow_recreate,
+                    smart_recreate=smart_recreate,
+                    insecure_registry=insecure_registry,
+                    do_build=not options['--no-build'],
+                    progress=progress,
+                    build_cache=build_image_cache(options),
+                )
+            finally:
+                if progress is not None:
+                    progress.close()
 
-        project.up(
-            service_names=service_names,
-            start_deps=start_deps,
-            allow_recreate=allow_recreate,
-            smart_recreate=smart_recreate,
-            insecure_registry=insecure_registry,
-            do_build=not options['--no-build'],
-        )
+        if options.get('--timings') or options.get('--timings-file'):
+            with trace.recording() as tracer:
+                converge()
+            report_timings(service_timings(tracer), options)
+        else:
+            converge()
 
         to_attach = [c for s in project.get_services(service_names) for c in s.containers()]
 
         if not detached:
-            print("Attaching to", list_containers(to_attach))
-            log_printer = LogPrinter(to_attach, attach_params={"logs": True}, monochrome=monochrome)
+            if not options['--json']:
+                print("Attaching to", list_containers(to_attach))
+            states = ContainerStates(project.client, project.name).start()
+            log_printer = LogPrinter(
+                to_attach,
+                attach_params={"logs": True},
+                monochrome=monochrome,
+                sinks=sinks,
+                discover=lambda: states.containers(service_names=service_names),
+                states=states,
+                **filters)
 
             try:
                 log_printer.run()
             finally:
+                states.stop()
+
                 def handler(signal, frame):
                     project.kill(service_names=service_names)
                     sys.exit(0)
@@ -500,3 +727,176 @@ class TopLevelCommand(Command):
 
 def list_containers(containers):
     return ", ".join(c.name for c in containers)
+
+
+def build_progress_board(options):
+    """
+    Return the ProgressBoard given by the `--progress` option, or by
+    `--parallel` for concurrent pulls or builds, or None for the default
+    output.
+    """
+    mode = options.get('--progress')
+    if mode is None:
+        if not options.get('--parallel'):
+            return None
+        mode = 'tty'
+    elif mode not in PROGRESS_MODES:
+        raise UserError('--progress should be one of %s, not "%s"' % (', '.join(PROGRESS_MODES), mode))
+
+    return build_progress(mode, sys.stdout, detail=options.get('--layers', False))
+
+
+def report_timings(timings, options):
+    """
+    Print the timings of each service converged by `up`, and write them to
+    the file given by `--timings-file` as JSON.
+    """
+    if options.get('--timings'):
+        sys.stderr.write(format_timings(timings) + '\n')
+
+    if options.get('--timings-file'):
+        with open(options['--timings-file'], 'w') as f:
+            json.dump(timings, f, indent=2)
+
+
+def build_image_cache(options):
+    """
+    Return the ImageCache in the directory given by `--build-cache` or
+    $COMPOSE_BUILD_CACHE, or None.
+    """
+    directory = options.get('--build-cache') or os.environ.get('COMPOSE_BUILD_CACHE')
+    if not directory:
+        return None
+
+    max_size = parse_size('COMPOSE_BUILD_CACHE_SIZE', os.environ.get('COMPOSE_BUILD_CACHE_SIZE'))
+    return ImageCache(directory, max_size=max_size or DEFAULT_MAX_SIZE)
+
+
+def build_log_sinks(options):
+    """
+    Return the sinks for a LogPrinter from the `logs` and `up` options, or
+    None to print to the terminal.
+    """
+    if options['--output-dir']:
+        directory = options['--output-dir']
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError as e:
+                raise UserError('Couldn\'t create --output-dir "%s": %s' % (directory, e.strerror))
+        if not os.access(directory, os.W_OK | os.X_OK):
+            raise UserError('--output-dir "%s" is not writable' % directory)
+        return [FileSink(
+            directory,
+            per_container=options['--per-container'],
+            as_json=options['--json'],
+            rotate_size=parse_size('--rotate-size', options['--rotate-size']),
+            rotate_interval=parse_number('--rotate-interval', options['--rotate-interval']),
+            compress=options['--gzip'],
+        )]
+
+    if options['--json']:
+        return [JsonSink(sys.stdout)]
+
+    return None
+
+
+def build_log_filters(options):
+    """
+    Return the LogPrinter arguments which select lines to show from the
+    `logs` and `up` options.
+    """
+    filters = {}
+
+    if options['--grep'] or options['--exclude']:
+        try:
+            filters['line_filter'] = LineFilter(
+                include=options['--grep'],
+                exclude=options['--exclude'])
+        except re.error as e:
+            raise UserError('Invalid regular expression: %s' % e)
+
+    stream = options['--stream']
+    if stream is not None:
+        if stream not in STREAMS:
+            raise UserError('--stream should be one of %s, not "%s"' % (", ".join(STREAMS), stream))
+        filters['streams'] = (stream,)
+
+    filters['rate_limit'] = parse_number('--rate-limit', options['--rate-limit'])
+
+    return filters
+
+
+def parse_size(option, value):
+    if value is None:
+        return None
+
+    units = {'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+    multiplier = units.get(value[-1:].lower())
+    if multiplier:
+        value = value[:-1]
+    return parse_number(option, value) * (multiplier or 1)
+
+
+def run_batch(service, command, container_options, options):
+    if options['-d']:
+        raise UserError("--args-file can't be used in detached mode")
+
+    parallel = parse_number('--parallel', options['--parallel'])
+    if parallel < 1:
+        raise UserError("--parallel must be at least 1")
+
+    if options['--args-file'] == '-':
+        args = read_args_file(sys.stdin)
+    else:
+        try:
+            with open(options['--args-file']) as f:
+                args = read_args_file(f)
+        except IOError as e:
+            raise UserError("Couldn't read %s: %s" % (options['--args-file'], e.strerror))
+
+    if isinstance(command, six.string_types):
+        command = split_command(command)
+    command = command or []
+
+    container_options = dict(container_options, tty=False, stdin_open=False)
+    del container_options['command']
+    del container_options['detach']
+
+    runner = BatchRunner(
+        service,
+        [command + line for line in args],
+        container_options,
+        parallel=parallel,
+        sinks=[TextSink(sys.stdout, [])],
+        remove=options['--rm'],
+        insecure_registry=options['--allow-insecure-ssl'],
+    )
+    summary, exit_code = summarize(runner.run())
+    print(summary)
+    sys.exit(exit_code)
+
+
+def parse_number(option, value):
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise UserError('%s should be a number, not "%s"' % (option, value))
+
+
+def parse_since(value):
+    if value is None:
+        return None
+    try:
+        return normalize_timestamp(value)
+    except ValueError:
+        raise UserError('--since should be an RFC 3339 timestamp or a unix timestamp, not "%s"' % value)
+
+
+def parse_tail(value):
+    tail = parse_number('--tail', value)
+    if tail is not None and tail < 0:
+        raise UserError('--tail should be 0 or more, not "%s"' % value)
+    return tail
@@ -0,0 +1,158 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from collections import OrderedDict
+import os
+import tempfile
+import time
+
+from .timings import exclusive_duration, within
+
+# Upper bounds of the buckets of the API request latency histogram, in seconds
+API_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# The category and name of the spans which make up each phase of a command
+PHASES = OrderedDict([
+    ('config_load', ('compose', 'load_config')),
+    ('plan', ('service', 'convergence_plan')),
+    ('pull', ('service', 'pull')),
+    ('build', ('service', 'build')),
+    ('create', ('service', 'create_container')),
+    ('start', ('service', 'start_container')),
+])
+
+
+class MetricsWriter(object):
+    """
+    Formats metrics in the Prometheus text exposition format.
+    """
+    def __init__(self, labels):
+        self.labels = labels
+        self.lines = []
+
+    def metric(self, name, kind, help_text):
+        self.lines.append('# HELP %s %s' % (name, help_text))
+        self.lines.append('# TYPE %s %s' % (name, kind))
+
+    def sample(self, name, value, **extra_labels):
+        labels = OrderedDict(self.labels)
+        labels.update(sorted(extra_labels.items()))
+        self.lines.append('%s{%s} %s' % (name, format_labels(labels), format_value(value)))
+
+    def text(self):
+        return '\n'.join(self.lines) + '\n'
+
+
+def format_labels(labels):
+    return ','.join('%s="%s"' % (name, escape(value)) for name, value in labels.items())
+
+
+def escape(value):
+    return ('%s' % value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return '%s' % value
+
+
+def command_metrics(tracer, succeeded, now=time.time):
+    """
+    Return the metrics of a command from the spans recorded while it ran,
+    as the text of a Prometheus textfile.
+    """
+    spans = [event for event in tracer.events if event['ph'] == 'X']
+    writer = MetricsWriter(OrderedDict([
+        ('project', tracer.tags.get('project', '')),
+        ('command', tracer.tags['command']),
+    ]))
+
+    def named(category, name):
+        return [event for event in spans if event['cat'] == category and event['name'] == name]
+
+    def seconds(category, name):
+        return sum(event['dur'] for event in named(category, name)) / 1e6
+
+    # Phases run within one another, such as a pull while creating a
+    # container, are only counted towards the inner one
+    phase_names = [name for _, name in PHASES.values()]
+
+    def phase_seconds(category, name):
+        return sum(
+            exclusive_duration(event, spans, phase_names)
+            for event in named(category, name)
+        ) / 1e6
+
+    writer.metric('compose_command_duration_seconds', 'gauge', 'Time the command took.')
+    writer.sample('compose_command_duration_seconds', seconds('compose', 'docker-compose'))
+    writer.metric('compose_command_success', 'gauge', 'Whether the command succeeded.')
+    writer.sample('compose_command_success', 1 if succeeded else 0)
+    writer.metric('compose_command_last_run_timestamp_seconds', 'gauge', 'When the command finished.')
+    writer.sample('compose_command_last_run_timestamp_seconds', now())
+
+    writer.metric(
+        'compose_phase_duration_seconds', 'gauge',
+        'Time spent in each phase of the command, summed over services.')
+    for phase, (category, name) in PHASES.items():
+        writer.sample('compose_phase_duration_seconds', phase_seconds(category, name), phase=phase)
+
+    api_times = OrderedDict()
+    for event in spans:
+        if event['cat'] == 'api':
+            api_times.setdefault(event['name'], []).append(event['dur'] / 1e6)
+
+    writer.metric('compose_api_request_duration_seconds', 'histogram', 'Time taken by Docker API requests.')
+    for method, times in sorted(api_times.items()):
+        for bound in API_BUCKETS:
+            writer.sample(
+                'compose_api_request_duration_seconds_bucket',
+                len([t for t in times if t <= bound]),
+                method=method, le=format_value(float(bound)))
+        writer.sample('compose_api_request_duration_seconds_bucket', len(times), method=method, le='+Inf')
+        writer.sample('compose_api_request_duration_seconds_sum', sum(times), method=method)
+        writer.sample('compose_api_request_duration_seconds_count', len(times), method=method)
+
+    # Recreating a container creates its replacement, which isn't counted
+    # as created
+    recreated = named('service', 'recreate_container')
+    created = [
+        event for event in named('service', 'create_container')
+        if not any(within(event, recreate) for recreate in recreated)
+    ]
+
+    writer.metric('compose_containers_created', 'gauge', 'Containers created by the command.')
+    writer.sample('compose_containers_created', len(created))
+    writer.metric('compose_containers_recreated', 'gauge', 'Containers recreated by the command.')
+    writer.sample('compose_containers_recreated', len(recreated))
+    writer.metric('compose_containers_removed', 'gauge', 'Containers removed by the command.')
+    writer.sample('compose_containers_removed', len(named('api', 'remove_container')))
+
+    writer.metric('compose_pull_bytes', 'gauge', 'Bytes of image layers downloaded by the command.')
+    writer.sample('compose_pull_bytes', tracer.counters.get('pull_bytes', 0))
+
+    return writer.text()
+
+
+def write_textfile(directory, tracer, succeeded):
+    """
+    Write the metrics of a command to a textfile in `directory`, for the
+    node_exporter textfile collector. Each project and command has its own
+    file, which is replaced atomically. Commands which didn't get as far as
+    running, such as --version, are skipped.
+    """
+    if 'command' not in tracer.tags:
+        return
+
+    filename = 'docker-compose-%s-%s.prom' % (tracer.tags.get('project') or 'none', tracer.tags['command'])
+    path = os.path.join(directory, filename)
+
+    # The collector only reads *.prom files, so it won't see a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(command_metrics(tracer, succeeded))
+        os.chmod(tmp_path, 0o644)
+        os.rename(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
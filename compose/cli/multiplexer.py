@@ -1,5 +1,6 @@
 from __future__ import absolute_import
-from threading import Thread
+import heapq
+from threading import Lock, Thread
 
 try:
     from Queue import Queue, Empty
@@ -12,31 +13,82 @@ except ImportError:
 STOP = object()
 
 
+# Put on the queue by a reader once its generator is exhausted.
+_DONE = object()
+
+
 class Multiplexer(object):
     def __init__(self, generators):
         self.generators = generators
         self.queue = Queue()
+        self.readers = 0
+        self.lock = Lock()
 
     def loop(self):
+        """
+        Yield items from all generators as they're produced, until one of
+        them yields STOP or all of them are exhausted.
+        """
         self._init_readers()
 
-        while True:
+        while self.readers > 0:
             try:
                 item = self.queue.get(timeout=0.1)
                 if item is STOP:
                     break
+                elif item is _DONE:
+                    with self.lock:
+                        self.readers -= 1
                 else:
                     yield item
             except Empty:
                 pass
 
+    def add(self, generator):
+        """
+        Start reading from another generator, possibly while looping.
+        """
+        with self.lock:
+            self.readers += 1
+        self._start_reader(generator)
+
     def _init_readers(self):
         for generator in self.generators:
-            t = Thread(target=_enqueue_output, args=(generator, self.queue))
-            t.daemon = True
-            t.start()
+            self.add(generator)
+
+    def _start_reader(self, generator):
+        t = Thread(target=_enqueue_output, args=(generator, self.queue))
+        t.daemon = True
+        t.start()
 
 
 def _enqueue_output(generator, queue):
-    for item in generator:
-        queue.put(item)
+    try:
+        for item in generator:
+            queue.put(item)
+    finally:
+        queue.put(_DONE)
+
+
+def merge_ordered(streams):
+    """
+    Merge iterables of (key, item) pairs, each already sorted by key, into
+    a single sequence of items sorted by key. Only one pending item per
+    stream is held in memory. Items with equal keys keep stream order.
+    """
+    heap = []
+    for index, stream in enumerate(streams):
+        iterator = iter(stream)
+        for key, item in iterator:
+            heap.append((key, index, item, iterator))
+            break
+    heapq.heapify(heap)
+
+    while heap:
+        _, index, item, iterator = heap[0]
+        yield item
+        try:
+            key, item = next(iterator)
+            heapq.heapreplace(heap, (key, index, item, iterator))
+        except StopIteration:
+            heapq.heappop(heap)
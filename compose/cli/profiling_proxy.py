@@ -0,0 +1,183 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from collections import OrderedDict
+import json
+import math
+import sys
+import threading
+import time
+import types
+
+import six
+
+from .. import trace
+from .formatter import Formatter
+from .verbose_proxy import VerboseProxy
+
+# Modules whose frames aren't reported as the caller of an API call
+PROXY_MODULES = (__name__, 'compose.cli.verbose_proxy')
+
+
+class ApiProfile(object):
+    """
+    A record of each call made through a ProfilingProxy: the method, how long
+    it took, the size of its response and the compose function which made it.
+    """
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.records = []
+        self.lock = threading.Lock()
+
+    def add(self, method, seconds, size, caller):
+        with self.lock:
+            self.records.append({
+                'method': method,
+                'seconds': seconds,
+                'size': size,
+                'caller': caller,
+            })
+
+    def summary(self):
+        """
+        Return a row for each method with its name, number of calls, median,
+        95th percentile and longest time, and total time, with the methods
+        which took longest in total first.
+        """
+        times = OrderedDict()
+        for record in self.records:
+            times.setdefault(record['method'], []).append(record['seconds'])
+
+        rows = []
+        for method, seconds in times.items():
+            seconds = sorted(seconds)
+            rows.append([
+                method,
+                len(seconds),
+                percentile(seconds, 0.5),
+                percentile(seconds, 0.95),
+                seconds[-1],
+                sum(seconds),
+            ])
+        return sorted(rows, key=lambda row: row[-1], reverse=True)
+
+    def format_summary(self):
+        headers = ['Method', 'Calls', 'p50', 'p95', 'Max', 'Total']
+        rows = [
+            [row[0], '%d' % row[1]] + ['%.3fs' % value for value in row[2:]]
+            for row in self.summary()
+        ]
+        return Formatter().table(headers, rows)
+
+    def dump(self, f):
+        for record in self.records:
+            f.write(json.dumps(record) + '\n')
+
+    def report(self, stream, dump_path=None):
+        stream.write(self.format_summary() + '\n')
+        if dump_path:
+            with open(dump_path, 'w') as f:
+                self.dump(f)
+
+
+def percentile(values, q):
+    """
+    Return the `q` quantile of the sorted list `values`, by nearest rank.
+    """
+    index = int(math.ceil(q * len(values))) - 1
+    return values[max(0, min(index, len(values) - 1))]
+
+
+class ProfilingProxy(VerboseProxy):
+    """Proxy all function calls to another class and record how long each call
+    takes in `profile`. Streamed responses are timed until they have been read
+    to the end. Calls which raise, such as inspecting an image which doesn't
+    exist, are still round-trips, so they're recorded too.
+    """
+
+    def __init__(self, obj_name, obj, profile):
+        super(ProfilingProxy, self).__init__(obj_name, obj)
+        self.profile = profile
+
+    def proxy_callable(self, call_name, *args, **kwargs):
+        caller = find_caller()
+        start = self.profile.clock()
+        try:
+            result = getattr(self.obj, call_name)(*args, **kwargs)
+        except Exception:
+            self.profile.add(call_name, self.profile.clock() - start, None, caller)
+            raise
+
+        if isinstance(result, types.GeneratorType):
+            return self.profile_stream(call_name, result, start, caller)
+
+        self.profile.add(call_name, self.profile.clock() - start, response_size(result), caller)
+        return result
+
+    def profile_stream(self, call_name, stream, start, caller):
+        size = 0
+        try:
+            for chunk in stream:
+                size += response_size(chunk) or 0
+                yield chunk
+        finally:
+            self.profile.add(call_name, self.profile.clock() - start, size, caller)
+
+
+def response_size(result):
+    """
+    Return the size in bytes of a response, or of its JSON encoding, or None
+    if it can't be measured.
+    """
+    if isinstance(result, six.binary_type):
+        return len(result)
+    if isinstance(result, six.text_type):
+        return len(result.encode('utf-8'))
+    if isinstance(result, (dict, list)):
+        try:
+            return len(json.dumps(result))
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+def find_caller():
+    """
+    Return the name of the innermost compose function on the stack, outside
+    of the proxies.
+    """
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if module.startswith('compose.') and module not in PROXY_MODULES:
+            return '%s.%s' % (module, frame.f_code.co_name)
+        frame = frame.f_back
+    return None
+
+
+class TracingProxy(VerboseProxy):
+    """Proxy all function calls to another class and record a span for each
+    call on the current trace. Streamed responses are traced until they have
+    been read to the end.
+    """
+
+    def proxy_callable(self, call_name, *args, **kwargs):
+        span = trace.span(call_name, 'api')
+        span.start()
+        try:
+            result = getattr(self.obj, call_name)(*args, **kwargs)
+        except Exception:
+            span.finish()
+            raise
+
+        if isinstance(result, types.GeneratorType):
+            return self.trace_stream(span, result)
+
+        span.finish()
+        return result
+
+    def trace_stream(self, span, stream):
+        try:
+            for chunk in stream:
+                yield chunk
+        finally:
+            span.finish()
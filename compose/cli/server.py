@@ -0,0 +1,267 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from collections import namedtuple, OrderedDict
+from contextlib import contextmanager
+import copy
+import json
+import logging
+import os
+import socket
+import sys
+import traceback
+
+import six
+
+from .. import config
+from ..build_context import cache_dir
+from .docker_client import docker_client
+from .launcher import RECV_SIZE, send_message
+
+log = logging.getLogger(__name__)
+
+# Number of configs kept loaded by a server
+MAX_CONFIGS = 32
+
+# Environment variables which docker_client() reads
+CLIENT_ENVIRONMENT = ('DOCKER_HOST', 'DOCKER_TLS_VERIFY', 'DOCKER_CERT_PATH', 'DOCKER_CLIENT_TIMEOUT', 'HOME')
+
+
+def default_socket_path():
+    return os.path.join(cache_dir(), 'server.sock')
+
+
+ConfigEntry = namedtuple('ConfigEntry', 'stamps service_dicts')
+
+
+class ConfigCache(object):
+    """
+    Loaded configs, keyed on their path and the environment they were loaded
+    in. An entry is reloaded once any of the files the config depends on has
+    changed.
+    """
+    def __init__(self, max_entries=MAX_CONFIGS):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def load(self, config_path):
+        key = (os.path.abspath(config_path), tuple(sorted(os.environ.items())))
+
+        entry = self.entries.pop(key, None)
+        if entry is None or entry.stamps != file_stamps(entry.stamps):
+            log.debug("Loading %s", config_path)
+            # Stat the files before reading them, so a change made while
+            # loading is picked up next time
+            stamps = file_stamps(config.config_files(config_path))
+            entry = ConfigEntry(stamps, config.load(config_path))
+
+        self.entries[key] = entry
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+        # Project.from_dicts modifies the dicts it is given
+        return copy.deepcopy(entry.service_dicts)
+
+
+def file_stamps(files):
+    """
+    Return the modification time, size and inode of each file, or None for
+    files which don't exist.
+    """
+    stamps = OrderedDict()
+    for filename in files:
+        try:
+            st = os.stat(filename)
+            stamps[filename] = (st.st_mtime, st.st_size, st.st_ino)
+        except OSError:
+            stamps[filename] = None
+    return stamps
+
+
+class ClientCache(object):
+    """
+    Docker clients, keyed on the environment variables they are configured
+    from, so their connection pools are reused between commands.
+    """
+    def __init__(self):
+        self.clients = {}
+
+    def get(self):
+        key = tuple(os.environ.get(name) for name in CLIENT_ENVIRONMENT)
+        if key not in self.clients:
+            self.clients[key] = docker_client()
+        return self.clients[key]
+
+
+class ComposeServer(object):
+    """
+    Listens on a unix socket for commands sent by `forward()`, one at a time,
+    and runs each with `run`, a function taking the command line arguments,
+    in the working directory and environment of the client. Output is sent
+    back as it is written, followed by the exit status. A command which
+    can't be run fails with an error sent to its client, and leaves the
+    server's own working directory and environment as they were.
+    """
+    def __init__(self, socket_path, run):
+        self.socket_path = socket_path
+        self.run = run
+
+    def serve_forever(self):
+        directory = os.path.dirname(self.socket_path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        if os.path.exists(self.socket_path):
+            # Left behind by a server which didn't shut down cleanly
+            os.remove(self.socket_path)
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.bind(self.socket_path)
+            os.chmod(self.socket_path, 0o600)
+            sock.listen(16)
+            log.info("Listening on %s", self.socket_path)
+
+            while True:
+                conn, _ = sock.accept()
+                try:
+                    self.handle(conn)
+                except Exception:
+                    # A broken connection mustn't take down the server
+                    log.error("Failed to handle a command:\n%s", traceback.format_exc())
+                finally:
+                    conn.close()
+        finally:
+            sock.close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+    def handle(self, conn):
+        stdout = ConnectionStream(conn, 'stdout')
+        stderr = ConnectionStream(conn, 'stderr')
+
+        try:
+            request = read_request(conn)
+            if request is None:
+                return
+            exit_code = self.run_request(request, stdout, stderr)
+        except Exception as e:
+            log.debug("Couldn't run a command: %s", e)
+            stderr.write("The compose server couldn't run the command: %s\n" % e)
+            exit_code = 1
+
+        try:
+            send_message(conn, {'exit': exit_code})
+        except socket.error as e:
+            log.debug("Couldn't send exit status: %s", e)
+
+    def run_request(self, request, stdout, stderr):
+        cwd = os.getcwd()
+        environ = dict(os.environ)
+
+        try:
+            os.chdir(request['cwd'])
+            os.environ.clear()
+            os.environ.update(dict(
+                (native_str(k), native_str(v)) for k, v in request['env'].items()
+            ))
+            with redirect_output(stdout, stderr):
+                return self.run_command(request['argv'])
+        finally:
+            os.chdir(cwd)
+            os.environ.clear()
+            os.environ.update(environ)
+
+    def run_command(self, argv):
+        try:
+            self.run(argv)
+        except SystemExit as e:
+            return exit_status(e, sys.stderr)
+        except Exception:
+            sys.stderr.write(traceback.format_exc())
+            return 1
+        return 0
+
+
+def exit_status(e, stderr):
+    """
+    Return the exit status of a process exiting with SystemExit `e`, writing
+    its message to `stderr` if it has one, as the interpreter would.
+    """
+    if e.code is None:
+        return 0
+    if isinstance(e.code, int):
+        return e.code
+    stderr.write('%s\n' % e.code)
+    return 1
+
+
+class ConnectionStream(object):
+    """
+    A file-like object sending what is written to it over a connection to a
+    client, as `stream`. Once the client has gone away, output is discarded.
+    """
+    def __init__(self, conn, stream):
+        self.conn = conn
+        self.stream = stream
+        self.closed = False
+
+    def write(self, data):
+        if self.closed or not data:
+            return
+        if isinstance(data, six.binary_type):
+            data = data.decode('utf-8', 'replace')
+        try:
+            send_message(self.conn, {'stream': self.stream, 'data': data})
+        except socket.error as e:
+            log.debug("Client went away: %s", e)
+            self.closed = True
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+@contextmanager
+def redirect_output(stdout, stderr):
+    """
+    Replace sys.stdout and sys.stderr, and point logging handlers writing to
+    them at the replacements.
+    """
+    replacements = {id(sys.stdout): stdout, id(sys.stderr): stderr}
+    handlers = [
+        handler for handler in logging.getLogger().handlers
+        if id(getattr(handler, 'stream', None)) in replacements
+    ]
+    original_streams = [handler.stream for handler in handlers]
+    original_stdout, original_stderr = sys.stdout, sys.stderr
+
+    for handler in handlers:
+        handler.stream = replacements[id(handler.stream)]
+    sys.stdout, sys.stderr = stdout, stderr
+    try:
+        yield
+    finally:
+        sys.stdout, sys.stderr = original_stdout, original_stderr
+        for handler, stream in zip(handlers, original_streams):
+            handler.stream = stream
+
+
+def read_request(conn):
+    buffered = b''
+    while b'\n' not in buffered:
+        chunk = conn.recv(RECV_SIZE)
+        if not chunk:
+            return None
+        buffered += chunk
+    return json.loads(buffered.split(b'\n', 1)[0].decode('utf-8'))
+
+
+def native_str(value):
+    """
+    Return `value` as the native string type, which os.environ needs on
+    Python 2.
+    """
+    if six.PY2 and isinstance(value, six.text_type):
+        return value.encode('utf-8')
+    return value
@@ -0,0 +1,107 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from collections import OrderedDict
+
+from .formatter import Formatter
+
+# The span of each phase timed for a service
+PHASES = OrderedDict([
+    ('image', 'ensure_image_exists'),
+    ('create', 'create_container'),
+    ('start', 'start_container'),
+    ('stop', 'stop_container'),
+])
+
+
+def service_timings(tracer):
+    """
+    Return how long each service converged by `up` spent in each phase, from
+    the spans on `tracer`, with the slowest services first. Times are in
+    seconds and don't include time spent in other phases: creating a
+    container doesn't include making sure its image exists. Images pulled in
+    the background count towards the service's image time, and its total
+    is the time covered by any of its spans, so it includes them too.
+    """
+    spans = [
+        event for event in tracer.events
+        if event['ph'] == 'X' and event['cat'] == 'service'
+    ]
+
+    timings = []
+    for plan in spans:
+        if plan['name'] != 'execute_convergence_plan':
+            continue
+
+        service = plan['args']['name']
+        timing = OrderedDict([
+            ('service', service),
+            ('action', plan['args'].get('action')),
+            ('containers', plan['args'].get('containers')),
+        ])
+        own = [
+            span for span in spans
+            if span['name'] in PHASES.values() and span['args'].get('name') == service
+        ]
+        for phase, name in PHASES.items():
+            timing[phase] = sum(
+                exclusive_duration(span, spans) for span in own
+                if span['name'] == name
+            ) / 1e6
+        timing['total'] = union_duration([plan] + own) / 1e6
+        timings.append(timing)
+
+    return sorted(timings, key=lambda timing: timing['total'], reverse=True)
+
+
+def exclusive_duration(span, spans, phases=None):
+    """
+    The duration of `span`, less that of timed phases run within it: spans
+    named in `phases`, or in `PHASES` if it's not given. Spans are recorded
+    as they finish, so those nested in `span` come before it.
+    """
+    if phases is None:
+        phases = PHASES.values()
+    nested = [
+        other for other in spans[:spans.index(span)]
+        if other['name'] in phases and within(other, span)
+    ]
+    return span['dur'] - sum(other['dur'] for other in nested)
+
+
+def union_duration(spans):
+    """
+    The time during which any of `spans` was running.
+    """
+    total = 0
+    end = None
+    for span in sorted(spans, key=lambda span: span['ts']):
+        span_end = span['ts'] + span['dur']
+        if end is None or span['ts'] >= end:
+            total += span['dur']
+            end = span_end
+        elif span_end > end:
+            total += span_end - end
+            end = span_end
+    return total
+
+
+def within(span, outer):
+    """
+    Whether `span` ran within `outer`, on the same thread.
+    """
+    return (
+        span['tid'] == outer['tid'] and
+        span['ts'] >= outer['ts'] and
+        span['ts'] + span['dur'] <= outer['ts'] + outer['dur']
+    )
+
+
+def format_timings(timings):
+    headers = ['Service', 'Action', 'Containers'] + [phase.capitalize() for phase in PHASES] + ['Total']
+    rows = [
+        [timing['service'], timing['action'], '%s' % timing['containers']] +
+        ['%.2fs' % timing[phase] for phase in PHASES] +
+        ['%.2fs' % timing['total']]
+        for timing in timings
+    ]
+    return Formatter().table(headers, rows)
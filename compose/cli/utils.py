@@ -3,8 +3,15 @@ from __future__ import absolute_import
 from __future__ import division
 import datetime
 import os
+import re
 import subprocess
 import platform
+import sys
+
+import six
+
+
+TIMESTAMP_RE = re.compile(r'^(\d{4}-\d{2}-\d{2})(?:[T ](\d{2}:\d{2}:\d{2})(?:\.(\d+))?)?Z?$')
 
 
 def yesno(prompt, default=None):
@@ -106,6 +113,29 @@ def split_buffer(reader, separator):
         yield buffered
 
 
+def normalize_timestamp(value):
+    """
+    Turn an RFC 3339 timestamp in UTC, as written by the Docker daemon, or a
+    unix timestamp into a string which sorts chronologically, with the
+    fraction of a second padded to nanoseconds.
+    """
+    if isinstance(value, six.binary_type):
+        value = value.decode('utf-8')
+    value = value.strip()
+
+    if re.match(r'^\d+(\.\d*)?$', value):
+        seconds, _, fraction = value.partition('.')
+        date = datetime.datetime.utcfromtimestamp(int(seconds))
+        return '%s.%s' % (date.strftime('%Y-%m-%dT%H:%M:%S'), fraction.ljust(9, '0')[:9])
+
+    match = TIMESTAMP_RE.match(value)
+    if not match:
+        raise ValueError("Invalid timestamp: %s" % value)
+
+    date, time, fraction = match.groups()
+    return '%sT%s.%s' % (date, time or '00:00:00', (fraction or '').ljust(9, '0')[:9])
+
+
 def call_silently(*args, **kwargs):
     """
     Like subprocess.call(), but redirects stdout and stderr to /dev/null.
@@ -120,3 +150,22 @@ def is_mac():
 
 def is_ubuntu():
     return platform.system() == 'Linux' and platform.linux_distribution()[0] == 'Ubuntu'
+
+
+def run_profiled(path, top, func, *args, **kwargs):
+    """
+    Call `func` under cProfile, then write the stats to `path`, where pstats
+    can load them, and print the `top` functions by cumulative time to
+    stderr.
+    """
+    # Only profiled runs need these, so they aren't imported at startup
+    import cProfile
+    import pstats
+
+    profile = cProfile.Profile()
+    try:
+        return profile.runcall(func, *args, **kwargs)
+    finally:
+        profile.dump_stats(path)
+        stats = pstats.Stats(profile, stream=sys.stderr)
+        stats.sort_stats('cumulative').print_stats(top)
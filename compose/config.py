@@ -1,5 +1,4 @@
 import os
-import yaml
 import six
 
 
@@ -68,6 +67,32 @@ def load(filename):
     return from_dictionary(load_yaml(filename), working_dir=working_dir, filename=filename)
 
 
+def config_files(filename):
+    """
+    Return the paths of the files a config depends on: the config itself,
+    the files its services extend and their env files.
+    """
+    files = []
+    pending = [os.path.abspath(filename)]
+
+    while pending:
+        filename = pending.pop()
+        if filename in files:
+            continue
+        files.append(filename)
+
+        working_dir = os.path.dirname(filename)
+        for service_dict in (load_yaml(filename) or {}).values():
+            if not isinstance(service_dict, dict):
+                continue
+            files.extend(get_env_files(service_dict, working_dir=working_dir))
+            extends = service_dict.get('extends')
+            if isinstance(extends, dict) and 'file' in extends:
+                pending.append(expand_path(working_dir, extends['file']))
+
+    return files
+
+
 def from_dictionary(dictionary, working_dir=None, filename=None):
     service_dicts = []
 
@@ -461,6 +486,9 @@ def get_service_name_from_net(net_config):
 
 
 def load_yaml(filename):
+    # Slow to import, and not needed by commands which don't load a config
+    import yaml
+
     try:
         with open(filename, 'r') as fh:
             return yaml.safe_load(fh)
@@ -4,7 +4,7 @@ from __future__ import absolute_import
 import six
 from functools import reduce
 
-from .const import LABEL_CONTAINER_NUMBER, LABEL_SERVICE
+from .const import LABEL_CONTAINER_NUMBER, LABEL_POOL, LABEL_SERVICE
 
 
 class Container(object):
@@ -60,10 +60,18 @@ class Container(object):
 
     @property
     def name_without_project(self):
-        return '{0}_{1}'.format(self.labels.get(LABEL_SERVICE), self.number)
+        return '{0}_{1}'.format(self.service, self.number)
+
+    @property
+    def service(self):
+        return self.labels.get(LABEL_SERVICE)
 
     @property
     def number(self):
+        if LABEL_POOL in self.labels:
+            # Pooled containers are numbered on their own, and renumbered by
+            # renaming them when they're taken
+            return int(self.name.rsplit('_', 1)[1])
         number = self.labels.get(LABEL_CONTAINER_NUMBER)
         if not number:
             raise ValueError("Container {0} does not have a {1} label".format(
@@ -88,12 +96,20 @@ class Container(object):
 
     @property
     def labels(self):
+        config = self.dictionary.get('Config') or {}
+        if not self.has_been_inspected and 'Labels' in config:
+            # Labels given with a listing don't need an inspect
+            return config['Labels'] or {}
         return self.get('Config.Labels') or {}
 
     @property
     def log_config(self):
         return self.get('HostConfig.LogConfig') or None
 
+    @property
+    def log_path(self):
+        return self.get('LogPath')
+
     @property
     def human_readable_state(self):
         if self.is_running:
@@ -155,8 +171,27 @@ class Container(object):
         return self.client.wait(self.id)
 
     def logs(self, *args, **kwargs):
+        if kwargs.pop('follow', True) is False and kwargs.get('stream'):
+            return self._stream_finished_logs(**kwargs)
         return self.client.logs(self.id, *args, **kwargs)
 
+    def _stream_finished_logs(self, stdout=True, stderr=True, stream=True, timestamps=False, tail='all'):
+        """
+        Stream the lines logged so far, without following. docker-py only
+        streams logs while following them, so the request is made here.
+        """
+        response = self.client._get(
+            self.client._url('/containers/{0}/logs'.format(self.id)),
+            params={
+                'stdout': stdout and 1 or 0,
+                'stderr': stderr and 1 or 0,
+                'timestamps': timestamps and 1 or 0,
+                'follow': 0,
+                'tail': tail,
+            },
+            stream=True)
+        return self.client._multiplexed_response_stream_helper(response)
+
     def inspect(self):
         self.dictionary = self.client.inspect_container(self.id)
         self.has_been_inspected = True
@@ -199,3 +234,13 @@ def get_container_name(container):
     # ps
     shortest_name = min(container['Names'], key=lambda n: len(n.split('/')))
     return shortest_name.split('/')[-1]
+
+
+def is_pooled(container):
+    """
+    Whether a ps or inspect entry is of a container still waiting in a
+    `run --pool`, rather than one taken by a run.
+    """
+    labels = container.get('Labels') or (container.get('Config') or {}).get('Labels') or {}
+    name = get_container_name(container) or ''
+    return LABEL_POOL in labels and name.split('_')[-2:-1] == ['pool']
@@ -0,0 +1,106 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import json
+import logging
+import os
+import tarfile
+import tempfile
+
+log = logging.getLogger(__name__)
+
+# Default size budget of an image cache, in bytes
+DEFAULT_MAX_SIZE = 10 * 1024 ** 3
+
+COPY_SIZE = 1024 * 1024
+
+
+class ImageCache(object):
+    """
+    A directory of saved images, keyed by the digest of the build context
+    they were built from, which can be shared between machines or CI jobs.
+    Once the images in it take up more than `max_size` bytes, the least
+    recently used ones are removed.
+    """
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.tar')
+
+    def load(self, client, key, tag):
+        """
+        Load the image saved under `key`, if there is one, and tag it as
+        `tag`. Return its ID, or None if it isn't in the cache.
+        """
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+
+        image_id = read_image_id(path)
+        with open(path, 'rb') as f:
+            client.load_image(f)
+        client.tag(image_id, tag, force=True)
+
+        # Mark as recently used
+        os.utime(path, None)
+        return image_id
+
+    def save(self, client, key, image):
+        """
+        Save `image` under `key`, then evict the least recently used images
+        if the cache has grown past its budget.
+        """
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                data = client.get_image(image)
+                for chunk in iter(lambda: data.read(COPY_SIZE), b''):
+                    f.write(chunk)
+            os.rename(tmp_path, self.path(key))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.tar'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+
+        total = sum(size for (_, size, _) in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            log.debug("Evicting %s from the build cache", path)
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+
+def read_image_id(path):
+    """
+    Return the ID of the image in a tar archive written by `docker save`,
+    from the tag recorded in its `repositories` file.
+    """
+    with tarfile.open(path) as archive:
+        repositories = json.loads(archive.extractfile('repositories').read().decode('utf-8'))
+
+    for tags in repositories.values():
+        for image_id in tags.values():
+            return image_id
+
+    raise ValueError("%s doesn't contain a tagged image" % path)
@@ -0,0 +1,134 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import logging
+import threading
+import time
+
+from docker.errors import APIError
+
+from .const import LABEL_POOL
+from .container import Container, get_container_name, is_pooled
+from .utils import json_hash
+
+log = logging.getLogger(__name__)
+
+# Seconds to wait for a background refill once a run is over
+REFILL_TIMEOUT = 10
+
+
+class ContainerPool(object):
+    """
+    One-off containers of a service created ahead of time for `run`, so that
+    a run can start one straight away. Containers are only taken for runs
+    with the same `override_options` (command, environment, and so on) and
+    the same service configuration as they were created with, which are
+    hashed into the pool's key; containers with another key are removed when
+    the pool is refilled.
+
+    A pooled container is named `<project>_<service>_pool_<number>`, numbered
+    apart from one-off containers, which don't count it, and is taken by
+    renaming it to the name of the next one-off container, so two runs can't
+    take the same one. Pooled containers are created without logging.
+    """
+    def __init__(self, service, size, override_options):
+        self.service = service
+        self.size = size
+        self.override_options = override_options
+        self.key = json_hash({
+            'config': service.config_hash(),
+            'options': override_options,
+        })
+        self.thread = None
+
+    def take(self):
+        """
+        Take a container from the pool and return it, or None if it's empty.
+        """
+        for container in self._pooled(self.key):
+            number = self.service._next_container_number(one_off=True)
+            try:
+                self.service.client.rename(
+                    get_container_name(container),
+                    self.service.get_container_name(number, one_off=True))
+            except APIError as e:
+                log.debug("Couldn't take %s from the pool: %s", get_container_name(container), e)
+                continue
+            return Container.from_id(self.service.client, container['Id'])
+
+        return None
+
+    def refill(self):
+        """
+        Remove pooled containers created for another configuration, and
+        create containers until there are `size` in the pool.
+        """
+        pooled = self._pooled()
+        current = [c for c in pooled if (c.get('Labels') or {}).get(LABEL_POOL) == self.key]
+
+        for container in pooled:
+            if container not in current:
+                log.debug("Removing stale pooled container %s", get_container_name(container))
+                try:
+                    self.service.client.remove_container(container['Id'])
+                except APIError as e:
+                    log.debug("Couldn't remove %s: %s", get_container_name(container), e)
+
+        number = max([pool_number(c) for c in pooled] or [0])
+        for _ in range(self.size - len(current)):
+            number += 1
+            try:
+                self._create(number)
+            except APIError as e:
+                log.debug("Couldn't add a container to the pool for %s: %s", self.service.name, e)
+                return
+
+    def refill_in_background(self):
+        self.thread = threading.Thread(target=self._refill_logging_errors)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _refill_logging_errors(self):
+        try:
+            self.refill()
+        except Exception as e:
+            log.warn("Couldn't refill the pool for %s: %s", self.service.name, e)
+
+    def wait(self, timeout=REFILL_TIMEOUT):
+        """
+        Wait up to `timeout` seconds for a background refill to finish.
+        Containers it hasn't created yet are left for the next run.
+        """
+        if self.thread is None:
+            return
+        deadline = time.time() + timeout
+        # Join with a timeout so that KeyboardInterrupt is still delivered
+        while self.thread.is_alive() and time.time() < deadline:
+            self.thread.join(0.1)
+
+    def _create(self, number):
+        labels = dict(self.service.options.get('labels') or {})
+        labels[LABEL_POOL] = self.key
+        options = dict(self.override_options, labels=labels)
+
+        container_options = self.service._get_container_create_options(options, number, one_off=True)
+        container_options['name'] = pool_container_name(self.service, number)
+        return Container.create(self.service.client, **container_options)
+
+    def _pooled(self, key=None):
+        """
+        Return the ps entries of the service's pooled containers with `key`,
+        or with any key.
+        """
+        label = LABEL_POOL if key is None else '{0}={1}'.format(LABEL_POOL, key)
+        containers = self.service.client.containers(
+            all=True,
+            filters={'label': self.service.labels(one_off=True) + [label]})
+        return [c for c in containers if is_pooled(c)]
+
+
+def pool_container_name(service, number):
+    return '{0}_{1}_pool_{2}'.format(service.project, service.name, number)
+
+
+def pool_number(container):
+    return int(get_container_name(container).rsplit('_', 1)[1])
@@ -0,0 +1,86 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import logging
+import sys
+import threading
+
+from six.moves.queue import Empty, Queue
+
+from .progress_stream import build_progress
+from .service import group_by_image
+
+log = logging.getLogger(__name__)
+
+# Number of images pulled at once
+PREFETCH_WORKERS = 3
+
+
+class ImagePrefetcher(object):
+    """
+    Pulls the missing images of `services` in the background, at most
+    `workers` at a time, starting with the first service. An image used by
+    several services is pulled once. Call `wait()` before a service needs
+    its image.
+
+    Pulls are shown on `progress`, a `ProgressBoard`, or on a board of their
+    own if none is given, since several may run at once. That board is
+    written as plain text, even on a terminal: redrawing it in place would
+    garble what the command writes to stdout meanwhile. A pull which fails is
+    only logged: the service will pull its image again when it needs it,
+    and report the error then.
+    """
+    def __init__(self, services, insecure_registry=False, progress=None, workers=PREFETCH_WORKERS):
+        self.insecure_registry = insecure_registry
+        self.own_progress = progress is None
+        self.progress = build_progress('plain', sys.stdout) if progress is None else progress
+
+        # An image used by several services is pulled once, for the first
+        self.done = {}
+        self.queue = Queue()
+        for group in group_by_image(services).values():
+            done = threading.Event()
+            for service in group:
+                self.done[service.name] = done
+            self.queue.put(group[0])
+
+        self.threads = [
+            threading.Thread(target=self._work)
+            for _ in range(min(workers, self.queue.qsize()))
+        ]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def _work(self):
+        while True:
+            try:
+                service = self.queue.get_nowait()
+            except Empty:
+                return
+
+            try:
+                service.ensure_image_exists(
+                    do_build=False,
+                    insecure_registry=self.insecure_registry,
+                    progress=self.progress,
+                )
+            except Exception as e:
+                log.debug("Couldn't prefetch the image for %s: %s", service.name, e)
+            finally:
+                self.done[service.name].set()
+
+    def wait(self, service):
+        """
+        Wait until the image of `service` has been pulled, if it's being
+        prefetched.
+        """
+        done = self.done.get(service.name)
+        if done is None:
+            return
+        # Wait with a timeout so that KeyboardInterrupt is still delivered
+        while not done.wait(0.1):
+            pass
+
+    def close(self):
+        if self.own_progress:
+            self.progress.close()
@@ -1,6 +1,22 @@
+from __future__ import division
+from collections import OrderedDict
 import json
 import os
 import codecs
+import re
+import threading
+import time
+
+from .utils import json_stream
+
+# Maximum number of times a second the layer progress lines are redrawn
+MAX_FPS = 10
+
+# Minimum number of seconds between two JSON reports of a layer's progress
+JSON_PROGRESS_INTERVAL = 1
+
+# Statuses of a layer which is ready to use
+COMPLETE_STATUSES = ('Pull complete', 'Already exists')
 
 
 class StreamOutputError(Exception):
@@ -8,41 +24,490 @@ class StreamOutputError(Exception):
 
 
 def stream_output(output, stream):
+    """
+    Print the events in `output` to `stream` and return all of them. Prefer
+    `consume_output()` for long streams.
+    """
+    all_events = []
+    consume_output(output, stream, all_events.append)
+    return all_events
+
+
+def consume_output(output, stream, *callbacks):
+    """
+    Print the events in `output` to `stream`, passing each one to every
+    callback in turn. Events aren't kept, so memory use doesn't grow with the
+    length of the stream: callbacks such as `LastEvent` and `BuiltImageId`
+    keep only what the caller needs.
+    """
     is_terminal = hasattr(stream, 'fileno') and os.isatty(stream.fileno())
     stream = codecs.getwriter('utf-8')(stream)
-    all_events = []
-    lines = {}
-    diff = 0
+    if is_terminal:
+        renderer = TerminalRenderer(stream)
+    else:
+        renderer = PlainRenderer(stream)
+
+    try:
+        for event in json_stream(output):
+            for callback in callbacks:
+                callback(event)
+            renderer.render(event)
+    finally:
+        renderer.close()
 
-    for chunk in output:
-        event = json.loads(chunk)
-        all_events.append(event)
 
-        if 'progress' in event or 'progressDetail' in event:
+def is_progress_event(event):
+    return 'progress' in event or 'progressDetail' in event
+
+
+def is_final_event(event):
+    """
+    True for a layer event which won't be followed by more progress, such as
+    "Download complete" or "Pull complete".
+    """
+    return 'progress' not in event and 'current' not in (event.get('progressDetail') or {})
+
+
+class PlainRenderer(object):
+    """
+    Writes events to a stream which isn't a terminal. Progress events for a
+    layer are skipped.
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.layers = set()
+
+    def render(self, event):
+        if is_progress_event(event):
             image_id = event.get('id')
             if not image_id:
-                continue
+                return
+            if image_id not in self.layers:
+                self.layers.add(image_id)
+                self.stream.write("\n")
 
-            if image_id in lines:
-                diff = len(lines) - lines[image_id]
-            else:
-                lines[image_id] = len(lines)
-                stream.write("\n")
-                diff = 0
+        print_output_event(event, self.stream, False)
+        self.stream.flush()
 
-            if is_terminal:
-                # move cursor up `diff` rows
-                stream.write("%c[%dA" % (27, diff))
+    def close(self):
+        pass
 
-        print_output_event(event, stream, is_terminal)
 
-        if 'id' in event and is_terminal:
-            # move cursor back down
-            stream.write("%c[%dB" % (27, diff))
+class TerminalRenderer(object):
+    """
+    Draws one line per layer on a terminal, repainting at most `max_fps`
+    times a second. Only the latest event for each layer is kept between
+    frames, so intermediate progress updates are dropped; other messages and
+    final layer statuses are written straight away.
+    """
+    def __init__(self, stream, max_fps=MAX_FPS, clock=time.time):
+        self.stream = stream
+        self.frame_interval = 1.0 / max_fps
+        self.clock = clock
+        self.lines = {}
+        self.pending = {}
+        self.last_paint = None
 
-        stream.flush()
+    def render(self, event):
+        if not is_progress_event(event):
+            self.paint()
+            print_output_event(event, self.stream, True)
+            self.stream.flush()
+            return
 
-    return all_events
+        image_id = event.get('id')
+        if not image_id:
+            return
+
+        if image_id not in self.lines:
+            self.lines[image_id] = len(self.lines)
+            self.stream.write("\n")
+
+        self.pending[image_id] = event
+        if is_final_event(event) or self.frame_due():
+            self.paint()
+
+    def frame_due(self):
+        return self.last_paint is None or self.clock() - self.last_paint >= self.frame_interval
+
+    def paint(self):
+        """
+        Redraw the line of each layer which has changed since the last frame.
+        """
+        if not self.pending:
+            return
+
+        for image_id in sorted(self.pending, key=self.lines.get):
+            diff = len(self.lines) - self.lines[image_id]
+            # move cursor up `diff` rows, draw, then move back down
+            self.stream.write("%c[%dA" % (27, diff))
+            print_output_event(self.pending[image_id], self.stream, True)
+            self.stream.write("%c[%dB" % (27, diff))
+
+        self.pending.clear()
+        self.last_paint = self.clock()
+        self.stream.flush()
+
+    def close(self):
+        self.paint()
+
+
+class ProgressBoard(object):
+    """
+    Shows the progress of several labelled streams at once, such as the
+    pulls or builds of a few services running concurrently. Each one gets a
+    summary line with its current status, its number of complete layers and
+    the bytes downloaded so far, followed by a line per layer if `detail` is
+    true.
+
+    On a terminal the board is redrawn at most `max_fps` times a second.
+    Otherwise a line is written each time a stream's status changes.
+    """
+    def __init__(self, stream, detail=False, max_fps=MAX_FPS, clock=time.time, is_terminal=None):
+        if is_terminal is None:
+            is_terminal = hasattr(stream, 'fileno') and os.isatty(stream.fileno())
+        self.is_terminal = is_terminal
+        self.stream = codecs.getwriter('utf-8')(stream)
+        self.detail = detail
+        self.frame_interval = 1.0 / max_fps
+        self.clock = clock
+        self.progress = OrderedDict()
+        self.lock = threading.Lock()
+        self.painted = 0
+        self.last_paint = None
+        self.dirty = False
+
+    def consume(self, label, output, *callbacks):
+        """
+        Show the events in `output` under `label`, passing each one to every
+        callback in turn, like `consume_output()`. May be called from several
+        threads at once.
+        """
+        for event in json_stream(output):
+            for callback in callbacks:
+                callback(event)
+            if 'errorDetail' in event:
+                raise StreamOutputError(event['errorDetail']['message'])
+            self.update(label, event)
+
+    def update(self, label, event):
+        with self.lock:
+            progress = self.progress.get(label)
+            if progress is None:
+                progress = self.progress[label] = StreamProgress(label, self.clock)
+
+            status = progress.status
+            state_changed = progress.update(event)
+            self.show(progress, event, progress.status != status, state_changed)
+
+    def show(self, progress, event, status_changed, state_changed):
+        """
+        Show an event which has just updated `progress`. `status_changed` is
+        true if the stream's status changed, and `state_changed` if either
+        the stream's or a layer's status did.
+        """
+        if self.is_terminal:
+            self.dirty = True
+            if is_final_event(event) or self.frame_due():
+                self.paint()
+        elif status_changed:
+            self.stream.write("%s: %s\n" % (progress.label, progress.status))
+            self.stream.flush()
+
+    def frame_due(self):
+        return self.last_paint is None or self.clock() - self.last_paint >= self.frame_interval
+
+    def paint(self):
+        if not self.dirty:
+            return
+
+        lines = []
+        for progress in self.progress.values():
+            lines.append(progress.summary())
+            if self.detail:
+                lines.extend("  %s" % line for line in progress.layer_lines())
+
+        if self.painted:
+            # move cursor up to the top of the board
+            self.stream.write("%c[%dA" % (27, self.painted))
+        for line in lines:
+            # erase the line before drawing it
+            self.stream.write("%c[2K\r%s\n" % (27, line))
+
+        self.painted = len(lines)
+        self.last_paint = self.clock()
+        self.dirty = False
+        self.stream.flush()
+
+    def close(self):
+        """
+        Draw the board one last time on a terminal, or write a summary of
+        each stream otherwise.
+        """
+        with self.lock:
+            if self.is_terminal:
+                self.paint()
+                return
+
+            for progress in self.progress.values():
+                self.stream.write("%s: %s\n" % (progress.label, progress.transfer_summary()))
+            self.stream.flush()
+
+
+class JsonProgress(ProgressBoard):
+    """
+    Writes a JSON object per line each time the status of a stream or one of
+    its layers changes, and at most every `interval` seconds while a layer
+    downloads, with the layer's transfer rate and estimated time left. On
+    closing, a summary of each stream is written.
+    """
+    def __init__(self, stream, interval=JSON_PROGRESS_INTERVAL, clock=time.time):
+        super(JsonProgress, self).__init__(stream, clock=clock, is_terminal=False)
+        self.interval = interval
+        self.last_reports = {}
+
+    def show(self, progress, event, status_changed, state_changed):
+        image_id = event.get('id')
+
+        if is_progress_event(event) and image_id:
+            key = (progress.label, image_id)
+            now = self.clock()
+            last_report = self.last_reports.get(key)
+            if not state_changed and last_report is not None and now - last_report < self.interval:
+                return
+            self.last_reports[key] = now
+            self.write(progress.layer_report(image_id))
+        elif status_changed:
+            self.write({'service': progress.label, 'status': progress.status})
+
+    def close(self):
+        with self.lock:
+            for progress in self.progress.values():
+                self.write(dict(progress.transfer_report(), summary=True))
+
+    def write(self, obj):
+        self.stream.write(json.dumps(obj, sort_keys=True) + "\n")
+        self.stream.flush()
+
+
+class QuietProgress(ProgressBoard):
+    """
+    Shows nothing, though errors are still raised by `consume()`.
+    """
+    def __init__(self):
+        super(QuietProgress, self).__init__(None, is_terminal=False)
+
+    def show(self, progress, event, status_changed, state_changed):
+        pass
+
+    def close(self):
+        pass
+
+
+def build_progress(mode, stream, detail=False):
+    """
+    Return the ProgressBoard for a `--progress` mode: `json`, `quiet`,
+    `plain`, or `tty` for a board redrawn in place if `stream` is a
+    terminal.
+    """
+    if mode == 'json':
+        return JsonProgress(stream)
+    if mode == 'quiet':
+        return QuietProgress()
+    if mode == 'plain':
+        return ProgressBoard(stream, detail=detail, is_terminal=False)
+    if mode == 'tty':
+        return ProgressBoard(stream, detail=detail)
+    raise ValueError("Unknown progress mode: %s" % mode)
+
+
+class StreamProgress(object):
+    """
+    The state of one stream on a `ProgressBoard`.
+    """
+    def __init__(self, label, clock=time.time):
+        self.label = label
+        self.clock = clock
+        self.status = 'Waiting'
+        self.layers = OrderedDict()
+        self.downloaded = {}
+        self.sizes = {}
+        self.download_started = {}
+        self.started = None
+        self.finished = None
+
+    def update(self, event):
+        """
+        Apply an event, and return True if it changed the status of the
+        stream or of one of its layers.
+        """
+        now = self.clock()
+        if self.started is None:
+            self.started = now
+        self.finished = now
+
+        image_id = event.get('id')
+
+        if is_progress_event(event) and image_id:
+            previous = self.layers.get(image_id)
+            self.layers[image_id] = event
+            detail = event.get('progressDetail') or {}
+            if event.get('status') == 'Downloading' and 'total' in detail:
+                self.download_started.setdefault(image_id, now)
+                self.sizes[image_id] = detail['total']
+                self.downloaded[image_id] = detail.get('current', 0)
+            elif event.get('status') == 'Download complete' and image_id in self.sizes:
+                self.downloaded[image_id] = self.sizes[image_id]
+            return previous is None or previous.get('status') != event.get('status')
+
+        status = self.status
+        if 'stream' in event:
+            line = event['stream'].strip()
+            if line:
+                self.status = line
+        elif 'status' in event:
+            self.status = event['status']
+        return self.status != status
+
+    @property
+    def bytes_downloaded(self):
+        return sum(self.downloaded.values())
+
+    @property
+    def bytes_total(self):
+        return sum(self.sizes.values())
+
+    def summary(self):
+        summary = "%s: %s" % (self.label, self.status)
+        if self.layers:
+            complete = sum(
+                1 for event in self.layers.values()
+                if event.get('status') in COMPLETE_STATUSES)
+            summary += " (%d/%d layers" % (complete, len(self.layers))
+            if self.sizes:
+                summary += ", %s/%s" % (
+                    format_bytes(self.bytes_downloaded),
+                    format_bytes(self.bytes_total))
+            summary += ")"
+        return summary
+
+    def layer_report(self, image_id):
+        """
+        Return a dict describing a layer's progress, with its transfer rate
+        in bytes per second and the estimated seconds left while it's being
+        downloaded.
+        """
+        event = self.layers[image_id]
+        report = {
+            'service': self.label,
+            'layer': image_id,
+            'status': event.get('status', ''),
+        }
+
+        detail = event.get('progressDetail') or {}
+        if 'current' in detail:
+            report['current'] = detail['current']
+            report['total'] = detail.get('total')
+
+        if image_id in self.download_started:
+            downloaded = self.downloaded[image_id]
+            elapsed = self.clock() - self.download_started[image_id]
+            rate = downloaded / elapsed if elapsed > 0 else None
+            report['rate'] = rate
+            report['eta'] = (self.sizes[image_id] - downloaded) / rate if rate else None
+
+        return report
+
+    def transfer_report(self):
+        """
+        Return a dict of the bytes downloaded by the stream, the seconds it
+        took and the resulting throughput in bytes per second.
+        """
+        elapsed = self.finished - self.started if self.started is not None else 0
+        return {
+            'service': self.label,
+            'bytes': self.bytes_downloaded,
+            'time': elapsed,
+            'rate': self.bytes_downloaded / elapsed if elapsed > 0 else None,
+        }
+
+    def transfer_summary(self):
+        report = self.transfer_report()
+        summary = "%s in %.1fs" % (format_bytes(report['bytes']), report['time'])
+        if report['rate']:
+            summary += " (%s/s)" % format_bytes(report['rate'])
+        return summary
+
+    def layer_lines(self):
+        for image_id, event in self.layers.items():
+            line = "%s: %s" % (image_id, event.get('status', ''))
+            detail = event.get('progressDetail') or {}
+            if detail.get('total'):
+                line += " (%.1f%%)" % (float(detail['current']) / float(detail['total']) * 100)
+            yield line
+
+
+def format_bytes(count):
+    """
+    Format a number of bytes with the decimal units the Docker daemon uses.
+    """
+    count = float(count)
+    for unit in ('B', 'kB', 'MB', 'GB'):
+        if count < 1000:
+            break
+        count /= 1000
+    else:
+        unit = 'TB'
+    return "%.1f %s" % (count, unit)
+
+
+class LastEvent(object):
+    """
+    A `consume_output()` callback which keeps the last event.
+    """
+    def __init__(self):
+        self.event = None
+
+    def __call__(self, event):
+        self.event = event
+
+
+class BuiltImageId(object):
+    """
+    A `consume_output()` callback which captures the ID of the image from a
+    build's "Successfully built" message.
+    """
+    def __init__(self):
+        self.image_id = None
+
+    def __call__(self, event):
+        match = re.search(r'Successfully built ([0-9a-f]+)', event.get('stream', ''))
+        if match:
+            self.image_id = match.group(1)
+
+
+class DownloadedBytes(object):
+    """
+    A `consume_output()` callback which counts the bytes of layers downloaded
+    by a pull.
+    """
+    def __init__(self):
+        self.layers = {}
+        self.sizes = {}
+
+    def __call__(self, event):
+        layer = event.get('id')
+        detail = event.get('progressDetail') or {}
+        if event.get('status') == 'Downloading' and layer:
+            self.layers[layer] = detail.get('current', 0)
+            if detail.get('total'):
+                self.sizes[layer] = detail['total']
+        elif event.get('status') == 'Download complete' and layer in self.sizes:
+            self.layers[layer] = self.sizes[layer]
+
+    @property
+    def bytes(self):
+        return sum(self.layers.values())
 
 
 def print_output_event(event, stream, is_terminal):
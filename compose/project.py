@@ -1,14 +1,18 @@
 from __future__ import unicode_literals
 from __future__ import absolute_import
 import logging
+import threading
 from functools import reduce
 
 from docker.errors import APIError
 
 from .config import get_service_name_from_net, ConfigurationError
 from .const import LABEL_PROJECT, LABEL_SERVICE, LABEL_ONE_OFF
-from .service import Service, check_for_legacy_containers
-from .container import Container
+from .service import Service, check_for_legacy_containers, group_by_image
+from .container import Container, is_pooled
+from .prefetch import ImagePrefetcher
+from .trace import traced
+from .utils import run_concurrently
 
 log = logging.getLogger(__name__)
 
@@ -61,6 +65,7 @@ class Project(object):
         self.name = name
         self.services = services
         self.client = client
+        self.external_containers = ExternalContainerResolver(client)
 
     def labels(self, one_off=False):
         return [
@@ -151,11 +156,10 @@ class Project(object):
                     service = self.get_service(volume_name)
                     volumes_from.append(service)
                 except NoSuchService:
-                    try:
-                        container = Container.from_id(self.client, volume_name)
-                        volumes_from.append(container)
-                    except APIError:
-                        raise ConfigurationError('Service "%s" mounts volumes from "%s", which is not the name of a service or container.' % (service_dict['name'], volume_name))
+                    volumes_from.append(ExternalContainer(
+                        self.external_containers,
+                        volume_name,
+                        'Service "%s" mounts volumes from "%s", which is not the name of a service or container.' % (service_dict['name'], volume_name)))
             del service_dict['volumes_from']
         return volumes_from
 
@@ -167,10 +171,10 @@ class Project(object):
                 try:
                     net = self.get_service(net_name)
                 except NoSuchService:
-                    try:
-                        net = Container.from_id(self.client, net_name)
-                    except APIError:
-                        raise ConfigurationError('Serivce "%s" is trying to use the network of "%s", which is not the name of a service or container.' % (service_dict['name'], net_name))
+                    net = ExternalContainer(
+                        self.external_containers,
+                        net_name,
+                        'Serivce "%s" is trying to use the network of "%s", which is not the name of a service or container.' % (service_dict['name'], net_name))
             else:
                 net = service_dict['net']
 
@@ -197,20 +201,49 @@ class Project(object):
         for service in self.get_services(service_names):
             service.restart(**options)
 
-    def build(self, service_names=None, no_cache=False):
+    @traced('project')
+    def build(self, service_names=None, no_cache=False, parallel=False, progress=None, build_cache=None,
+              pull=False):
+        """
+        Build the services' images, concurrently if `parallel` is true.
+        Output is shown on `progress`, a `ProgressBoard`, if given, and
+        images are loaded from and saved to `build_cache`, an `ImageCache`.
+        If `pull` is true, images are built even if they're up-to-date.
+        """
+        services = []
         for service in self.get_services(service_names):
             if service.can_be_built():
-                service.build(no_cache)
+                services.append(service)
             else:
                 log.info('%s uses an image, skipping' % service.name)
 
+        def build(service):
+            # Builds may run at once, so the client is closed after all of them
+            service.build(no_cache, progress=progress, build_cache=build_cache, pull=pull, close_client=False)
+
+        try:
+            if parallel:
+                run_concurrently(build, services)
+            else:
+                for service in services:
+                    build(service)
+        finally:
+            # Ensure the HTTP connections are not reused for another
+            # streaming command, as the Docker daemon can sometimes
+            # complain about it
+            self.client.close()
+
+    @traced('project')
     def up(self,
            service_names=None,
            start_deps=True,
            allow_recreate=True,
            smart_recreate=False,
            insecure_registry=False,
-           do_build=True):
+           do_build=True,
+           progress=None,
+           build_cache=None,
+           prefetch=True):
 
         services = self.get_services(service_names, include_deps=start_deps)
 
@@ -220,15 +253,54 @@ class Project(object):
             smart_recreate=smart_recreate,
         )
 
-        return [
-            container
-            for service in services
-            for container in service.execute_convergence_plan(
-                plans[service.name],
+        # Fail before creating anything if a container to be created refers
+        # to an external container which doesn't exist
+        self.check_external_containers([
+            service for service in services
+            if plans[service.name].action in ('create', 'recreate')
+        ])
+
+        # Pull the images which will be needed while earlier services converge
+        to_prefetch = [
+            service for service in services
+            if plans[service.name].action in ('create', 'recreate')
+            and not service.can_be_built()
+        ]
+        prefetcher = None
+        if prefetch and to_prefetch:
+            prefetcher = ImagePrefetcher(
+                to_prefetch,
                 insecure_registry=insecure_registry,
-                do_build=do_build,
+                progress=progress,
             )
-        ]
+
+        containers = []
+        try:
+            for service in services:
+                if prefetcher is not None:
+                    prefetcher.wait(service)
+                containers.extend(service.execute_convergence_plan(
+                    plans[service.name],
+                    insecure_registry=insecure_registry,
+                    do_build=do_build,
+                    progress=progress,
+                    build_cache=build_cache,
+                ))
+        finally:
+            if prefetcher is not None:
+                prefetcher.close()
+
+        return containers
+
+    def check_external_containers(self, services):
+        """
+        Check that the containers outside the project which `services` use
+        the volumes or network of exist, raising ConfigurationError if not.
+        """
+        for service in services:
+            for source in service.volumes_from + [service.net]:
+                if isinstance(source, ExternalContainer):
+                    source.id
 
     def _get_convergence_plans(self,
                                services,
@@ -261,9 +333,26 @@ class Project(object):
 
         return plans
 
-    def pull(self, service_names=None, insecure_registry=False):
-        for service in self.get_services(service_names, include_deps=True):
-            service.pull(insecure_registry=insecure_registry)
+    @traced('project')
+    def pull(self, service_names=None, insecure_registry=False, parallel=False, progress=None):
+        """
+        Pull the services' images, concurrently if `parallel` is true.
+        Output is shown on `progress`, a `ProgressBoard`, if given. An image
+        used by several services is pulled once, for the first of them.
+        """
+        services = [
+            group[0] for group in
+            group_by_image(self.get_services(service_names, include_deps=True)).values()
+        ]
+
+        def pull(service):
+            service.pull(insecure_registry=insecure_registry, progress=progress)
+
+        if parallel:
+            run_concurrently(pull, services)
+        else:
+            for service in services:
+                pull(service)
 
     def remove_stopped(self, service_names=None, **options):
         for service in self.get_services(service_names):
@@ -274,7 +363,8 @@ class Project(object):
             Container.from_ps(self.client, container)
             for container in self.client.containers(
                 all=stopped,
-                filters={'label': self.labels(one_off=one_off)})]
+                filters={'label': self.labels(one_off=one_off)})
+            if not is_pooled(container)]
 
         def matches_service_names(container):
             if not service_names:
@@ -306,6 +396,56 @@ class Project(object):
         return acc + dep_services
 
 
+class ExternalContainer(object):
+    """
+    A container outside the project, referred to by name or ID, which a
+    service uses the volumes or network of. It's only looked up when its ID
+    is needed, so commands which don't create containers don't pay for it.
+    """
+    def __init__(self, resolver, reference, error):
+        self.resolver = resolver
+        self.reference = reference
+        self.error = error
+
+    @property
+    def id(self):
+        return self.resolver.resolve(self.reference, self.error)
+
+
+class ExternalContainerResolver(object):
+    """
+    Looks up the IDs of external containers. The first lookup lists every
+    container once, which resolves references by full name or ID; anything
+    else, such as a partial ID, is inspected.
+    """
+    def __init__(self, client):
+        self.client = client
+        self.ids = None
+        # Services may be converged concurrently
+        self.lock = threading.Lock()
+
+    def resolve(self, reference, error):
+        """
+        Return the ID of the container `reference` refers to, or raise
+        ConfigurationError with `error` if there isn't one.
+        """
+        with self.lock:
+            if self.ids is None:
+                self.ids = {}
+                for container in self.client.containers(all=True):
+                    self.ids[container['Id']] = container['Id']
+                    for name in container.get('Names') or []:
+                        self.ids[name[1:]] = container['Id']
+
+            if reference not in self.ids:
+                try:
+                    self.ids[reference] = Container.from_id(self.client, reference).id
+                except APIError:
+                    raise ConfigurationError(error)
+
+            return self.ids[reference]
+
+
 class NoSuchService(Exception):
     def __init__(self, name):
         self.name = name
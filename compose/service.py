@@ -1,9 +1,10 @@
 from __future__ import unicode_literals
 from __future__ import absolute_import
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 import logging
 import re
 import sys
+import tarfile
 from operator import attrgetter
 
 import six
@@ -11,6 +12,7 @@ from docker.errors import APIError
 from docker.utils import create_host_config, LogConfig
 
 from . import __version__
+from . import trace
 from .config import DOCKER_CONFIG_KEYS, merge_environment
 from .const import (
     LABEL_CONTAINER_NUMBER,
@@ -20,9 +22,17 @@ from .const import (
     LABEL_VERSION,
     LABEL_CONFIG_HASH,
 )
-from .container import Container, get_container_name
-from .progress_stream import stream_output, StreamOutputError
-from .utils import json_hash
+from .build_context import BuildCache, ContextPacker, build_context_digest, dockerfile_base_image
+from .container import Container, get_container_name, is_pooled
+from .progress_stream import (
+    BuiltImageId,
+    DownloadedBytes,
+    LastEvent,
+    StreamOutputError,
+    consume_output,
+    format_bytes,
+)
+from .utils import is_local_daemon, json_hash
 
 log = logging.getLogger(__name__)
 
@@ -101,7 +111,8 @@ class Service(object):
             Container.from_ps(self.client, container)
             for container in self.client.containers(
                 all=stopped,
-                filters={'label': self.labels(one_off=one_off)})]
+                filters={'label': self.labels(one_off=one_off)})
+            if not is_pooled(container)]
 
         if not containers:
             check_for_legacy_containers(
@@ -192,12 +203,15 @@ class Service(object):
                 log.info("Removing %s..." % c.name)
                 c.remove(**options)
 
+    @trace.traced('service')
     def create_container(self,
                          one_off=False,
                          insecure_registry=False,
                          do_build=True,
                          previous_container=None,
                          number=None,
+                         progress=None,
+                         build_cache=None,
                          **override_options):
         """
         Create a container for this service. If the image doesn't exist, attempt to pull
@@ -206,6 +220,8 @@ class Service(object):
         self.ensure_image_exists(
             do_build=do_build,
             insecure_registry=insecure_registry,
+            progress=progress,
+            build_cache=build_cache,
         )
 
         container_options = self._get_container_create_options(
@@ -220,20 +236,23 @@ class Service(object):
 
         return Container.create(self.client, **container_options)
 
+    @trace.traced('service')
     def ensure_image_exists(self,
                             do_build=True,
-                            insecure_registry=False):
+                            insecure_registry=False,
+                            progress=None,
+                            build_cache=None):
 
         if self.image():
             return
 
         if self.can_be_built():
             if do_build:
-                self.build()
+                self.build(progress=progress, build_cache=build_cache)
             else:
                 raise NeedsBuildError(self)
         else:
-            self.pull(insecure_registry=insecure_registry)
+            self.pull(insecure_registry=insecure_registry, progress=progress)
 
     def image(self):
         try:
@@ -271,6 +290,7 @@ class Service(object):
             do_build=do_build,
         )
 
+    @trace.traced('service')
     def convergence_plan(self,
                          allow_recreate=True,
                          smart_recreate=False):
@@ -315,13 +335,37 @@ class Service(object):
     def execute_convergence_plan(self,
                                  plan,
                                  insecure_registry=False,
-                                 do_build=True):
+                                 do_build=True,
+                                 progress=None,
+                                 build_cache=None):
+        (action, _) = plan
+
+        with trace.span('execute_convergence_plan', 'service', name=self.name, action=action) as span:
+            containers = self._execute_convergence_plan(
+                plan,
+                insecure_registry=insecure_registry,
+                do_build=do_build,
+                progress=progress,
+                build_cache=build_cache,
+            )
+            span.set('containers', len(containers))
+
+        return containers
+
+    def _execute_convergence_plan(self,
+                                  plan,
+                                  insecure_registry=False,
+                                  do_build=True,
+                                  progress=None,
+                                  build_cache=None):
         (action, containers) = plan
 
         if action == 'create':
             container = self.create_container(
                 insecure_registry=insecure_registry,
                 do_build=do_build,
+                progress=progress,
+                build_cache=build_cache,
             )
             self.start_container(container)
 
@@ -332,6 +376,7 @@ class Service(object):
                 self.recreate_container(
                     c,
                     insecure_registry=insecure_registry,
+                    progress=progress,
                 )
                 for c in containers
             ]
@@ -351,9 +396,11 @@ class Service(object):
         else:
             raise Exception("Invalid action: {}".format(action))
 
+    @trace.traced('service')
     def recreate_container(self,
                            container,
-                           insecure_registry=False):
+                           insecure_registry=False,
+                           progress=None):
         """Recreate a container.
 
         The original container is renamed to a temporary name so that data
@@ -362,7 +409,8 @@ class Service(object):
         """
         log.info("Recreating %s..." % container.name)
         try:
-            container.stop()
+            with trace.span('stop_container', 'service', name=self.name):
+                container.stop()
         except APIError as e:
             if (e.response.status_code == 500
                     and e.explanation
@@ -380,6 +428,7 @@ class Service(object):
             insecure_registry=insecure_registry,
             do_build=False,
             previous_container=container,
+            progress=progress,
             number=container.labels.get(LABEL_CONTAINER_NUMBER),
         )
         self.start_container(new_container)
@@ -393,6 +442,7 @@ class Service(object):
             log.info("Starting %s..." % container.name)
             return self.start_container(container)
 
+    @trace.traced('service')
     def start_container(self, container):
         container.start()
         return container
@@ -451,6 +501,7 @@ class Service(object):
             for container in self.client.containers(
                 all=True,
                 filters={'label': self.labels(one_off=one_off)})
+            if not is_pooled(container)
         ]
         return 1 if not numbers else max(numbers) + 1
 
@@ -484,7 +535,8 @@ class Service(object):
                 else:
                     volumes_from.extend(map(attrgetter('id'), containers))
 
-            elif isinstance(volume_source, Container):
+            else:
+                # A Container, or an external container from Project
                 volumes_from.append(volume_source.id)
 
         return volumes_from
@@ -501,10 +553,11 @@ class Service(object):
                 log.warning("Warning: Service %s is trying to use reuse the network stack "
                             "of another service that is not running." % (self.net.name))
                 net = None
-        elif isinstance(self.net, Container):
-            net = 'container:' + self.net.id
-        else:
+        elif isinstance(self.net, six.string_types):
             net = self.net
+        else:
+            # A Container, or an external container from Project
+            net = 'container:' + self.net.id
 
         return net
 
@@ -636,13 +689,60 @@ class Service(object):
             security_opt=security_opt
         )
 
-    def build(self, no_cache=False):
-        log.info('Building %s...' % self.name)
+    @trace.traced('service')
+    def build(self, no_cache=False, progress=None, build_cache=None, pull=False, close_client=True):
+        """
+        Build the service's image and return its ID. Output is written to
+        stdout, or shown on `progress`, a `ProgressBoard`, if given.
+
+        The build is skipped if the image was last built from the same
+        context and base image. If `build_cache`, an `ImageCache`, is given,
+        an image built from the same context and base image is loaded from it
+        instead of building, and the built image is saved to it. If `pull` is
+        true, the image is built regardless, which pulls any newer base image.
+
+        Once built, the client's connections are closed unless `close_client`
+        is false, for callers building with a client shared between threads,
+        which close it themselves.
+        """
+        digest = None
+        if not no_cache or build_cache is not None:
+            digest = self._build_digest()
+
+        if not no_cache and not pull:
+            image_id = self._unchanged_image_id(digest)
+            if image_id is not None:
+                if progress is None:
+                    log.info('%s is up-to-date, skipping build (use --pull to check for a newer base image)' %
+                             self.name)
+                else:
+                    progress.update(self.name, {'status': 'Up-to-date'})
+                return image_id
 
-        path = six.binary_type(self.options['build'])
+            image_id = self._load_cached_image(build_cache, digest)
+            if image_id is not None:
+                if progress is None:
+                    log.info('Loaded %s from the build cache' % self.name)
+                else:
+                    progress.update(self.name, {'status': 'Loaded from the build cache'})
+                BuildCache().record(self.image_name, digest, image_id)
+                return image_id
+
+        if progress is None:
+            log.info('Building %s...' % self.name)
+        else:
+            progress.update(self.name, {'status': 'Building'})
+
+        context = ContextPacker(
+            self.options['build'],
+            dockerfile=self.options.get('dockerfile'),
+            compress=not is_local_daemon(self.client),
+        )
 
         build_output = self.client.build(
-            path=path,
+            fileobj=iter(context),
+            custom_context=True,
+            encoding=context.encoding,
             tag=self.image_name,
             stream=True,
             rm=True,
@@ -650,28 +750,92 @@ class Service(object):
             dockerfile=self.options.get('dockerfile', None),
         )
 
+        built_image_id = BuiltImageId()
+        last_event = LastEvent()
+
         try:
-            all_events = stream_output(build_output, sys.stdout)
+            if progress is None:
+                consume_output(build_output, sys.stdout, built_image_id, last_event)
+            else:
+                progress.consume(self.name, build_output, built_image_id, last_event)
         except StreamOutputError as e:
             raise BuildError(self, unicode(e))
 
-        # Ensure the HTTP connection is not reused for another
-        # streaming command, as the Docker daemon can sometimes
-        # complain about it
-        self.client.close()
+        if close_client:
+            # Ensure the HTTP connection is not reused for another
+            # streaming command, as the Docker daemon can sometimes
+            # complain about it
+            self.client.close()
+
+        if context.elapsed is not None and progress is None:
+            log.info('Sent build context for %s: %s (%s sent) in %.1fs' % (
+                self.name, format_bytes(context.size), format_bytes(context.sent), context.elapsed))
+
+        if built_image_id.image_id is None:
+            raise BuildError(self, last_event.event or 'Unknown')
+
+        if digest is not None:
+            BuildCache().record(self.image_name, digest, built_image_id.image_id)
+            self._save_cached_image(build_cache, digest)
 
-        image_id = None
+        return built_image_id.image_id
 
-        for event in all_events:
-            if 'stream' in event:
-                match = re.search(r'Successfully built ([0-9a-f]+)', event.get('stream', ''))
-                if match:
-                    image_id = match.group(1)
+    def _load_cached_image(self, build_cache, digest):
+        if build_cache is None or digest is None:
+            return None
+        try:
+            return build_cache.load(self.client, digest, self.image_name)
+        except (APIError, EnvironmentError, ValueError, tarfile.TarError) as e:
+            log.warn("Couldn't load %s from the build cache: %s" % (self.name, e))
+            return None
+
+    def _save_cached_image(self, build_cache, digest):
+        if build_cache is None:
+            return
+        try:
+            build_cache.save(self.client, digest, self.image_name)
+        except (APIError, EnvironmentError) as e:
+            log.warn("Couldn't save %s to the build cache: %s" % (self.name, e))
+
+    def _build_digest(self):
+        """
+        Return a digest of the build context and the ID of the local base
+        image it's built from, or None if either can't be found.
+        """
+        digest = build_context_digest(self.options['build'], self.options.get('dockerfile'))
+        if digest is None:
+            return None
+
+        base_image = dockerfile_base_image(self.options['build'], self.options.get('dockerfile'))
+        if base_image is None:
+            return None
+
+        if base_image == 'scratch':
+            base_image_id = base_image
+        else:
+            try:
+                base_image_id = self.client.inspect_image(base_image)['Id']
+            except APIError:
+                return None
+
+        return json_hash({'context': digest, 'base_image': base_image_id})
+
+    def _unchanged_image_id(self, digest):
+        """
+        Return the ID of the service's image if it was built from a context
+        with `digest` and is still tagged with the service's image name.
+        """
+        if digest is None:
+            return None
 
+        image_id = BuildCache().get(self.image_name, digest)
         if image_id is None:
-            raise BuildError(self, event if all_events else 'Unknown')
+            return None
 
-        return image_id
+        image = self.image()
+        if image is None or not image['Id'].startswith(image_id):
+            return None
+        return image['Id']
 
     def can_be_built(self):
         return 'build' in self.options
@@ -696,19 +860,34 @@ class Service(object):
                 return False
         return True
 
-    def pull(self, insecure_registry=False):
+    @trace.traced('service')
+    def pull(self, insecure_registry=False, progress=None):
+        """
+        Pull the service's image. Output is written to stdout, or shown on
+        `progress`, a `ProgressBoard`, if given.
+        """
         if 'image' not in self.options:
             return
 
         repo, tag = parse_repository_tag(self.options['image'])
         tag = tag or 'latest'
-        log.info('Pulling %s (%s:%s)...' % (self.name, repo, tag))
+        if progress is None:
+            log.info('Pulling %s (%s:%s)...' % (self.name, repo, tag))
+        else:
+            progress.update(self.name, {'status': 'Pulling %s:%s' % (repo, tag)})
+
         output = self.client.pull(
             repo,
             tag=tag,
             stream=True,
             insecure_registry=insecure_registry)
-        stream_output(output, sys.stdout)
+
+        downloaded = DownloadedBytes()
+        if progress is None:
+            consume_output(output, sys.stdout, downloaded)
+        else:
+            progress.consume(self.name, output, downloaded)
+        trace.count('pull_bytes', downloaded.bytes)
 
 
 def get_container_data_volumes(container, volumes_option):
@@ -831,6 +1010,20 @@ def parse_volume_spec(volume_config):
     return VolumeSpec(external, internal, mode)
 
 
+def group_by_image(services):
+    """
+    Return an OrderedDict of the services which use an image rather than
+    building one, in order, grouped by the (repository, tag) they pull.
+    """
+    groups = OrderedDict()
+    for service in services:
+        if 'image' not in service.options:
+            continue
+        repo, tag = parse_repository_tag(service.options['image'])
+        groups.setdefault((repo, tag or 'latest'), []).append(service)
+    return groups
+
+
 def parse_repository_tag(s):
     if ":" not in s:
         return s, ""
@@ -0,0 +1,229 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import logging
+import re
+import threading
+
+from docker.errors import APIError
+
+from .const import LABEL_ONE_OFF, LABEL_PROJECT, LABEL_SERVICE
+from .container import Container, get_container_name
+from .utils import json_stream
+
+log = logging.getLogger(__name__)
+
+# Seconds to wait before subscribing to events again once the stream breaks
+RESUBSCRIBE_INTERVAL = 1
+
+# Events which change the state of a container. Events about images are
+# ignored.
+CONTAINER_EVENTS = (
+    'create', 'start', 'restart', 'die', 'kill', 'stop', 'oom',
+    'pause', 'unpause', 'rename', 'destroy',
+)
+
+EXITED_STATUS = re.compile(r'^Exited \((-?\d+)\)')
+
+# The start of the zero time the daemon reports for a container never started
+NEVER = '0001-01-01'
+
+
+class ContainerStates(object):
+    """
+    The state of each container of a project, kept in memory and up to date
+    by a background thread reading the daemon's event stream, so that long
+    running commands can answer `containers()`, `is_running()` and
+    `wait()` without asking the daemon each time.
+
+    The daemon can't filter events by label, so the thread inspects each
+    container an event is about, once for containers of other projects and
+    on every event for the project's own. Whenever the stream breaks, the
+    thread subscribes again and lists the project's containers to catch up;
+    until then, queries go to the daemon.
+    """
+    def __init__(self, client, project, resubscribe_interval=RESUBSCRIBE_INTERVAL):
+        self.client = client
+        self.project = project
+        self.resubscribe_interval = resubscribe_interval
+        self.entries = {}
+        self.ignored = set()
+        self.synced = False
+        self.changed = threading.Condition()
+        self.stopped = threading.Event()
+        self.attempted = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """
+        Start watching events, and return once the first attempt to sync has
+        finished, so that queries made straight away can be answered from
+        memory.
+        """
+        self.thread = threading.Thread(target=self._watch)
+        self.thread.daemon = True
+        self.thread.start()
+        # Wait with a timeout so that KeyboardInterrupt is still delivered
+        while not self.attempted.wait(0.1) and self.thread.is_alive():
+            pass
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        with self.changed:
+            self.changed.notify_all()
+
+    def _watch(self):
+        while not self.stopped.is_set():
+            try:
+                # Subscribe before listing, so no event is missed in between
+                events = json_stream(self.client.events())
+                self.resync()
+                self.attempted.set()
+                for event in events:
+                    if self.stopped.is_set():
+                        return
+                    self.handle(event)
+            except Exception as e:
+                log.debug("Lost the event stream of %s: %s", self.project, e)
+
+            with self.changed:
+                self.synced = False
+            self.attempted.set()
+            self.stopped.wait(self.resubscribe_interval)
+
+    def resync(self):
+        entries = self._list()
+        with self.changed:
+            self.entries = entries
+            self.synced = True
+            self.changed.notify_all()
+
+    def handle(self, event):
+        container_id = event.get('id')
+        if event.get('status') not in CONTAINER_EVENTS or container_id in self.ignored:
+            return
+
+        entry = None
+        if event['status'] != 'destroy':
+            try:
+                entry = entry_from_inspect(self.client.inspect_container(container_id))
+            except APIError as e:
+                log.debug("Couldn't inspect %s: %s", container_id, e)
+
+        if entry is not None and entry['labels'].get(LABEL_PROJECT) != self.project:
+            self.ignored.add(container_id)
+            return
+
+        with self.changed:
+            if entry is None:
+                self.entries.pop(container_id, None)
+            else:
+                self.entries[container_id] = entry
+            self.changed.notify_all()
+
+    def containers(self, service_names=None, stopped=False, one_off=False):
+        """
+        Return the project's containers, as `Project.containers()` does. Their
+        labels are known, so looking up a container's service or number
+        doesn't inspect it.
+        """
+        def matches(entry):
+            labels = entry['labels']
+            if labels.get(LABEL_ONE_OFF) != ('True' if one_off else 'False'):
+                return False
+            if service_names and labels.get(LABEL_SERVICE) not in service_names:
+                return False
+            return stopped or entry['running']
+
+        entries = sorted(self._entries().values(), key=lambda entry: entry['container']['Name'])
+        return [
+            Container(self.client, dict(entry['container'], Config={'Labels': entry['labels']}))
+            for entry in entries
+            if matches(entry)
+        ]
+
+    def is_running(self, container_id):
+        entry = self._entries().get(container_id)
+        return entry is not None and entry['running']
+
+    def exit_code(self, container_id):
+        """
+        Return the exit code of a container which has stopped, or None.
+        """
+        entry = self._entries().get(container_id)
+        if entry is None or entry['running']:
+            return None
+        return entry['exit_code']
+
+    def wait(self, container_id):
+        """
+        Block until a container stops or is removed, and return its exit code,
+        or None if it was removed. Until the states are synced, or once
+        they've been stopped, the daemon is asked instead.
+        """
+        with self.changed:
+            while self.synced and not self.stopped.is_set():
+                entry = self.entries.get(container_id)
+                if entry is None:
+                    return None
+                if not entry['running']:
+                    if entry['exit_code'] is not None:
+                        return entry['exit_code']
+                    # Stopped without an exit code, such as a container
+                    # which was created but never started
+                    break
+                # Wait with a timeout so that KeyboardInterrupt is still delivered
+                self.changed.wait(0.1)
+
+        try:
+            return self.client.wait(container_id)
+        except APIError as e:
+            log.debug("Couldn't wait for %s: %s", container_id, e)
+            return None
+
+    def _entries(self):
+        with self.changed:
+            if self.synced:
+                return dict(self.entries)
+        return self._list()
+
+    def _list(self):
+        return dict(
+            (container['Id'], entry_from_ps(container))
+            for container in self.client.containers(
+                all=True,
+                filters={'label': ['{0}={1}'.format(LABEL_PROJECT, self.project)]})
+        )
+
+
+def entry_from_ps(container):
+    status = container.get('Status') or ''
+    exited = EXITED_STATUS.match(status)
+    return {
+        'container': {
+            'Id': container['Id'],
+            'Image': container['Image'],
+            'Name': '/' + get_container_name(container),
+        },
+        'labels': container.get('Labels') or {},
+        'running': status.startswith('Up'),
+        'exit_code': int(exited.group(1)) if exited else None,
+    }
+
+
+def entry_from_inspect(container):
+    state = container.get('State') or {}
+    running = bool(state.get('Running'))
+    # The daemon reports an exit code of 0 for a container which hasn't run,
+    # and a zero StartedAt, where ps shows no exit code at all
+    started = not (state.get('StartedAt') or NEVER).startswith(NEVER)
+    return {
+        'container': {
+            'Id': container['Id'],
+            'Image': container['Config']['Image'],
+            'Name': container['Name'],
+        },
+        'labels': container['Config'].get('Labels') or {},
+        'running': running,
+        'exit_code': state.get('ExitCode') if started and not running else None,
+    }
@@ -0,0 +1,206 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from contextlib import contextmanager
+import functools
+import json
+import os
+import threading
+import time
+
+_tracer = None
+
+
+class Tracer(object):
+    """
+    Spans recorded while running a command, which can be exported in the
+    Chrome trace event format, as shown by chrome://tracing and Perfetto.
+
+    Tracing is off unless `start()` has been called, and spans cost a single
+    check while it's off.
+    """
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.pid = os.getpid()
+        self.events = []
+        self.threads = {}
+        self.counters = {}
+        self.tags = {}
+        self.lock = threading.Lock()
+
+    def add(self, name, category, start, end, args):
+        thread = threading.current_thread()
+        with self.lock:
+            self.threads[thread.ident] = thread.name
+            self.events.append({
+                'name': name,
+                'cat': category,
+                'ph': 'X',
+                'ts': start * 1e6,
+                'dur': (end - start) * 1e6,
+                'pid': self.pid,
+                'tid': thread.ident,
+                'args': args,
+            })
+
+    def count(self, name, value):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+            self.events.append({
+                'name': name,
+                'ph': 'C',
+                'ts': self.clock() * 1e6,
+                'pid': self.pid,
+                'args': {name: self.counters[name]},
+            })
+
+    def trace(self):
+        """
+        Return the spans recorded so far as a Chrome trace.
+        """
+        with self.lock:
+            thread_names = [
+                {
+                    'name': 'thread_name',
+                    'ph': 'M',
+                    'pid': self.pid,
+                    'tid': ident,
+                    'args': {'name': name},
+                }
+                for ident, name in self.threads.items()
+            ]
+            return {
+                'traceEvents': thread_names + self.events,
+                'displayTimeUnit': 'ms',
+                'otherData': dict(self.tags),
+            }
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.trace(), f)
+
+
+class Span(object):
+    """
+    Times a block of code on a tracer, as a context manager, or between calls
+    to `start()` and `finish()`.
+    """
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.started = None
+
+    def set(self, name, value):
+        self.args[name] = value
+
+    def start(self):
+        self.started = self.tracer.clock()
+
+    def finish(self):
+        self.tracer.add(self.name, self.category, self.started, self.tracer.clock(), self.args)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.finish()
+
+
+class NoSpan(object):
+    def set(self, name, value):
+        pass
+
+    def start(self):
+        pass
+
+    def finish(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        pass
+
+
+NO_SPAN = NoSpan()
+
+
+def start(clock=time.time):
+    """
+    Start recording spans, and return the tracer they're recorded on.
+    """
+    global _tracer
+    _tracer = Tracer(clock)
+    return _tracer
+
+
+def stop():
+    """
+    Stop recording spans, and return the tracer they were recorded on.
+    """
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+@contextmanager
+def recording():
+    """
+    Record spans while the block runs, and yield the tracer they're recorded
+    on: the current one if tracing has already started.
+    """
+    if _tracer is not None:
+        yield _tracer
+        return
+
+    tracer = start()
+    try:
+        yield tracer
+    finally:
+        stop()
+
+
+def enabled():
+    return _tracer is not None
+
+
+def span(span_name, category='compose', **args):
+    if _tracer is None:
+        return NO_SPAN
+    return Span(_tracer, span_name, category, args)
+
+
+def count(name, value):
+    """
+    Add `value` to the counter `name`, while tracing.
+    """
+    if _tracer is not None:
+        _tracer.count(name, value)
+
+
+def tag(name, value):
+    """
+    Record something about the whole command, such as its name, while
+    tracing.
+    """
+    if _tracer is not None:
+        _tracer.tags[name] = value
+
+
+def traced(category):
+    """
+    Decorate a method to record a span named after it whenever it's called
+    while tracing, with the name of the object it's called on.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            if _tracer is None:
+                return func(self, *args, **kwargs)
+            with Span(_tracer, func.__name__, category, {'name': getattr(self, 'name', None)}):
+                return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,5 +1,18 @@
-import json
+import codecs
 import hashlib
+import json
+import re
+import sys
+import threading
+
+import six
+from six.moves.queue import Empty, Queue
+
+# Most items run_concurrently works on at once
+CONCURRENCY = 4
+
+json_decoder = json.JSONDecoder()
+WHITESPACE_RE = re.compile(r'\s*')
 
 
 def json_hash(obj):
@@ -7,3 +20,101 @@ def json_hash(obj):
     h = hashlib.sha256()
     h.update(dump)
     return h.hexdigest()
+
+
+def is_local_daemon(client):
+    """
+    True if `client` talks to the daemon over a unix socket, so it shares
+    this machine's filesystem.
+    """
+    return client.base_url.startswith('http+docker://')
+
+
+def json_stream(stream):
+    """
+    Given a generator which yields chunks of a stream of JSON objects, such
+    as the output of a build or pull, yield each decoded object. Objects may
+    be split across chunks, and a chunk may hold several of them.
+
+    Chunks may be utf-8 encoded bytes or text. Decoding is only attempted
+    once a chunk which could complete an object arrives, so large objects
+    sent in many small chunks aren't decoded over and over.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    buffered = ''
+
+    for chunk in stream:
+        if isinstance(chunk, six.binary_type):
+            chunk = decoder.decode(chunk)
+        buffered += chunk
+        if '}' not in chunk:
+            continue
+
+        objects, buffered = json_split(buffered)
+        for obj in objects:
+            yield obj
+
+    buffered += decoder.decode(b'', final=True)
+    objects, buffered = json_split(buffered)
+    for obj in objects:
+        yield obj
+
+    if buffered:
+        # Incomplete or invalid: let json report where
+        json.loads(buffered)
+
+
+def json_split(buffered):
+    """
+    Decode the complete JSON values at the start of `buffered`. Return a
+    list of them and the rest of the buffer, without leading whitespace.
+    """
+    objects = []
+    index = WHITESPACE_RE.match(buffered).end()
+
+    while index < len(buffered):
+        try:
+            obj, index = json_decoder.raw_decode(buffered, index)
+        except ValueError:
+            break
+        objects.append(obj)
+        index = WHITESPACE_RE.match(buffered, index).end()
+
+    return objects, buffered[index:]
+
+
+def run_concurrently(func, items, workers=CONCURRENCY):
+    """
+    Call `func` with each of `items`, in up to `workers` threads at once,
+    and wait for them all to finish. The first exception raised, if any, is
+    re-raised once every item has been worked on.
+    """
+    errors = []
+    queue = Queue()
+    for item in items:
+        queue.put(item)
+
+    def work():
+        while True:
+            try:
+                item = queue.get_nowait()
+            except Empty:
+                return
+
+            try:
+                func(item)
+            except Exception:
+                errors.append(sys.exc_info())
+
+    threads = [threading.Thread(target=work) for _ in range(min(workers, queue.qsize()))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    for thread in threads:
+        # Join with a timeout so that KeyboardInterrupt is still delivered
+        while thread.is_alive():
+            thread.join(0.1)
+
+    if errors:
+        six.reraise(*errors[0])
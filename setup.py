@@ -62,6 +62,6 @@ setup(
     tests_require=tests_require,
     entry_points="""
     [console_scripts]
-    docker-compose=compose.cli.main:main
+    docker-compose=compose.cli.launcher:main
     """,
 )
@@ -0,0 +1,166 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+
+import mock
+
+from compose import build_context
+from compose.build_context import (
+    BuildCache,
+    ContextPacker,
+    FileDigestCache,
+    context_digest,
+    dockerfile_base_image,
+    walk_context,
+)
+from .. import unittest
+
+
+def write(path, content):
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+class BuildContextTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.context = os.path.join(self.tmpdir, 'context')
+        os.makedirs(os.path.join(self.context, 'src'))
+        os.makedirs(os.path.join(self.context, 'logs'))
+        write(os.path.join(self.context, 'Dockerfile'), 'FROM busybox\n')
+        write(os.path.join(self.context, 'src', 'app.py'), 'print("hi")\n')
+        write(os.path.join(self.context, 'logs', 'debug.log'), 'noise\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_walk_context(self):
+        self.assertEqual(
+            list(walk_context(self.context)),
+            ['Dockerfile', 'logs', 'src', 'logs/debug.log', 'src/app.py'])
+
+    def test_walk_context_with_exclude(self):
+        self.assertEqual(
+            list(walk_context(self.context, ['logs', '*.py'])),
+            ['Dockerfile', 'src'])
+
+    def test_digest_changes_with_content(self):
+        digest = context_digest(self.context)
+        self.assertEqual(context_digest(self.context), digest)
+
+        write(os.path.join(self.context, 'src', 'app.py'), 'print("bye")\n')
+        self.assertNotEqual(context_digest(self.context), digest)
+
+    def test_dockerfile_base_image(self):
+        self.assertEqual(dockerfile_base_image(self.context), 'busybox')
+
+        write(os.path.join(self.context, 'Dockerfile.dev'), '# dev\n  from python:2.7 \nRUN true\n')
+        self.assertEqual(dockerfile_base_image(self.context, 'Dockerfile.dev'), 'python:2.7')
+        self.assertIsNone(dockerfile_base_image(self.context, 'Dockerfile.missing'))
+
+    def test_digest_changes_with_dockerfile_name(self):
+        self.assertNotEqual(context_digest(self.context), context_digest(self.context, 'Dockerfile.dev'))
+
+    def test_digest_ignores_dockerignored_files(self):
+        write(os.path.join(self.context, '.dockerignore'), 'logs\nDockerfile\n')
+        digest = context_digest(self.context)
+
+        write(os.path.join(self.context, 'logs', 'debug.log'), 'more noise\n')
+        self.assertEqual(context_digest(self.context), digest)
+
+        write(os.path.join(self.context, 'Dockerfile'), 'FROM ubuntu\n')
+        self.assertNotEqual(context_digest(self.context), digest)
+
+    def test_file_digest_cache(self):
+        cache_path = os.path.join(self.tmpdir, 'cache', 'context.json')
+        cache = FileDigestCache(cache_path)
+        digest = context_digest(self.context, cache=cache)
+        cache.save()
+
+        cache = FileDigestCache(cache_path)
+        with mock.patch('compose.build_context.file_digest') as mock_file_digest:
+            self.assertEqual(context_digest(self.context, cache=cache), digest)
+        self.assertFalse(mock_file_digest.called)
+
+        os.utime(os.path.join(self.context, 'src', 'app.py'), (0, 0))
+        with mock.patch('compose.build_context.file_digest', return_value='x') as mock_file_digest:
+            context_digest(self.context, cache=cache)
+        mock_file_digest.assert_called_once_with(os.path.join(self.context, 'src', 'app.py'))
+
+    def test_build_cache(self):
+        path = os.path.join(self.tmpdir, 'builds.json')
+        BuildCache(path).record('project_web', 'abc', 'f00')
+
+        cache = BuildCache(path)
+        self.assertEqual(cache.get('project_web', 'abc'), 'f00')
+        self.assertIsNone(cache.get('project_web', 'def'))
+        self.assertIsNone(cache.get('project_db', 'abc'))
+
+    def test_build_context_digest_uses_cache_dir(self):
+        with mock.patch.dict(os.environ, {'XDG_CACHE_HOME': self.tmpdir}):
+            digest = build_context.build_context_digest(self.context)
+
+        self.assertEqual(digest, context_digest(self.context))
+        self.assertEqual(len(os.listdir(os.path.join(self.tmpdir, 'docker-compose', 'contexts'))), 1)
+
+    def test_build_context_digest_of_unreadable_context(self):
+        with mock.patch.dict(os.environ, {'XDG_CACHE_HOME': self.tmpdir}):
+            self.assertIsNone(build_context.build_context_digest(os.path.join(self.tmpdir, 'missing')))
+
+
+class ContextPackerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.context = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.context, 'src'))
+        write(os.path.join(self.context, 'Dockerfile.dev'), 'FROM busybox\n')
+        write(os.path.join(self.context, 'src', 'app.py'), 'x' * 100000)
+        write(os.path.join(self.context, 'debug.log'), 'noise\n')
+        write(os.path.join(self.context, '.dockerignore'), '*.log\nDockerfile.dev\n')
+        os.symlink('src/app.py', os.path.join(self.context, 'app.py'))
+
+    def tearDown(self):
+        shutil.rmtree(self.context)
+
+    def unpack(self, data, mode='r:'):
+        archive = tarfile.open(fileobj=io.BytesIO(data), mode=mode)
+        return dict((member.name, member) for member in archive.getmembers()), archive
+
+    def test_packs_context(self):
+        packer = ContextPacker(self.context, dockerfile='Dockerfile.dev')
+        chunks = list(packer)
+        data = b''.join(chunks)
+
+        members, archive = self.unpack(data)
+        self.assertEqual(
+            sorted(members),
+            ['.dockerignore', 'Dockerfile.dev', 'app.py', 'src', 'src/app.py'])
+        self.assertTrue(members['src'].isdir())
+        self.assertEqual(members['app.py'].linkname, 'src/app.py')
+        self.assertEqual(archive.extractfile('src/app.py').read(), b'x' * 100000)
+
+        self.assertTrue(len(chunks) > 1)
+        self.assertEqual(len(data) % tarfile.RECORDSIZE, 0)
+        self.assertEqual(packer.size, len(data))
+        self.assertEqual(packer.sent, len(data))
+        self.assertIsNotNone(packer.elapsed)
+
+    def test_gzip_compression(self):
+        packer = ContextPacker(self.context, compress=True)
+        data = b''.join(packer)
+
+        members, archive = self.unpack(data, mode='r:gz')
+        self.assertEqual(archive.extractfile('src/app.py').read(), b'x' * 100000)
+        self.assertEqual(packer.encoding, 'gzip')
+        self.assertEqual(packer.sent, len(data))
+        self.assertTrue(packer.sent < packer.size)
+
+    def test_file_which_shrinks_while_packing(self):
+        self.assertEqual(list(build_context.read_padded(os.path.join(self.context, 'debug.log'), 8)), [
+            b'noise\n', b'\0' * 2 + b'\0' * 504,
+        ])
@@ -0,0 +1,115 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import io
+
+import mock
+from docker.errors import APIError
+
+from compose.cli.batch import BatchRunner, JobResult, read_args_file, summarize
+from compose.cli.log_printer import ContainerExit
+from tests import unittest
+
+
+class ListSink(object):
+
+    def __init__(self):
+        self.items = []
+        self.closed = False
+
+    def write(self, item):
+        self.items.append(item)
+
+    def close(self):
+        self.closed = True
+
+
+def fake_container(number, output, exit_code):
+    container = mock.Mock(id='id%d' % number, name_without_project='web_run_%d' % number)
+    container.name = 'project_web_run_%d' % number
+    container.attach.return_value = iter(output)
+    container.wait.return_value = exit_code
+    return container
+
+
+class ReadArgsFileTest(unittest.TestCase):
+
+    def test_splits_lines(self):
+        f = io.StringIO('a b\n\n# comment\n"c d" e\n')
+        self.assertEqual(read_args_file(f), [['a', 'b'], ['c d', 'e']])
+
+
+class BatchRunnerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.service = mock.Mock()
+        self.service._next_container_number.return_value = 4
+        self.sink = ListSink()
+
+    def run_batch(self, commands, containers, **kwargs):
+        self.service.create_container.side_effect = containers
+        runner = BatchRunner(self.service, commands, {'tty': False}, sinks=[self.sink], **kwargs)
+        return runner.run()
+
+    def test_runs_each_command(self):
+        containers = [fake_container(1, [b'one\n'], 0), fake_container(2, [b'two\n'], 3)]
+        results = self.run_batch([['echo', '1'], ['echo', '2']], containers)
+
+        self.assertEqual([r.exit_code for r in results], [0, 3])
+        self.assertEqual(
+            [c[1]['command'] for c in self.service.create_container.call_args_list],
+            [['echo', '1'], ['echo', '2']])
+        self.assertTrue(all(c[1]['one_off'] for c in self.service.create_container.call_args_list))
+        self.assertEqual(
+            [(item.container, item.line) for item in self.sink.items if not isinstance(item, ContainerExit)],
+            [(containers[0], b'one\n'), (containers[1], b'two\n')])
+        self.assertTrue(self.sink.closed)
+
+    def test_runs_commands_in_parallel(self):
+        containers = [fake_container(n, [], 0) for n in range(5)]
+        results = self.run_batch([['true']] * 5, containers, parallel=3)
+        self.assertEqual([r.exit_code for r in results], [0] * 5)
+        self.assertEqual(self.service.start_container.call_count, 5)
+        self.assertEqual(
+            sorted(c[1]['number'] for c in self.service.create_container.call_args_list),
+            [4, 5, 6, 7, 8])
+        self.service._next_container_number.assert_called_once_with(one_off=True)
+
+    def test_api_error_fails_job(self):
+        self.service.create_container.side_effect = APIError('', mock.Mock(), explanation='no such image')
+        runner = BatchRunner(self.service, [['true']], {}, sinks=[self.sink])
+        [result] = runner.run()
+        self.assertEqual(result.exit_code, None)
+        self.assertEqual(result.error, 'no such image')
+
+    def test_other_errors_fail_job(self):
+        container = fake_container(1, [], 0)
+        container.attach.side_effect = IOError('connection reset')
+        [result] = self.run_batch([['true']], [container])
+        self.assertEqual(result.exit_code, None)
+        self.assertEqual(result.error, 'connection reset')
+        self.assertIn('failed to run', summarize([result])[0])
+
+    def test_removes_containers(self):
+        self.run_batch([['true']], [fake_container(1, [], 0)], remove=True)
+        self.service.client.remove_container.assert_called_once_with('id1', force=True)
+
+
+class SummarizeTest(unittest.TestCase):
+
+    def test_all_succeeded(self):
+        summary, exit_code = summarize([JobResult(['a'], None, 0, None)])
+        self.assertEqual(summary, '1 of 1 commands succeeded')
+        self.assertEqual(exit_code, 0)
+
+    def test_lists_failures(self):
+        summary, exit_code = summarize([
+            JobResult(['a'], None, 0, None),
+            JobResult(['b', 'c'], None, 2, None),
+            JobResult(['d'], None, None, 'no such image'),
+        ])
+        self.assertEqual(summary.splitlines(), [
+            '1 of 3 commands succeeded',
+            '  b c exited with code 2',
+            '  d failed to run: no such image',
+        ])
+        self.assertEqual(exit_code, 1)
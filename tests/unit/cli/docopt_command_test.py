@@ -0,0 +1,71 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import os
+import pstats
+import shutil
+import tempfile
+
+import mock
+
+from compose.cli.docopt_command import DocoptCommand
+from tests import unittest
+
+
+class ExampleCommand(DocoptCommand):
+    """Example.
+
+    Usage:
+      example [options] [COMMAND] [ARGS...]
+
+    Options:
+      --profile-python FILE  Profile
+    """
+    def __init__(self):
+        self.calls = []
+
+    def hello(self, options):
+        """
+        Say hello.
+
+        Usage: hello
+        """
+        self.calls.append('hello')
+
+    def bye(self, options):
+        """
+        Say bye.
+
+        Usage: bye
+        """
+        self.calls.append('bye')
+
+
+class ProfilePythonTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'stats')
+        self.command = ExampleCommand()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    @mock.patch('compose.cli.utils.sys.stderr')
+    def test_writes_stats(self, mock_stderr):
+        self.command.dispatch(['--profile-python', self.path, 'hello'], None)
+        self.assertEqual(self.command.calls, ['hello'])
+        stats = pstats.Stats(self.path)
+        self.assertTrue(any(func[2] == 'hello' for func in stats.stats))
+        self.assertTrue(mock_stderr.write.called)
+
+    @mock.patch('compose.cli.utils.sys.stderr')
+    def test_only_listed_commands(self, mock_stderr):
+        with mock.patch.dict(os.environ, {
+            'COMPOSE_PROFILE_PYTHON': self.path,
+            'COMPOSE_PROFILE_PYTHON_COMMANDS': 'hello',
+        }):
+            self.command.dispatch(['bye'], None)
+            self.assertFalse(os.path.exists(self.path))
+            self.command.dispatch(['hello'], None)
+            self.assertTrue(os.path.exists(self.path))
+        self.assertEqual(self.command.calls, ['bye', 'hello'])
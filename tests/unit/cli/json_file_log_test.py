@@ -0,0 +1,105 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import json
+import os
+import shutil
+import tempfile
+
+import mock
+
+from compose.cli.json_file_log import JsonFileLog, read_json_file_log
+from tests import unittest
+
+
+def write_log(path, count):
+    with open(path, 'wb') as f:
+        for i in range(count):
+            entry = {
+                'log': 'line %d\n' % i,
+                'stream': 'stdout',
+                'time': '2015-06-01T12:00:%02d.%dZ' % (i, i),
+            }
+            f.write(json.dumps(entry).encode('utf-8') + b'\n')
+
+
+class JsonFileLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'abc-json.log')
+        write_log(self.path, 50)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_lines(self):
+        lines = list(JsonFileLog(self.path).lines())
+        self.assertEqual(len(lines), 50)
+        self.assertEqual(lines[0], b'line 0\n')
+        self.assertEqual(lines[-1], b'line 49\n')
+
+    def test_tail(self):
+        lines = list(JsonFileLog(self.path).lines(tail=3))
+        self.assertEqual(lines, [b'line 47\n', b'line 48\n', b'line 49\n'])
+
+    def test_tail_longer_than_history(self):
+        lines = list(JsonFileLog(self.path).lines(tail=100))
+        self.assertEqual(len(lines), 50)
+
+    def test_tail_zero(self):
+        self.assertEqual(list(JsonFileLog(self.path).lines(tail=0)), [])
+
+    def test_since_uses_sparse_index(self):
+        log_file = JsonFileLog(self.path, index_interval=200)
+        self.assertTrue(1 < len(log_file.build_index()) < 50)
+
+        lines = list(log_file.lines(since='2015-06-01T12:00:45Z'))
+        self.assertEqual(lines[0], b'line 45\n')
+        self.assertEqual(len(lines), 5)
+
+    def test_since_and_tail(self):
+        lines = list(JsonFileLog(self.path).lines(since='2015-06-01T12:00:10', tail=2))
+        self.assertEqual(lines, [b'line 48\n', b'line 49\n'])
+
+    def test_since_after_last_entry(self):
+        self.assertEqual(list(JsonFileLog(self.path).lines(since='2016-01-01')), [])
+
+    def test_partial_last_line_is_skipped(self):
+        with open(self.path, 'ab') as f:
+            f.write(b'{"log": "half')
+        lines = list(JsonFileLog(self.path).lines())
+        self.assertEqual(len(lines), 50)
+
+    def test_empty_file(self):
+        open(self.path, 'w').close()
+        self.assertEqual(list(JsonFileLog(self.path).lines(tail=5)), [])
+
+
+class ReadJsonFileLogTest(unittest.TestCase):
+
+    def get_container(self, log_path, base_url='http+docker://localunixsocket', log_type='json-file'):
+        container = mock.Mock(log_path=log_path, log_config={'Type': log_type, 'Config': {}})
+        container.client.base_url = base_url
+        return container
+
+    def test_missing_file_falls_back(self):
+        container = self.get_container('/does/not/exist-json.log')
+        self.assertIsNone(read_json_file_log(container))
+
+    def test_remote_daemon_falls_back(self):
+        container = self.get_container(__file__, base_url='https://10.0.0.1:2376')
+        self.assertIsNone(read_json_file_log(container))
+
+    def test_other_log_driver_falls_back(self):
+        container = self.get_container(__file__, log_type='syslog')
+        self.assertIsNone(read_json_file_log(container))
+
+    def test_reads_local_file(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'abc-json.log')
+            write_log(path, 3)
+            lines = read_json_file_log(self.get_container(path), tail=1)
+            self.assertEqual(list(lines), [b'line 2\n'])
+        finally:
+            shutil.rmtree(tmpdir)
@@ -0,0 +1,28 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+from compose.cli import launcher
+from compose.cli import main
+from tests import unittest
+
+
+class IsForwardedTest(unittest.TestCase):
+
+    def test_agrees_with_full_cli(self):
+        for argv in [
+            ['ps'],
+            ['ps', '-q'],
+            ['-f', 'other.yml', '-p', 'app', 'stop', 'web'],
+            ['--file=other.yml', '--verbose', 'kill'],
+            ['--profile-api', '--profile-api-file', 'ps', 'up'],
+            ['up', '-d'],
+            ['build'],
+            ['pull'],
+            ['run', 'web', 'ps'],
+            ['--version'],
+            [],
+        ]:
+            self.assertEqual(launcher.is_forwarded(argv), main.is_forwarded(argv), argv)
+
+    def test_unknown_options_are_run_here(self):
+        self.assertIsNone(launcher.command_name(['-x', 'ps']))
@@ -0,0 +1,85 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import os
+import shutil
+import tempfile
+
+from compose.cli import metrics
+from compose.trace import Tracer
+from tests import unittest
+
+
+def make_tracer():
+    tracer = Tracer()
+    tracer.tags.update(command='up', project='my"app')
+    tracer.add('docker-compose', 'compose', 0, 10, {})
+    tracer.add('load_config', 'compose', 0, 0.5, {})
+    tracer.add('pull', 'service', 1, 3, {'name': 'db'})
+    tracer.add('build', 'service', 3.2, 3.7, {'name': 'worker'})
+    tracer.add('create_container', 'service', 3, 4, {'name': 'worker'})
+    tracer.add('create_container', 'service', 4, 4.5, {'name': 'web'})
+    tracer.add('recreate_container', 'service', 4, 5, {'name': 'web'})
+    tracer.add('inspect_container', 'api', 4, 4.02, {})
+    tracer.add('inspect_container', 'api', 4, 4.2, {})
+    tracer.add('remove_container', 'api', 4.5, 4.6, {})
+    tracer.count('pull_bytes', 1000)
+    return tracer
+
+
+class CommandMetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        text = metrics.command_metrics(make_tracer(), True, now=lambda: 1234)
+        self.lines = text.splitlines()
+
+    def assertSample(self, line):
+        self.assertIn(line, self.lines)
+
+    def test_command(self):
+        labels = 'project="my\\"app",command="up"'
+        self.assertSample('compose_command_duration_seconds{%s} 10.0' % labels)
+        self.assertSample('compose_command_success{%s} 1' % labels)
+        self.assertSample('compose_command_last_run_timestamp_seconds{%s} 1234' % labels)
+
+    def test_phases(self):
+        labels = 'project="my\\"app",command="up"'
+        self.assertSample('compose_phase_duration_seconds{%s,phase="config_load"} 0.5' % labels)
+        self.assertSample('compose_phase_duration_seconds{%s,phase="pull"} 2.0' % labels)
+        self.assertSample('compose_phase_duration_seconds{%s,phase="create"} 1.0' % labels)
+        self.assertSample('compose_phase_duration_seconds{%s,phase="build"} 0.5' % labels)
+
+    def test_api_histogram(self):
+        labels = 'project="my\\"app",command="up",le="%s",method="inspect_container"'
+        self.assertSample('compose_api_request_duration_seconds_bucket{%s} 0' % (labels % '0.01'))
+        self.assertSample('compose_api_request_duration_seconds_bucket{%s} 1' % (labels % '0.025'))
+        self.assertSample('compose_api_request_duration_seconds_bucket{%s} 2' % (labels % '0.25'))
+        self.assertSample('compose_api_request_duration_seconds_bucket{%s} 2' % (labels % '+Inf'))
+        self.assertIn(
+            'compose_api_request_duration_seconds_count{project="my\\"app",command="up",method="inspect_container"} 2',
+            self.lines)
+
+    def test_containers_and_bytes(self):
+        labels = 'project="my\\"app",command="up"'
+        self.assertSample('compose_containers_created{%s} 1' % labels)
+        self.assertSample('compose_containers_recreated{%s} 1' % labels)
+        self.assertSample('compose_containers_removed{%s} 1' % labels)
+        self.assertSample('compose_pull_bytes{%s} 1000' % labels)
+
+
+class WriteTextfileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_writes_file_per_command(self):
+        tracer = make_tracer()
+        tracer.tags['project'] = 'myapp'
+        metrics.write_textfile(self.tmpdir, tracer, False)
+        self.assertEqual(os.listdir(self.tmpdir), ['docker-compose-myapp-up.prom'])
+
+    def test_skips_commands_which_did_not_run(self):
+        metrics.write_textfile(self.tmpdir, Tracer(), False)
+        self.assertEqual(os.listdir(self.tmpdir), [])
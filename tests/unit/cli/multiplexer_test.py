@@ -0,0 +1,35 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+from compose.cli.multiplexer import merge_ordered
+from tests import unittest
+
+
+class MergeOrderedTest(unittest.TestCase):
+
+    def test_merges_in_key_order(self):
+        streams = [
+            [(1, 'a1'), (4, 'a4'), (5, 'a5')],
+            [(2, 'b2'), (3, 'b3'), (6, 'b6')],
+            [],
+            [(0, 'c0')],
+        ]
+        self.assertEqual(
+            list(merge_ordered(streams)),
+            ['c0', 'a1', 'b2', 'b3', 'a4', 'a5', 'b6'])
+
+    def test_equal_keys_keep_stream_order(self):
+        streams = [[(1, 'a'), (2, 'a')], [(1, 'b'), (2, 'b')]]
+        self.assertEqual(list(merge_ordered(streams)), ['a', 'b', 'a', 'b'])
+
+    def test_reads_lazily(self):
+        consumed = []
+
+        def stream(name, count):
+            for i in range(count):
+                consumed.append(name)
+                yield i, name
+
+        merged = merge_ordered([stream('a', 1000), stream('b', 1000)])
+        self.assertEqual([next(merged) for _ in range(4)], ['a', 'b', 'a', 'b'])
+        self.assertTrue(len(consumed) <= 6)
@@ -0,0 +1,118 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import io
+import json
+
+from compose import trace
+from compose.cli.profiling_proxy import ApiProfile, ProfilingProxy, TracingProxy
+from tests import unittest
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeClient(object):
+
+    def __init__(self, clock):
+        self.clock = clock
+
+    def inspect_container(self, id):
+        self.clock.now += 0.5
+        return {'Id': id}
+
+    def inspect_image(self, image):
+        self.clock.now += 0.25
+        raise ValueError('No such image: %s' % image)
+
+    def pull(self, image, stream=False):
+        for chunk in [b'abc', b'de']:
+            self.clock.now += 1
+            yield chunk
+
+
+class ProfilingProxyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.profile = ApiProfile(clock=self.clock)
+        self.proxy = ProfilingProxy('docker', FakeClient(self.clock), self.profile)
+
+    def test_records_calls(self):
+        self.assertEqual(self.proxy.inspect_container('abc'), {'Id': 'abc'})
+        self.assertEqual(self.profile.records, [{
+            'method': 'inspect_container',
+            'seconds': 0.5,
+            'size': len(json.dumps({'Id': 'abc'})),
+            # Only compose functions are reported as callers
+            'caller': None,
+        }])
+
+    def test_records_calls_which_raise(self):
+        with self.assertRaises(ValueError):
+            self.proxy.inspect_image('busybox')
+        self.assertEqual(self.profile.records, [{
+            'method': 'inspect_image',
+            'seconds': 0.25,
+            'size': None,
+            'caller': None,
+        }])
+
+    def test_times_streams_until_read(self):
+        stream = self.proxy.pull('busybox', stream=True)
+        self.assertEqual(self.profile.records, [])
+        self.assertEqual(list(stream), [b'abc', b'de'])
+        [record] = self.profile.records
+        self.assertEqual((record['seconds'], record['size']), (2, 5))
+
+
+class ApiProfileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.profile = ApiProfile()
+        for seconds in [0.1, 0.2, 0.3, 0.4, 2.0]:
+            self.profile.add('inspect_container', seconds, 10, None)
+        self.profile.add('containers', 0.5, 100, None)
+
+    def test_summary(self):
+        summary = [[row[0], row[1]] + [round(value, 3) for value in row[2:]] for row in self.profile.summary()]
+        self.assertEqual(summary, [
+            ['inspect_container', 5, 0.3, 2.0, 2.0, 3.0],
+            ['containers', 1, 0.5, 0.5, 0.5, 0.5],
+        ])
+
+    def test_dump(self):
+        f = io.StringIO()
+        self.profile.dump(f)
+        lines = f.getvalue().splitlines()
+        self.assertEqual(len(lines), 6)
+        self.assertEqual(json.loads(lines[-1])['method'], 'containers')
+
+
+class TracingProxyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.tracer = trace.start(clock=self.clock)
+        self.proxy = TracingProxy('docker', FakeClient(self.clock))
+
+    def tearDown(self):
+        trace.stop()
+
+    def spans(self):
+        return [(e['name'], e['cat'], e['dur']) for e in self.tracer.trace()['traceEvents'] if e['ph'] == 'X']
+
+    def test_traces_calls(self):
+        self.proxy.inspect_container('abc')
+        self.assertEqual(self.spans(), [('inspect_container', 'api', 0.5e6)])
+
+    def test_traces_streams_until_read(self):
+        stream = self.proxy.pull('busybox', stream=True)
+        self.assertEqual(self.spans(), [])
+        list(stream)
+        self.assertEqual(self.spans(), [('pull', 'api', 2e6)])
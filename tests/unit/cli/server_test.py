@@ -0,0 +1,186 @@
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+
+import mock
+
+from compose import config
+from compose.cli.launcher import forward, send_message
+from compose.cli.server import ComposeServer, ConfigCache, native_str
+from compose.utils import json_stream
+from tests import unittest
+
+
+class ConfigCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.config_path = os.path.join(self.tmpdir, 'docker-compose.yml')
+        self.write('web:\n  image: busybox\n')
+        self.cache = ConfigCache()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, content, mtime=1000):
+        with open(self.config_path, 'w') as f:
+            f.write(content)
+        os.utime(self.config_path, (mtime, mtime))
+
+    def test_reuses_loaded_config(self):
+        with mock.patch('compose.cli.server.config.load', wraps=config.load) as load:
+            self.cache.load(self.config_path)
+            service_dicts = self.cache.load(self.config_path)
+        self.assertEqual(load.call_count, 1)
+        self.assertEqual(service_dicts[0]['image'], 'busybox')
+
+    def test_returns_copies(self):
+        self.cache.load(self.config_path)[0]['image'] = 'changed'
+        self.assertEqual(self.cache.load(self.config_path)[0]['image'], 'busybox')
+
+    def test_reloads_changed_config(self):
+        self.cache.load(self.config_path)
+        self.write('web:\n  image: ubuntu\n', mtime=2000)
+        self.assertEqual(self.cache.load(self.config_path)[0]['image'], 'ubuntu')
+
+    def test_environment_is_part_of_key(self):
+        self.write('web:\n  image: busybox\n  environment:\n    - FOO\n')
+        with mock.patch.dict(os.environ, {'FOO': '1'}):
+            self.assertEqual(self.cache.load(self.config_path)[0]['environment'], {'FOO': '1'})
+        with mock.patch.dict(os.environ, {'FOO': '2'}):
+            self.assertEqual(self.cache.load(self.config_path)[0]['environment'], {'FOO': '2'})
+
+
+class Output(object):
+
+    def __init__(self):
+        self.written = []
+
+    def write(self, data):
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        self.written.append(data)
+
+    def flush(self):
+        pass
+
+    def getvalue(self):
+        return ''.join(self.written)
+
+
+class StopServer(BaseException):
+    # Not an Exception, so the server doesn't carry on past it
+    pass
+
+
+class ComposeServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.tmpdir, 'server.sock')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def serve(self, run):
+        """
+        Start a server in the background which stops after one command.
+        """
+        server = ComposeServer(self.socket_path, run)
+        handle = server.handle
+
+        def handle_once(conn):
+            handle(conn)
+            raise StopServer()
+
+        def serve():
+            try:
+                server.serve_forever()
+            except StopServer:
+                pass
+
+        server.handle = handle_once
+        thread = threading.Thread(target=serve)
+        thread.daemon = True
+        thread.start()
+        while not os.path.exists(self.socket_path):
+            thread.join(0.01)
+        return thread
+
+    def forward(self, argv):
+        stdout, stderr = Output(), Output()
+        exit_code = forward(self.socket_path, argv, stdout=stdout, stderr=stderr)
+        return exit_code, stdout.getvalue(), stderr.getvalue()
+
+    def test_runs_command_in_client_environment(self):
+        def run(argv):
+            print(' '.join(argv), os.environ['MARKER'], os.getcwd())
+            sys.stderr.write('warning\n')
+
+        thread = self.serve(run)
+        with mock.patch.dict(os.environ, {'MARKER': 'client'}):
+            exit_code, stdout, stderr = self.forward(['ps', '-q'])
+        thread.join(1)
+
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(stdout, 'ps -q client %s\n' % os.getcwd())
+        self.assertEqual(stderr, 'warning\n')
+        self.assertNotIn('MARKER', os.environ)
+        self.assertFalse(os.path.exists(self.socket_path))
+
+    def test_returns_exit_status(self):
+        def run(argv):
+            sys.exit(3)
+
+        thread = self.serve(run)
+        self.assertEqual(self.forward(['stop'])[0], 3)
+        thread.join(1)
+
+    def test_reports_unexpected_errors(self):
+        def run(argv):
+            raise ValueError('oops')
+
+        thread = self.serve(run)
+        exit_code, _, stderr = self.forward(['stop'])
+        thread.join(1)
+        self.assertEqual(exit_code, 1)
+        self.assertIn('ValueError: oops', stderr)
+
+    def test_environment_is_native_strings(self):
+        def run(argv):
+            marker = os.environ['MARKER']
+            print(type(marker) is str, marker == native_str('caf\xe9'))
+
+        thread = self.serve(run)
+        with mock.patch.dict(os.environ, {'MARKER': native_str('caf\xe9')}):
+            exit_code, stdout, _ = self.forward(['ps'])
+        thread.join(1)
+        self.assertEqual((exit_code, stdout), (0, 'True True\n'))
+
+    def test_bad_request_fails_with_an_error(self):
+        thread = self.serve(lambda argv: None)
+        cwd = os.getcwd()
+        missing = os.path.join(self.tmpdir, 'missing')
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.socket_path)
+            send_message(sock, {'argv': ['ps'], 'cwd': missing, 'env': {'MARKER': 'client'}})
+            messages = list(json_stream(iter(lambda: sock.recv(4096), b'')))
+        finally:
+            sock.close()
+        thread.join(1)
+
+        self.assertEqual(messages[-1], {'exit': 1})
+        self.assertIn(missing, messages[0]['data'])
+        self.assertEqual(os.getcwd(), cwd)
+        self.assertNotIn('MARKER', os.environ)
+
+    def test_unreachable_server(self):
+        self.assertEqual(self.forward(['ps']), (None, '', ''))
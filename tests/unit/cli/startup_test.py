@@ -0,0 +1,51 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import json
+import os
+import subprocess
+import sys
+
+from tests import unittest
+
+# Seconds `import compose.cli.main` may take: about three times what it
+# takes on a laptop (0.17s), so that eager imports creeping back in fail.
+IMPORT_TIME_BUDGET = 0.5
+
+# Modules only some commands need, which shouldn't be imported at startup
+LAZY_MODULES = ('dockerpty', 'texttable', 'yaml')
+
+# Modules the entry point mustn't import before deciding whether to forward
+# a command to the compose server
+FORWARDING_LAZY_MODULES = LAZY_MODULES + ('compose.cli.main', 'docker', 'requests')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+
+def import_module(name):
+    """
+    Import module `name` in a new interpreter, and return how long it took
+    and the modules which were imported.
+    """
+    script = (
+        "import json, sys, time\n"
+        "start = time.time()\n"
+        "import %s\n"
+        "print(json.dumps({'seconds': time.time() - start, 'modules': sorted(sys.modules)}))\n"
+    ) % name
+    output = subprocess.check_output([sys.executable, '-c', script], cwd=ROOT)
+    return json.loads(output.decode('utf-8'))
+
+
+class StartupTest(unittest.TestCase):
+
+    def test_import_time_within_budget(self):
+        seconds = min(import_module('compose.cli.main')['seconds'] for _ in range(3))
+        self.assertLess(seconds, IMPORT_TIME_BUDGET)
+
+    def test_lazy_modules_not_imported(self):
+        modules = import_module('compose.cli.main')['modules']
+        self.assertEqual([m for m in LAZY_MODULES if m in modules], [])
+
+    def test_entry_point_imports_no_docker(self):
+        modules = import_module('compose.cli.launcher')['modules']
+        self.assertEqual([m for m in FORWARDING_LAZY_MODULES if m in modules], [])
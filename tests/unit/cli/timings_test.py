@@ -0,0 +1,90 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+from compose import trace
+from compose.cli.timings import format_timings, service_timings
+from tests import unittest
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class ServiceTimingsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.tracer = trace.start(clock=self.clock)
+
+    def tearDown(self):
+        trace.stop()
+
+    def advance(self, seconds):
+        self.clock.now += seconds
+
+    def converge(self, name, action, image=0, create=0, start=0, stop=0, containers=1):
+        with trace.span('execute_convergence_plan', 'service', name=name, action=action) as plan:
+            if stop:
+                with trace.span('stop_container', 'service', name=name):
+                    self.advance(stop)
+            with trace.span('create_container', 'service', name=name):
+                with trace.span('ensure_image_exists', 'service', name=name):
+                    self.advance(image)
+                self.advance(create)
+            with trace.span('start_container', 'service', name=name):
+                self.advance(start)
+            plan.set('containers', containers)
+
+    def test_phases(self):
+        self.converge('db', 'create', image=4, create=1, start=2)
+        self.converge('web', 'recreate', create=1, start=1, stop=3, containers=2)
+
+        [db, web] = service_timings(self.tracer)
+        self.assertEqual(dict(db), {
+            'service': 'db',
+            'action': 'create',
+            'containers': 1,
+            'image': 4,
+            'create': 1,
+            'start': 2,
+            'stop': 0,
+            'total': 7,
+        })
+        self.assertEqual(dict(web), {
+            'service': 'web',
+            'action': 'recreate',
+            'containers': 2,
+            'image': 0,
+            'create': 1,
+            'start': 1,
+            'stop': 3,
+            'total': 5,
+        })
+
+    def test_prefetched_image_counts_towards_total(self):
+        with trace.span('ensure_image_exists', 'service', name='db'):
+            self.advance(3)
+        self.advance(1)
+        self.converge('db', 'create', create=1, start=2)
+
+        [db] = service_timings(self.tracer)
+        self.assertEqual((db['image'], db['create'], db['start']), (3, 1, 2))
+        self.assertEqual(db['total'], 6)
+
+    def test_slowest_first(self):
+        self.converge('db', 'noop')
+        self.converge('web', 'create', start=1)
+        self.assertEqual([t['service'] for t in service_timings(self.tracer)], ['web', 'db'])
+
+    def test_format(self):
+        self.converge('web', 'create', image=1.5, start=0.25)
+        table = format_timings(service_timings(self.tracer))
+        self.assertIn('Service', table.splitlines()[0])
+        self.assertEqual(
+            table.splitlines()[-1].split(),
+            ['web', 'create', '1', '1.50s', '0.00s', '0.25s', '0.00s', '1.75s'])
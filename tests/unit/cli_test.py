@@ -12,6 +12,7 @@ import mock
 from compose.cli import main
 from compose.cli.main import TopLevelCommand
 from compose.cli.errors import ComposeFileNotFound
+from compose.progress_stream import JsonProgress
 from compose.service import Service
 
 
@@ -106,8 +107,8 @@ class CLITestCase(unittest.TestCase):
         self.assertEqual(logging.getLogger().level, logging.DEBUG)
         self.assertEqual(logging.getLogger('requests').propagate, False)
 
-    @mock.patch('compose.cli.main.dockerpty', autospec=True)
-    def test_run_with_environment_merged_with_options_list(self, mock_dockerpty):
+    @mock.patch('dockerpty.start', autospec=True)
+    def test_run_with_environment_merged_with_options_list(self, mock_dockerpty_start):
         command = TopLevelCommand()
         mock_client = mock.create_autospec(docker.Client)
         mock_project = mock.Mock()
@@ -185,6 +186,93 @@ class CLITestCase(unittest.TestCase):
         _, _, call_kwargs = mock_client.create_container.mock_calls[0]
         self.assertFalse('RestartPolicy' in call_kwargs['host_config'])
 
+    def test_pull_with_progress_mode(self):
+        command = TopLevelCommand()
+        mock_project = mock.Mock()
+        command.pull(mock_project, {
+            'SERVICE': [],
+            '--allow-insecure-ssl': False,
+            '--parallel': False,
+            '--layers': False,
+            '--progress': 'json',
+        })
+        _, call_kwargs = mock_project.pull.call_args
+        self.assertFalse(call_kwargs['parallel'])
+        self.assertIsInstance(call_kwargs['progress'], JsonProgress)
+
+    def test_pull_with_unknown_progress_mode(self):
+        with self.assertRaises(main.UserError):
+            TopLevelCommand().pull(mock.Mock(), {
+                'SERVICE': [],
+                '--allow-insecure-ssl': False,
+                '--parallel': False,
+                '--layers': False,
+                '--progress': 'fancy',
+            })
+
+    def test_up_checks_output_dir_before_starting(self):
+        path = tempfile.mktemp()
+        with open(path, 'w'):
+            pass
+        self.addCleanup(os.remove, path)
+
+        project = mock.Mock()
+        with self.assertRaises(main.UserError):
+            TopLevelCommand().up(project, up_options(**{'--output-dir': path}))
+        self.assertFalse(project.up.called)
+
+    def test_up_checks_filters_before_starting(self):
+        project = mock.Mock()
+        with self.assertRaises(main.UserError):
+            TopLevelCommand().up(project, up_options(**{'--grep': '('}))
+        self.assertFalse(project.up.called)
+
+    def test_output_dir_is_created(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        directory = os.path.join(tmpdir, 'logs', 'web')
+
+        [sink] = main.build_log_sinks(up_options(**{'--output-dir': directory}))
+        self.assertTrue(os.path.isdir(directory))
+        self.assertEqual(sink.directory, directory)
+
+    def test_parse_tail(self):
+        self.assertEqual(main.parse_tail(None), None)
+        self.assertEqual(main.parse_tail('0'), 0)
+        self.assertEqual(main.parse_tail('10'), 10)
+        with self.assertRaises(main.UserError):
+            main.parse_tail('-1')
+
+
+def up_options(**options):
+    defaults = {
+        'SERVICE': [],
+        '--allow-insecure-ssl': False,
+        '-d': False,
+        '--no-color': False,
+        '--no-deps': False,
+        '--x-smart-recreate': False,
+        '--no-recreate': False,
+        '--no-build': False,
+        '--timeout': None,
+        '--json': False,
+        '--output-dir': None,
+        '--per-container': False,
+        '--rotate-size': None,
+        '--rotate-interval': None,
+        '--gzip': False,
+        '--grep': None,
+        '--exclude': None,
+        '--stream': None,
+        '--rate-limit': None,
+        '--progress': None,
+        '--build-cache': None,
+        '--timings': False,
+        '--timings-file': None,
+    }
+    defaults.update(options)
+    return defaults
+
 
 def get_config_filename_for_files(filenames, subdir=None):
     project_dir = tempfile.mkdtemp()
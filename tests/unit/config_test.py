@@ -392,6 +392,18 @@ class ExtendsTest(unittest.TestCase):
                 ],
             )
 
+    def test_config_files(self):
+        files = config.config_files('tests/fixtures/extends/nested.yml')
+        self.assertEqual(
+            [os.path.basename(filename) for filename in files],
+            ['nested.yml', 'nested-intermediate.yml', 'common.yml'])
+
+    def test_config_files_of_circular_extends(self):
+        files = config.config_files('tests/fixtures/extends/circle-1.yml')
+        self.assertEqual(
+            sorted(os.path.basename(filename) for filename in files),
+            ['circle-1.yml', 'circle-2.yml'])
+
     def test_extends_validation(self):
         dictionary = {'extends': None}
 
@@ -135,6 +135,25 @@ class ContainerTest(unittest.TestCase):
         self.assertEqual(container.get('HostConfig.VolumesFrom'), ["volume_id"])
         self.assertEqual(container.get('Foo.Bar.DoesNotExist'), None)
 
+    def test_logs_without_following_are_streamed(self):
+        client = mock.create_autospec(docker.Client)
+        client._url.return_value = 'url'
+        client._multiplexed_response_stream_helper.return_value = iter([b'line\n'])
+        container = Container(client, {'Id': 'abc'}, has_been_inspected=True)
+
+        logs = container.logs(stdout=True, stderr=False, stream=True, follow=False, tail=10)
+
+        self.assertEqual(list(logs), [b'line\n'])
+        self.assertFalse(client.logs.called)
+        client._url.assert_called_once_with('/containers/abc/logs')
+        client._get.assert_called_once_with('url', stream=True, params={
+            'stdout': 1,
+            'stderr': 0,
+            'timestamps': 0,
+            'follow': 0,
+            'tail': 10,
+        })
+
 
 class GetContainerNameTestCase(unittest.TestCase):
 
@@ -0,0 +1,82 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import io
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+
+import docker
+import mock
+
+from compose.image_cache import ImageCache, read_image_id
+from .. import unittest
+
+
+def saved_image(image_id, tag='project_web', padding=0):
+    """
+    Return a tar archive like the ones `docker save` writes.
+    """
+    data = io.BytesIO()
+    archive = tarfile.open(fileobj=data, mode='w')
+    for name, content in [
+        ('repositories', json.dumps({tag: {'latest': image_id}}).encode('utf-8')),
+        ('%s/layer.tar' % image_id, b'\0' * padding),
+    ]:
+        info = tarfile.TarInfo(name)
+        info.size = len(content)
+        archive.addfile(info, io.BytesIO(content))
+    archive.close()
+    return data.getvalue()
+
+
+class ImageCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = ImageCache(os.path.join(self.directory, 'cache'), max_size=100000)
+        self.client = mock.create_autospec(docker.Client)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def save(self, key, image_id, padding=0):
+        self.client.get_image.return_value = io.BytesIO(saved_image(image_id, padding=padding))
+        self.cache.save(self.client, key, 'project_web')
+
+    def test_load_missing_image(self):
+        self.assertIsNone(self.cache.load(self.client, 'abc', 'project_web'))
+        self.assertFalse(self.client.load_image.called)
+
+    def test_save_and_load(self):
+        self.save('abc', '0123abcd')
+        self.client.get_image.assert_called_once_with('project_web')
+        self.assertEqual(os.listdir(self.cache.directory), ['abc.tar'])
+
+        self.assertEqual(self.cache.load(self.client, 'abc', 'other_web'), '0123abcd')
+        self.assertTrue(self.client.load_image.called)
+        self.client.tag.assert_called_once_with('0123abcd', 'other_web', force=True)
+
+    def test_failed_save_leaves_nothing_behind(self):
+        self.client.get_image.side_effect = IOError('oops')
+        with self.assertRaises(IOError):
+            self.cache.save(self.client, 'abc', 'project_web')
+        self.assertEqual(os.listdir(self.cache.directory), [])
+
+    def test_evicts_least_recently_used(self):
+        self.save('a', '0a', padding=30000)
+        self.save('b', '0b', padding=30000)
+        os.utime(self.cache.path('a'), (1000, 1000))
+        os.utime(self.cache.path('b'), (2000, 2000))
+
+        self.cache.load(self.client, 'a', 'project_web')
+        self.save('c', '0c', padding=30000)
+
+        self.assertEqual(sorted(os.listdir(self.cache.directory)), ['a.tar', 'c.tar'])
+
+    def test_read_image_id(self):
+        path = os.path.join(self.directory, 'image.tar')
+        with open(path, 'wb') as f:
+            f.write(saved_image('0123abcd'))
+        self.assertEqual(read_image_id(path), '0123abcd')
@@ -1,8 +1,25 @@
 from __future__ import unicode_literals
 from __future__ import absolute_import
+import gzip
+import json
 import os
+import shutil
+import tempfile
+import threading
 
-from compose.cli.log_printer import LogPrinter
+import mock
+
+from compose.cli.log_printer import (
+    ContainerExit,
+    FileSink,
+    JsonSink,
+    LineFilter,
+    LogLine,
+    LogPrinter,
+    RateLimiter,
+    RotatingFile,
+)
+from six import StringIO
 from .. import unittest
 
 
@@ -40,30 +57,306 @@ class LogPrinterTest(unittest.TestCase):
 
         self.assertIn(glyph, output)
 
+    def test_exit_code_from_states(self):
+        def reader(*args, **kwargs):
+            yield b"hello\n"
+
+        states = mock.Mock()
+        states.wait.return_value = 3
+        output = run_log_printer([MockContainer(reader)], monochrome=True, states=states)
+
+        self.assertIn('myapp_web_1 exited with code 3', output)
+        states.wait.assert_called_once_with('web_1')
+
+    def test_no_exit_message_for_removed_container(self):
+        def reader(*args, **kwargs):
+            yield b"hello\n"
+
+        states = mock.Mock()
+        states.wait.return_value = None
+        output = run_log_printer([MockContainer(reader)], monochrome=True, states=states)
+
+        self.assertIn('hello', output)
+        self.assertNotIn('exited', output)
+
+    def test_since_skips_older_lines(self):
+        def reader(*args, **kwargs):
+            yield b'2015-06-01T12:00:00.1Z old\n'
+            yield b'2015-06-01T12:00:01.5Z new\n'
+
+        container = MockContainer(reader)
+        output = run_log_printer([container], since='2015-06-01T12:00:01Z')
+
+        self.assertNotIn('old', output)
+        self.assertIn('new', output)
+        self.assertNotIn('2015-06-01', output)
+
+    def test_tail_zero_skips_history(self):
+        calls = []
+
+        def reader(*args, **kwargs):
+            calls.append(kwargs)
+            yield b'live\n'
+
+        container = MockContainer(reader)
+        output = run_log_printer([container], tail=0, direct_read=True, ordered=True)
+
+        self.assertIn('live', output)
+        self.assertEqual([call['logs'] for call in calls], [0])
+
+    def test_ordered_history(self):
+        history = {
+            'web_1': [
+                b'2015-06-01T12:00:00.1Z one\n',
+                b'2015-06-01T12:00:00.3Z three\n',
+            ],
+            'db_1': [
+                b'2015-06-01T12:00:00.2Z two\n',
+                b'2015-06-01T12:00:00.25Z two and a half\n',
+            ],
+        }
+
+        def read_log_history(container, **kwargs):
+            return iter(history[container.name_without_project])
+
+        def web_reader(*args, **kwargs):
+            # Following repeats the last line of the history
+            yield b'2015-06-01T12:00:00.3Z three\n'
+            yield b'2015-06-01T12:00:01Z logged meanwhile\n'
+
+        def db_reader(*args, **kwargs):
+            return iter([])
+
+        containers = [MockContainer(web_reader, 'web_1'), MockContainer(db_reader, 'db_1')]
+        with mock.patch('compose.cli.log_printer.read_log_history', side_effect=read_log_history):
+            output = run_log_printer(containers, monochrome=True, ordered=True)
+
+        lines = output.splitlines()
+        self.assertEqual(lines[:5], [
+            'web_1 | one',
+            'db_1  | two',
+            'db_1  | two and a half',
+            'web_1 | three',
+            'web_1 | logged meanwhile',
+        ])
+        self.assertEqual(len([line for line in lines if 'three' in line]), 1)
+
+    def test_ordered_history_is_streamed(self):
+        calls = []
+
+        def reader(*args, **kwargs):
+            calls.append(kwargs)
+            if kwargs.get('follow') is False:
+                for n in range(1, 4):
+                    yield b'2015-06-01T12:00:0%dZ line %d\n' % (n, n)
+
+        output = run_log_printer([MockContainer(reader)], monochrome=True, ordered=True)
+
+        self.assertIn('web_1 | line 3', output)
+        self.assertEqual([call['stream'] for call in calls], [True] * len(calls))
+        self.assertIn(False, [call.get('follow') for call in calls])
+
+    def test_direct_read_follows_before_reading_history(self):
+        def reader(*args, **kwargs):
+            yield b'2015-06-01T12:00:00.1Z old\n'
+            yield b'2015-06-01T12:00:01Z new\n'
+
+        history = iter([('2015-06-01T12:00:00.100000000', b'old\n')])
+        with mock.patch('compose.cli.log_printer.read_json_file_log', return_value=history):
+            output = run_log_printer([MockContainer(reader)], monochrome=True, direct_read=True)
+
+        self.assertEqual(output.splitlines()[:2], ['web_1 | old', 'web_1 | new'])
+
+    def test_json_sink_reads_streams_separately(self):
+        def reader(*args, **kwargs):
+            if kwargs['stdout']:
+                yield b'out\n'
+            else:
+                yield b'err\n'
+
+        output = StringIO()
+        printer = LogPrinter([MockContainer(reader)], sinks=[JsonSink(output)])
+        printer.run()
+
+        records = [json.loads(line) for line in output.getvalue().splitlines()]
+        lines = sorted((r['stream'], r['log']) for r in records if 'log' in r)
+        self.assertEqual(lines, [('stderr', 'err\n'), ('stdout', 'out\n')])
+        self.assertEqual(records[-1], {
+            'container': 'myapp_web_1',
+            'service': 'web',
+            'number': 1,
+            'exit_code': 0,
+        })
+
+    def test_filter_before_formatting(self):
+        def reader(*args, **kwargs):
+            yield b'INFO starting\nERROR failed\nERROR ignored\n'
+
+        line_filter = LineFilter(include='ERROR', exclude='ignored')
+        output = run_log_printer([MockContainer(reader)], line_filter=line_filter)
+
+        self.assertIn('ERROR failed', output)
+        self.assertNotIn('starting', output)
+        self.assertNotIn('ignored', output)
+
+    def test_stream_selection(self):
+        attached = []
+
+        def reader(*args, **kwargs):
+            attached.append(kwargs)
+            yield b'err\n'
+
+        run_log_printer([MockContainer(reader)], streams=('stderr',))
+
+        self.assertEqual(len(attached), 1)
+        self.assertEqual(attached[0]['stdout'], 0)
+        self.assertEqual(attached[0]['stderr'], 1)
+
+    def test_rate_limit(self):
+        def reader(*args, **kwargs):
+            for i in range(100):
+                yield b'line\n'
+
+        output = run_log_printer([MockContainer(reader)], rate_limit=10)
+        self.assertTrue(output.count('line') <= 11)
+
+    def test_discovers_new_containers(self):
+        def reader(*args, **kwargs):
+            yield b'first\n'
+            new_container_seen.wait(5)
+
+        def new_reader(*args, **kwargs):
+            new_container_seen.set()
+            yield b'second\n'
+
+        new_container_seen = threading.Event()
+        first = MockContainer(reader, 'web_1')
+        second = MockContainer(new_reader, 'web_2')
+
+        output = run_log_printer(
+            [first],
+            monochrome=True,
+            discover=lambda: [first, second],
+            discover_interval=0.01)
+
+        self.assertIn('web_1 | first', output)
+        self.assertIn('web_2 | second', output)
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def test_refills_over_time(self):
+        now = [0.0]
+        limiter = RateLimiter(2, clock=lambda: now[0])
+
+        self.assertEqual([limiter.allow() for _ in range(3)], [True, True, False])
+        now[0] += 0.5
+        self.assertEqual([limiter.allow() for _ in range(2)], [True, False])
+        now[0] += 10
+        self.assertEqual([limiter.allow() for _ in range(3)], [True, True, False])
+
 
-def run_log_printer(containers, monochrome=False):
+class FileSinkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def read(self, name):
+        with open(os.path.join(self.tmpdir, name), 'rb') as f:
+            return f.read()
+
+    def test_per_service(self):
+        web_1 = MockContainer(None, 'web_1')
+        web_2 = MockContainer(None, 'web_2')
+        sink = FileSink(self.tmpdir)
+        sink.write(LogLine(web_1, None, b'one\n'))
+        sink.write(LogLine(web_2, None, b'two\n'))
+        sink.write(ContainerExit(web_1, 0))
+        sink.close()
+
+        self.assertEqual(os.listdir(self.tmpdir), ['web.log'])
+        self.assertEqual(
+            self.read('web.log'),
+            b'web_1 | one\nweb_2 | two\nmyapp_web_1 exited with code 0\n')
+
+    def test_per_container_json_gzip(self):
+        web_1 = MockContainer(None, 'web_1')
+        sink = FileSink(self.tmpdir, per_container=True, as_json=True, compress=True)
+        self.assertTrue(sink.needs_streams)
+        sink.write(LogLine(web_1, 'stdout', b'one\n'))
+        sink.close()
+
+        with gzip.open(os.path.join(self.tmpdir, 'web_1.log.gz')) as f:
+            record = json.loads(f.read().decode('utf-8'))
+        self.assertEqual(record['log'], 'one\n')
+        self.assertEqual(record['stream'], 'stdout')
+
+    def test_rotate_size(self):
+        path = os.path.join(self.tmpdir, 'web.log')
+        f = RotatingFile(path, max_size=8)
+        for line in [b'1234\n', b'5678\n', b'abcd\n', b'efgh\n', b'ijkl\n']:
+            f.write(line)
+        f.close()
+
+        self.assertEqual(sorted(os.listdir(self.tmpdir)), ['web.log', 'web.log.1', 'web.log.2'])
+        self.assertEqual(self.read('web.log.1'), b'1234\n5678\n')
+        self.assertEqual(self.read('web.log.2'), b'abcd\nefgh\n')
+        self.assertEqual(self.read('web.log'), b'ijkl\n')
+
+    def test_rotate_interval(self):
+        path = os.path.join(self.tmpdir, 'web.log')
+        f = RotatingFile(path, max_age=60)
+        f.write(b'old\n')
+        f.opened_at -= 61
+        f.write(b'new\n')
+        f.close()
+
+        self.assertEqual(self.read('web.log.1'), b'old\n')
+        self.assertEqual(self.read('web.log'), b'new\n')
+
+
+def run_log_printer(containers, monochrome=False, **kwargs):
     r, w = os.pipe()
     reader, writer = os.fdopen(r, 'r'), os.fdopen(w, 'w')
-    printer = LogPrinter(containers, output=writer, monochrome=monochrome)
+    printer = LogPrinter(containers, output=writer, monochrome=monochrome, **kwargs)
     printer.run()
     writer.close()
     return reader.read()
 
 
 class MockContainer(object):
-    def __init__(self, reader):
+    def __init__(self, reader, name_without_project='web_1'):
         self._reader = reader
+        self._name_without_project = name_without_project
+
+    @property
+    def id(self):
+        return self._name_without_project
 
     @property
     def name(self):
-        return 'myapp_web_1'
+        return 'myapp_' + self._name_without_project
 
     @property
     def name_without_project(self):
-        return 'web_1'
+        return self._name_without_project
+
+    @property
+    def service(self):
+        return self._name_without_project.rsplit('_', 1)[0]
+
+    @property
+    def number(self):
+        return int(self._name_without_project.rsplit('_', 1)[1])
 
     def attach(self, *args, **kwargs):
-        return self._reader()
+        return self._reader(*args, **kwargs)
+
+    def logs(self, *args, **kwargs):
+        return self._reader(*args, **kwargs)
 
     def wait(self, *args, **kwargs):
         return 0
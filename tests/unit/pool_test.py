@@ -0,0 +1,106 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import docker
+import mock
+from docker.errors import APIError
+
+from compose.const import LABEL_ONE_OFF, LABEL_POOL
+from compose.pool import ContainerPool
+from compose.service import Service
+from .. import unittest
+
+
+class ContainerPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_client = mock.create_autospec(docker.Client)
+        self.mock_client.inspect_image.return_value = {'Id': 'abcd'}
+        self.service = Service('web', client=self.mock_client, project='myproject', image='busybox')
+        self.options = {'command': ['pytest'], 'tty': False}
+        self.pool = ContainerPool(self.service, 2, self.options)
+
+    def ps_entry(self, number, key=None, id=None):
+        return {
+            'Id': id or 'id%d' % number,
+            'Image': 'busybox',
+            'Names': ['/myproject_web_pool_%d' % number],
+            'Labels': {LABEL_POOL: key or self.pool.key},
+        }
+
+    def test_key_depends_on_options(self):
+        other = ContainerPool(self.service, 2, {'command': ['pytest', '-x'], 'tty': False})
+        self.assertNotEqual(self.pool.key, other.key)
+        self.assertEqual(self.pool.key, ContainerPool(self.service, 1, dict(self.options)).key)
+
+    @mock.patch('compose.service.Service._next_container_number', return_value=2)
+    def test_take_renames_container(self, mock_next_number):
+        self.mock_client.containers.return_value = [self.ps_entry(3)]
+        self.mock_client.inspect_container.return_value = {'Id': 'id3', 'Name': '/myproject_web_run_2'}
+
+        container = self.pool.take()
+
+        self.assertEqual(container.id, 'id3')
+        self.mock_client.rename.assert_called_once_with('myproject_web_pool_3', 'myproject_web_run_2')
+        _, call_kwargs = self.mock_client.containers.call_args
+        self.assertIn('{0}={1}'.format(LABEL_POOL, self.pool.key), call_kwargs['filters']['label'])
+
+    @mock.patch('compose.service.Service._next_container_number', return_value=2)
+    def test_take_skips_containers_taken_by_another_run(self, mock_next_number):
+        self.mock_client.containers.return_value = [self.ps_entry(3), self.ps_entry(4)]
+        self.mock_client.rename.side_effect = [APIError('gone', mock.Mock()), None]
+        self.mock_client.inspect_container.return_value = {'Id': 'id4', 'Name': '/myproject_web_run_2'}
+
+        self.assertEqual(self.pool.take().id, 'id4')
+
+    def test_take_from_empty_pool(self):
+        self.mock_client.containers.return_value = [
+            {'Id': 'x', 'Image': 'busybox', 'Names': ['/myproject_web_run_1'], 'Labels': {}},
+        ]
+        self.assertIsNone(self.pool.take())
+        self.assertFalse(self.mock_client.rename.called)
+
+    def test_refill_removes_stale_containers_and_tops_up(self):
+        self.mock_client.containers.return_value = [self.ps_entry(1), self.ps_entry(2, key='stale')]
+        self.mock_client.create_container.return_value = {'Id': 'new'}
+
+        self.pool.refill()
+
+        self.mock_client.remove_container.assert_called_once_with('id2')
+        self.assertEqual(self.mock_client.create_container.call_count, 1)
+        _, call_kwargs = self.mock_client.create_container.call_args
+        self.assertEqual(call_kwargs['name'], 'myproject_web_pool_3')
+        self.assertEqual(call_kwargs['command'], ['pytest'])
+        self.assertEqual(call_kwargs['labels'][LABEL_POOL], self.pool.key)
+        self.assertEqual(call_kwargs['labels'][LABEL_ONE_OFF], 'True')
+        self.assertFalse(self.mock_client.rename.called)
+
+    def test_refill_in_background(self):
+        self.mock_client.containers.return_value = []
+        self.mock_client.create_container.return_value = {'Id': 'new'}
+
+        self.pool.refill_in_background()
+        self.pool.wait()
+
+        self.assertEqual(self.mock_client.create_container.call_count, 2)
+
+    @mock.patch('compose.pool.log', autospec=True)
+    def test_background_refill_errors_are_logged(self, mock_log):
+        self.mock_client.containers.side_effect = IOError('connection reset')
+
+        self.pool.refill_in_background()
+        self.pool.wait()
+
+        self.assertEqual(mock_log.warn.call_count, 1)
+
+    @mock.patch('compose.service.log', autospec=True)
+    def test_refill_numbers_pool_apart_and_quietly(self, mock_log):
+        self.mock_client.containers.return_value = []
+        self.mock_client.create_container.return_value = {'Id': 'new'}
+
+        self.pool.refill()
+
+        self.assertEqual(
+            [kwargs['name'] for _, kwargs in self.mock_client.create_container.call_args_list],
+            ['myproject_web_pool_1', 'myproject_web_pool_2'])
+        self.assertFalse(mock_log.info.called)
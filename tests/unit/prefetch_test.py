@@ -0,0 +1,89 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import threading
+
+import mock
+from six import StringIO
+
+from compose.prefetch import ImagePrefetcher
+from .. import unittest
+
+
+def mock_service(name, ensure_image_exists=None, image=None):
+    service = mock.Mock()
+    service.name = name
+    service.options = {'image': image or name}
+    if ensure_image_exists is not None:
+        service.ensure_image_exists.side_effect = ensure_image_exists
+    return service
+
+
+class ImagePrefetcherTest(unittest.TestCase):
+
+    def test_pulls_in_order(self):
+        pulled = []
+        services = [
+            mock_service(name, lambda name=name, **kwargs: pulled.append(name))
+            for name in ['db', 'cache', 'web']
+        ]
+        progress = mock.Mock()
+
+        prefetcher = ImagePrefetcher(services, insecure_registry=True, progress=progress, workers=1)
+        for service in services:
+            prefetcher.wait(service)
+
+        self.assertEqual(pulled, ['db', 'cache', 'web'])
+        services[0].ensure_image_exists.assert_called_once_with(
+            do_build=False, insecure_registry=True, progress=progress)
+
+    def test_waits_only_for_own_image(self):
+        release = threading.Event()
+        slow = mock_service('slow', lambda **kwargs: release.wait(5))
+        fast = mock_service('fast')
+
+        prefetcher = ImagePrefetcher([slow, fast], progress=mock.Mock(), workers=2)
+        prefetcher.wait(fast)
+        self.assertFalse(release.is_set())
+
+        release.set()
+        prefetcher.wait(slow)
+
+    def test_failed_pull_is_left_to_the_service(self):
+        def fail(**kwargs):
+            raise IOError('network down')
+
+        service = mock_service('web', fail)
+        prefetcher = ImagePrefetcher([service], progress=mock.Mock())
+        prefetcher.wait(service)
+
+    def test_wait_for_service_not_prefetched(self):
+        ImagePrefetcher([], progress=mock.Mock()).wait(mock_service('web'))
+
+    def test_shared_image_pulled_once(self):
+        pulled = []
+        services = [
+            mock_service(name, lambda name=name, **kwargs: pulled.append(name), image=image)
+            for name, image in [('web', 'busybox'), ('worker', 'busybox:latest'), ('db', 'postgres')]
+        ]
+
+        prefetcher = ImagePrefetcher(services, progress=mock.Mock(), workers=1)
+        for service in services:
+            prefetcher.wait(service)
+
+        self.assertEqual(pulled, ['web', 'db'])
+
+    @mock.patch('compose.progress_stream.os.isatty', return_value=True)
+    @mock.patch('compose.prefetch.sys.stdout', new_callable=StringIO)
+    def test_plain_progress_by_default(self, mock_stdout, mock_isatty):
+        mock_stdout.fileno = lambda: 1
+
+        def pull(progress, **kwargs):
+            progress.update('web', {'status': 'Pulling busybox:latest'})
+
+        service = mock_service('web', pull)
+        prefetcher = ImagePrefetcher([service])
+        prefetcher.wait(service)
+        prefetcher.close()
+
+        self.assertFalse(prefetcher.progress.is_terminal)
+        self.assertIn('web: Pulling busybox:latest\n', mock_stdout.getvalue())
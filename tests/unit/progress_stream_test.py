@@ -1,5 +1,7 @@
 from __future__ import unicode_literals
 from __future__ import absolute_import
+import json
+
 from tests import unittest
 
 from six import StringIO
@@ -17,3 +19,234 @@ class ProgressStreamTestCase(unittest.TestCase):
         ]
         events = progress_stream.stream_output(output, StringIO())
         self.assertEqual(len(events), 1)
+
+    def test_consume_output_passes_events_to_callbacks(self):
+        output = [
+            '{"stream": "Step 0 : FROM busybox\\n"}',
+            '{"stream": "Successfully built 0123abcd\\n"}',
+            '{"stream": "Removing intermediate container\\n"}',
+        ]
+        built_image_id = progress_stream.BuiltImageId()
+        last_event = progress_stream.LastEvent()
+        seen = []
+
+        result = progress_stream.consume_output(
+            output, StringIO(), built_image_id, last_event, seen.append)
+
+        self.assertIsNone(result)
+        self.assertEqual(built_image_id.image_id, '0123abcd')
+        self.assertEqual(last_event.event, {"stream": "Removing intermediate container\n"})
+        self.assertEqual(len(seen), 3)
+
+    def test_consume_output_raises_on_error(self):
+        output = ['{"errorDetail": {"message": "oops"}, "error": "oops"}']
+        last_event = progress_stream.LastEvent()
+
+        with self.assertRaises(progress_stream.StreamOutputError):
+            progress_stream.consume_output(output, StringIO(), last_event)
+        self.assertEqual(last_event.event['error'], 'oops')
+
+
+class TerminalRendererTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0
+        self.stream = StringIO()
+        self.renderer = progress_stream.TerminalRenderer(
+            self.stream, max_fps=10, clock=lambda: self.now)
+
+    def downloading(self, image_id, current):
+        return {
+            "status": "Downloading",
+            "id": image_id,
+            "progressDetail": {"current": current, "total": 100},
+            "progress": "[%d/100]" % current,
+        }
+
+    def test_intermediate_updates_are_skipped(self):
+        for current in range(1, 51):
+            self.renderer.render(self.downloading("abc", current))
+        self.renderer.close()
+
+        output = self.stream.getvalue()
+        self.assertIn("[1/100]", output)
+        self.assertNotIn("[25/100]", output)
+        self.assertIn("[50/100]", output)
+
+    def test_repaints_when_frame_is_due(self):
+        self.renderer.render(self.downloading("abc", 1))
+        self.renderer.render(self.downloading("abc", 2))
+        self.now = 0.1
+        self.renderer.render(self.downloading("abc", 3))
+
+        output = self.stream.getvalue()
+        self.assertNotIn("[2/100]", output)
+        self.assertIn("[3/100]", output)
+
+    def test_final_status_is_rendered_immediately(self):
+        self.renderer.render(self.downloading("abc", 1))
+        self.renderer.render(self.downloading("abc", 2))
+        self.renderer.render({"status": "Pull complete", "id": "abc", "progressDetail": {}})
+
+        output = self.stream.getvalue()
+        self.assertNotIn("[2/100]", output)
+        self.assertIn("abc: Pull complete", output)
+
+    def test_pending_layers_are_painted_before_messages(self):
+        self.renderer.render(self.downloading("abc", 1))
+        self.renderer.render(self.downloading("abc", 2))
+        self.renderer.render({"status": "Status: Downloaded newer image for busybox"})
+
+        output = self.stream.getvalue()
+        self.assertLess(output.index("[2/100]"), output.index("Status: Downloaded"))
+
+
+class ProgressBoardTestCase(unittest.TestCase):
+
+    def layer_events(self, image_id, total):
+        return [
+            '{"status": "Pulling fs layer", "id": "%s", "progressDetail": {}}' % image_id,
+            '{"status": "Downloading", "id": "%s", "progressDetail": '
+            '{"current": %d, "total": %d}, "progress": "..."}' % (image_id, total // 2, total),
+            '{"status": "Download complete", "id": "%s", "progressDetail": {}}' % image_id,
+            '{"status": "Pull complete", "id": "%s", "progressDetail": {}}' % image_id,
+        ]
+
+    def test_summary_counts_layers_and_bytes(self):
+        board = progress_stream.ProgressBoard(StringIO(), is_terminal=True)
+        board.consume('web', self.layer_events('abc', 2000000) + self.layer_events('def', 500000))
+        board.consume('db', ['{"status": "Pulling from library/postgres", "id": "latest"}'])
+
+        self.assertEqual(
+            board.progress['web'].summary(),
+            'web: Waiting (2/2 layers, 2.5 MB/2.5 MB)')
+        self.assertEqual(board.progress['db'].summary(), 'db: Pulling from library/postgres')
+
+    def test_terminal_board_redraws_in_place(self):
+        output = StringIO()
+        board = progress_stream.ProgressBoard(output, is_terminal=True)
+        board.update('web', {'status': 'Pulling busybox:latest'})
+        board.update('db', {'status': 'Pulling postgres:latest'})
+        board.close()
+
+        lines = output.getvalue().split('\n')
+        self.assertIn('\x1b[1A', lines[1])
+        self.assertTrue(lines[-2].endswith('db: Pulling postgres:latest'))
+
+    def test_layer_detail_on_request(self):
+        output = StringIO()
+        board = progress_stream.ProgressBoard(output, detail=True, is_terminal=True)
+        board.consume('web', self.layer_events('abc', 1000)[:2])
+        board.close()
+
+        self.assertIn('  abc: Downloading (50.0%)', output.getvalue())
+
+    def test_plain_output_writes_status_changes(self):
+        output = StringIO()
+        board = progress_stream.ProgressBoard(output, is_terminal=False)
+        board.update('web', {'status': 'Building'})
+        board.consume('web', [
+            '{"stream": "Step 0 : FROM busybox\\n"}',
+            '{"stream": "\\n"}',
+            '{"stream": "Successfully built 0123abcd\\n"}',
+        ])
+
+        self.assertEqual(output.getvalue(), (
+            'web: Building\n'
+            'web: Step 0 : FROM busybox\n'
+            'web: Successfully built 0123abcd\n'
+        ))
+
+    def test_plain_output_writes_summary_on_close(self):
+        now = [0]
+        output = StringIO()
+        board = progress_stream.ProgressBoard(output, clock=lambda: now[0], is_terminal=False)
+        board.consume('web', self.layer_events('abc', 2000000)[:1])
+        now[0] = 2
+        board.consume('web', self.layer_events('abc', 2000000)[1:])
+        board.close()
+
+        self.assertTrue(output.getvalue().endswith('web: 2.0 MB in 2.0s (1.0 MB/s)\n'))
+
+    def test_consume_raises_on_error(self):
+        board = progress_stream.ProgressBoard(StringIO(), is_terminal=False)
+        with self.assertRaises(progress_stream.StreamOutputError):
+            board.consume('web', ['{"errorDetail": {"message": "oops"}, "error": "oops"}'])
+
+
+class FormatBytesTestCase(unittest.TestCase):
+
+    def test_format_bytes(self):
+        self.assertEqual(progress_stream.format_bytes(512), '512.0 B')
+        self.assertEqual(progress_stream.format_bytes(2500000), '2.5 MB')
+        self.assertEqual(progress_stream.format_bytes(3 * 10 ** 15), '3000.0 TB')
+
+
+class JsonProgressTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 100
+        self.output = StringIO()
+        self.progress = progress_stream.JsonProgress(self.output, clock=lambda: self.now)
+
+    def downloading(self, current):
+        return {
+            "status": "Downloading",
+            "id": "abc",
+            "progressDetail": {"current": current, "total": 1000},
+            "progress": "...",
+        }
+
+    def reports(self):
+        return [json.loads(line) for line in self.output.getvalue().splitlines()]
+
+    def test_reports_state_changes_with_rate_and_eta(self):
+        self.progress.update('web', {"status": "Pulling busybox:latest"})
+        self.progress.update('web', self.downloading(0))
+        self.now = 100.5
+        self.progress.update('web', self.downloading(100))
+        self.now = 102
+        self.progress.update('web', self.downloading(400))
+        self.progress.update('web', {"status": "Download complete", "id": "abc", "progressDetail": {}})
+
+        reports = self.reports()
+        self.assertEqual(reports[0], {'service': 'web', 'status': 'Pulling busybox:latest'})
+        self.assertEqual([r['status'] for r in reports[1:]], ['Downloading', 'Downloading', 'Download complete'])
+        self.assertEqual(reports[2], {
+            'service': 'web',
+            'layer': 'abc',
+            'status': 'Downloading',
+            'current': 400,
+            'total': 1000,
+            'rate': 200.0,
+            'eta': 3.0,
+        })
+
+    def test_summary_on_close(self):
+        self.progress.update('web', self.downloading(0))
+        self.now = 104
+        self.progress.update('web', self.downloading(1000))
+        self.progress.close()
+
+        self.assertEqual(self.reports()[-1], {
+            'service': 'web',
+            'summary': True,
+            'bytes': 1000,
+            'time': 4,
+            'rate': 250.0,
+        })
+
+
+class BuildProgressTestCase(unittest.TestCase):
+
+    def test_modes(self):
+        self.assertIsInstance(progress_stream.build_progress('json', StringIO()), progress_stream.JsonProgress)
+        self.assertIsInstance(progress_stream.build_progress('quiet', StringIO()), progress_stream.QuietProgress)
+        self.assertFalse(progress_stream.build_progress('plain', StringIO()).is_terminal)
+        with self.assertRaises(ValueError):
+            progress_stream.build_progress('fancy', StringIO())
+
+    def test_quiet_still_raises_errors(self):
+        progress = progress_stream.build_progress('quiet', StringIO())
+        with self.assertRaises(progress_stream.StreamOutputError):
+            progress.consume('web', ['{"errorDetail": {"message": "oops"}, "error": "oops"}'])
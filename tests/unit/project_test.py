@@ -224,6 +224,43 @@ class ProjectTest(unittest.TestCase):
         service = project.get_service('test')
         self.assertEqual(service._get_net(), 'container:' + container_id)
 
+    def test_external_containers_resolved_lazily_with_one_listing(self):
+        mock_client = mock.create_autospec(docker.Client)
+        mock_client.containers.return_value = [
+            {'Id': 'aaaa', 'Names': ['/data']},
+            {'Id': 'bbbb', 'Names': ['/other', '/web/other']},
+        ]
+        project = Project.from_dicts('test', [
+            {
+                'name': 'test',
+                'image': 'busybox:latest',
+                'volumes_from': ['data'],
+                'net': 'container:other',
+            }
+        ], mock_client)
+        self.assertFalse(mock_client.containers.called)
+
+        service = project.get_service('test')
+        self.assertEqual(service._get_volumes_from(), ['aaaa'])
+        self.assertEqual(service._get_net(), 'container:bbbb')
+        self.assertEqual(mock_client.containers.call_count, 1)
+        self.assertFalse(mock_client.inspect_container.called)
+
+    def test_missing_external_container(self):
+        mock_client = mock.create_autospec(docker.Client)
+        mock_client.containers.return_value = []
+        mock_client.inspect_container.side_effect = docker.errors.APIError('', mock.Mock())
+        project = Project.from_dicts('test', [
+            {
+                'name': 'test',
+                'image': 'busybox:latest',
+                'volumes_from': ['missing'],
+            }
+        ], mock_client)
+
+        with self.assertRaisesRegexp(config.ConfigurationError, 'missing'):
+            project.check_external_containers(project.services)
+
     def test_use_net_from_service(self):
         container_name = 'test_aaa_1'
         mock_client = mock.create_autospec(docker.Client)
@@ -249,3 +286,78 @@ class ProjectTest(unittest.TestCase):
 
         service = project.get_service('test')
         self.assertEqual(service._get_net(), 'container:' + container_name)
+
+    def test_pull_in_parallel(self):
+        mock_client = mock.create_autospec(docker.Client)
+        project = Project.from_dicts('test', [
+            {'name': 'web', 'image': 'busybox:latest'},
+            {'name': 'db', 'image': 'postgres'},
+        ], mock_client)
+        progress = mock.Mock()
+
+        project.pull(parallel=True, progress=progress)
+
+        self.assertEqual(
+            sorted(call[0][0] for call in mock_client.pull.call_args_list),
+            ['busybox', 'postgres'])
+        self.assertEqual(progress.consume.call_count, 2)
+
+    @mock.patch('compose.service.Service.build', autospec=True)
+    def test_parallel_build_closes_client_once(self, mock_build):
+        mock_client = mock.create_autospec(docker.Client)
+        project = Project.from_dicts('test', [
+            {'name': 'web', 'build': '.'},
+            {'name': 'db', 'build': '.'},
+        ], mock_client)
+
+        project.build(parallel=True)
+
+        self.assertEqual(mock_build.call_count, 2)
+        self.assertEqual(
+            [call[1]['close_client'] for call in mock_build.call_args_list],
+            [False, False])
+        mock_client.close.assert_called_once_with()
+
+    def test_pull_shared_image_once(self):
+        mock_client = mock.create_autospec(docker.Client)
+        project = Project.from_dicts('test', [
+            {'name': 'web', 'image': 'busybox'},
+            {'name': 'worker', 'image': 'busybox:latest'},
+            {'name': 'db', 'image': 'postgres'},
+        ], mock_client)
+
+        project.pull(parallel=True, progress=mock.Mock())
+
+        self.assertEqual(
+            sorted(call[0][0] for call in mock_client.pull.call_args_list),
+            ['busybox', 'postgres'])
+
+    def test_pull_in_parallel_raises_errors(self):
+        mock_client = mock.create_autospec(docker.Client)
+        mock_client.pull.side_effect = docker.errors.APIError('oops', mock.Mock())
+        project = Project.from_dicts('test', [
+            {'name': 'web', 'image': 'busybox:latest'},
+        ], mock_client)
+
+        with self.assertRaises(docker.errors.APIError):
+            project.pull(parallel=True, progress=mock.Mock())
+
+    @mock.patch('compose.project.ImagePrefetcher', autospec=True)
+    def test_up_prefetches_images_for_new_containers(self, mock_prefetcher):
+        mock_client = mock.create_autospec(docker.Client)
+        mock_client.containers.return_value = []
+        project = Project.from_dicts('test', [
+            {'name': 'db', 'image': 'postgres'},
+            {'name': 'web', 'image': 'busybox:latest', 'links': ['db']},
+            {'name': 'app', 'build': '.'},
+        ], mock_client)
+
+        with mock.patch('compose.service.Service.execute_convergence_plan', return_value=[]):
+            project.up()
+
+        services, = mock_prefetcher.call_args[0]
+        self.assertEqual([s.name for s in services], ['db', 'web'])
+        self.assertEqual(
+            [call[0][0].name for call in mock_prefetcher.return_value.wait.call_args_list],
+            ['db', 'web', 'app'])
+        self.assertTrue(mock_prefetcher.return_value.close.called)
@@ -3,13 +3,16 @@ from __future__ import absolute_import
 
 from .. import unittest
 import mock
+from six import StringIO
 
 import docker
+from docker.errors import APIError
 
 from compose.service import Service
 from compose.container import Container
-from compose.const import LABEL_SERVICE, LABEL_PROJECT, LABEL_ONE_OFF
+from compose.const import LABEL_SERVICE, LABEL_PROJECT, LABEL_ONE_OFF, LABEL_POOL
 from compose.service import (
+    BuildError,
     ConfigError,
     NeedsBuildError,
     build_port_bindings,
@@ -26,6 +29,7 @@ class ServiceTest(unittest.TestCase):
 
     def setUp(self):
         self.mock_client = mock.create_autospec(docker.Client)
+        self.mock_client.base_url = 'http+docker://localunixsocket'
 
     def test_name_validations(self):
         self.assertRaises(ConfigError, lambda: Service(name=''))
@@ -69,6 +73,21 @@ class ServiceTest(unittest.TestCase):
             all=False,
             filters={'label': expected_labels})
 
+    def test_pooled_containers_are_left_out(self):
+        labels = {LABEL_POOL: 'key', 'com.docker.compose.container-number': '1'}
+        self.mock_client.containers.return_value = [
+            {'Id': 'a', 'Image': 'foo', 'Names': ['/myproject_db_run_4'], 'Labels': labels},
+            {'Id': 'b', 'Image': 'foo', 'Names': ['/myproject_db_pool_9'], 'Labels': labels},
+        ]
+        self.mock_client.inspect_container.return_value = {
+            'Id': 'a',
+            'Name': '/myproject_db_run_4',
+            'Config': {'Labels': labels},
+        }
+        service = Service('db', self.mock_client, 'myproject', image='foo')
+        self.assertEqual([c.id for c in service.containers(one_off=True)], ['a'])
+        self.assertEqual(service._next_container_number(one_off=True), 5)
+
     def test_get_volumes_from_container(self):
         container_id = 'aabbccddee'
         service = Service(
@@ -222,6 +241,17 @@ class ServiceTest(unittest.TestCase):
             insecure_registry=False,
             stream=True)
 
+    @mock.patch('compose.service.log', autospec=True)
+    def test_pull_image_with_progress_board(self, mock_log):
+        self.mock_client.pull.return_value = ['{"status": "Pulling from someimage", "id": "latest"}']
+        progress = mock.Mock()
+        service = Service('foo', client=self.mock_client, image='someimage')
+        service.pull(progress=progress)
+
+        self.assertFalse(mock_log.info.called)
+        progress.update.assert_called_once_with('foo', {'status': 'Pulling someimage:latest'})
+        progress.consume.assert_called_once_with('foo', self.mock_client.pull.return_value, mock.ANY)
+
     def test_create_container_from_insecure_registry(self):
         service = Service('foo', client=self.mock_client, image='someimage:sometag')
         images = []
@@ -284,7 +314,7 @@ class ServiceTest(unittest.TestCase):
 
         images = []
         service.image = lambda *args, **kwargs: images[0] if images else None
-        service.build = lambda: images.append({'Id': 'abc123'})
+        service.build = lambda **kwargs: images.append({'Id': 'abc123'})
 
         service.create_container(do_build=True)
         self.assertEqual(1, len(images))
@@ -296,6 +326,132 @@ class ServiceTest(unittest.TestCase):
         service.create_container(do_build=False)
         self.assertFalse(self.mock_client.build.called)
 
+    @mock.patch('compose.service.Service._build_digest', return_value=None)
+    @mock.patch('compose.service.sys.stdout', new_callable=StringIO)
+    def test_build_returns_image_id(self, _, __):
+        service = Service('foo', client=self.mock_client, build='.')
+        self.mock_client.build.return_value = [
+            '{"stream": "Step 0 : FROM busybox\\n"}',
+            '{"stream": "Successfully built abc123\\n"}',
+        ]
+        self.assertEqual(service.build(), 'abc123')
+        self.mock_client.close.assert_called_once_with()
+
+    @mock.patch('compose.service.Service._build_digest', return_value=None)
+    @mock.patch('compose.service.sys.stdout', new_callable=StringIO)
+    def test_build_leaves_shared_client_open(self, _, __):
+        service = Service('foo', client=self.mock_client, build='.')
+        self.mock_client.build.return_value = ['{"stream": "Successfully built abc123\\n"}']
+        service.build(close_client=False)
+        self.assertFalse(self.mock_client.close.called)
+
+    @mock.patch('compose.service.Service._build_digest', return_value=None)
+    @mock.patch('compose.service.sys.stdout', new_callable=StringIO)
+    def test_build_without_image_id_reports_last_event(self, _, __):
+        service = Service('foo', client=self.mock_client, build='.')
+        self.mock_client.build.return_value = ['{"stream": "Step 0 : FROM busybox\\n"}']
+
+        with self.assertRaises(BuildError) as context:
+            service.build()
+        self.assertEqual(context.exception.reason, {"stream": "Step 0 : FROM busybox\n"})
+
+    @mock.patch('compose.service.BuildCache', autospec=True)
+    @mock.patch('compose.service.Service._build_digest', return_value='deadbeef')
+    def test_build_skipped_when_context_unchanged(self, _, mock_build_cache):
+        mock_build_cache.return_value.get.return_value = 'abc123'
+        self.mock_client.inspect_image.return_value = {'Id': 'abc123def456'}
+        service = Service('foo', client=self.mock_client, build='.')
+
+        self.assertEqual(service.build(), 'abc123def456')
+        mock_build_cache.return_value.get.assert_called_once_with('default_foo', 'deadbeef')
+        self.assertFalse(self.mock_client.build.called)
+
+    @mock.patch('compose.service.BuildCache', autospec=True)
+    @mock.patch('compose.service.Service._build_digest', return_value='deadbeef')
+    @mock.patch('compose.service.sys.stdout', new_callable=StringIO)
+    def test_build_records_context_digest(self, _, __, mock_build_cache):
+        mock_build_cache.return_value.get.return_value = None
+        self.mock_client.build.return_value = ['{"stream": "Successfully built abc123\\n"}']
+        service = Service('foo', client=self.mock_client, build='.')
+
+        self.assertEqual(service.build(), 'abc123')
+        mock_build_cache.return_value.record.assert_called_once_with('default_foo', 'deadbeef', 'abc123')
+
+    @mock.patch('compose.service.Service._build_digest', return_value=None)
+    @mock.patch('compose.service.sys.stdout', new_callable=StringIO)
+    def test_build_streams_context_compressed_for_remote_daemon(self, _, __):
+        self.mock_client.base_url = 'https://10.0.0.1:2376'
+        self.mock_client.build.return_value = ['{"stream": "Successfully built abc123\\n"}']
+        service = Service('foo', client=self.mock_client, build='.', dockerfile='Dockerfile.dev')
+        service.build()
+
+        _, call_kwargs = self.mock_client.build.call_args
+        self.assertTrue(call_kwargs['custom_context'])
+        self.assertEqual(call_kwargs['encoding'], 'gzip')
+        self.assertEqual(call_kwargs['dockerfile'], 'Dockerfile.dev')
+        self.assertNotIn('path', call_kwargs)
+
+    @mock.patch('compose.service.BuildCache', autospec=True)
+    @mock.patch('compose.service.Service._build_digest', return_value='deadbeef')
+    def test_build_loads_image_from_build_cache(self, _, mock_build_cache):
+        mock_build_cache.return_value.get.return_value = None
+        image_cache = mock.Mock()
+        image_cache.load.return_value = 'abc123'
+        service = Service('foo', client=self.mock_client, build='.')
+
+        self.assertEqual(service.build(build_cache=image_cache), 'abc123')
+        image_cache.load.assert_called_once_with(self.mock_client, 'deadbeef', 'default_foo')
+        mock_build_cache.return_value.record.assert_called_once_with('default_foo', 'deadbeef', 'abc123')
+        self.assertFalse(self.mock_client.build.called)
+
+    @mock.patch('compose.service.BuildCache', autospec=True)
+    @mock.patch('compose.service.Service._build_digest', return_value='deadbeef')
+    @mock.patch('compose.service.sys.stdout', new_callable=StringIO)
+    def test_build_saves_image_to_build_cache(self, _, __, mock_build_cache):
+        mock_build_cache.return_value.get.return_value = None
+        self.mock_client.build.return_value = ['{"stream": "Successfully built abc123\\n"}']
+        image_cache = mock.Mock()
+        image_cache.load.side_effect = IOError('corrupt')
+        service = Service('foo', client=self.mock_client, build='.')
+
+        self.assertEqual(service.build(build_cache=image_cache), 'abc123')
+        image_cache.save.assert_called_once_with(self.mock_client, 'deadbeef', 'default_foo')
+
+    @mock.patch('compose.service.build_context_digest')
+    @mock.patch('compose.service.sys.stdout', new_callable=StringIO)
+    def test_build_with_no_cache_ignores_context_digest(self, _, mock_digest):
+        self.mock_client.build.return_value = ['{"stream": "Successfully built abc123\\n"}']
+        service = Service('foo', client=self.mock_client, build='.')
+
+        self.assertEqual(service.build(no_cache=True), 'abc123')
+        self.assertFalse(mock_digest.called)
+
+    @mock.patch('compose.service.BuildCache', autospec=True)
+    @mock.patch('compose.service.Service._build_digest', return_value='deadbeef')
+    @mock.patch('compose.service.sys.stdout', new_callable=StringIO)
+    def test_build_with_pull_when_context_unchanged(self, _, __, mock_build_cache):
+        mock_build_cache.return_value.get.return_value = 'abc123'
+        self.mock_client.inspect_image.return_value = {'Id': 'abc123def456'}
+        self.mock_client.build.return_value = ['{"stream": "Successfully built 789abc\\n"}']
+        service = Service('foo', client=self.mock_client, build='.')
+
+        self.assertEqual(service.build(pull=True), '789abc')
+        mock_build_cache.return_value.record.assert_called_once_with('default_foo', 'deadbeef', '789abc')
+
+    @mock.patch('compose.service.dockerfile_base_image', return_value='busybox')
+    @mock.patch('compose.service.build_context_digest', return_value='deadbeef')
+    def test_build_digest_includes_base_image(self, _, __):
+        service = Service('foo', client=self.mock_client, build='.')
+
+        self.mock_client.inspect_image.return_value = {'Id': 'aaa'}
+        first = service._build_digest()
+        self.mock_client.inspect_image.return_value = {'Id': 'bbb'}
+        self.assertNotEqual(service._build_digest(), first)
+        self.mock_client.inspect_image.assert_called_with('busybox')
+
+        self.mock_client.inspect_image.side_effect = APIError('Not found', mock.Mock())
+        self.assertIsNone(service._build_digest())
+
     def test_create_container_no_build_but_needs_build(self):
         service = Service('foo', client=self.mock_client, build='.')
         service.image = lambda: None
@@ -0,0 +1,178 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import threading
+
+import docker
+from docker.errors import APIError
+import mock
+
+from compose.const import LABEL_CONTAINER_NUMBER, LABEL_ONE_OFF, LABEL_PROJECT, LABEL_SERVICE
+from compose.state import ContainerStates
+from .. import unittest
+
+
+def labels(service, project='myapp', one_off=False):
+    return {
+        LABEL_PROJECT: project,
+        LABEL_SERVICE: service,
+        LABEL_ONE_OFF: 'True' if one_off else 'False',
+        LABEL_CONTAINER_NUMBER: '1',
+    }
+
+
+def ps(id, name, status, **kwargs):
+    return {
+        'Id': id,
+        'Image': 'busybox:latest',
+        'Names': ['/' + name],
+        'Status': status,
+        'Labels': labels(name.split('_')[1], **kwargs),
+    }
+
+
+def inspect(id, name, running, exit_code=0, started=True, **kwargs):
+    return {
+        'Id': id,
+        'Name': '/' + name,
+        'Config': {'Image': 'busybox:latest', 'Labels': labels(name.split('_')[1], **kwargs)},
+        'State': {
+            'Running': running,
+            'ExitCode': exit_code,
+            'StartedAt': '2015-06-01T12:00:00.1Z' if started else '0001-01-01T00:00:00Z',
+        },
+    }
+
+
+class ContainerStatesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = mock.create_autospec(docker.Client)
+        self.client.containers.return_value = [
+            ps('1', 'myapp_web_1', 'Up 3 seconds'),
+            ps('2', 'myapp_db_1', 'Exited (2) 5 seconds ago'),
+            ps('3', 'myapp_web_run_1', 'Up 1 seconds', one_off=True),
+        ]
+        self.states = ContainerStates(self.client, 'myapp')
+        self.states.resync()
+
+    def test_resync(self):
+        self.assertEqual([c.name for c in self.states.containers()], ['myapp_web_1'])
+        self.assertEqual(
+            [c.name for c in self.states.containers(stopped=True)],
+            ['myapp_db_1', 'myapp_web_1'])
+        self.assertEqual([c.name for c in self.states.containers(one_off=True)], ['myapp_web_run_1'])
+        self.assertEqual(self.states.containers(service_names=['db']), [])
+        self.assertTrue(self.states.is_running('1'))
+        self.assertEqual(self.states.exit_code('1'), None)
+        self.assertEqual(self.states.exit_code('2'), 2)
+        self.client.containers.assert_called_once_with(
+            all=True, filters={'label': [LABEL_PROJECT + '=myapp']})
+
+    def test_queries_answered_from_memory(self):
+        self.states.containers()
+        self.states.is_running('1')
+        self.assertEqual(self.client.containers.call_count, 1)
+
+    def test_unsynced_queries_go_to_the_daemon(self):
+        self.states.synced = False
+        self.states.containers()
+        self.assertEqual(self.client.containers.call_count, 2)
+
+    def test_die_event(self):
+        self.client.inspect_container.return_value = inspect('1', 'myapp_web_1', False, exit_code=137)
+        self.states.handle({'status': 'die', 'id': '1'})
+        self.assertFalse(self.states.is_running('1'))
+        self.assertEqual(self.states.exit_code('1'), 137)
+
+    def test_new_container(self):
+        self.client.inspect_container.return_value = inspect('4', 'myapp_web_2', True)
+        self.states.handle({'status': 'start', 'id': '4'})
+        self.assertEqual([c.name for c in self.states.containers()], ['myapp_web_1', 'myapp_web_2'])
+
+    def test_other_projects_are_inspected_once(self):
+        self.client.inspect_container.return_value = inspect('5', 'other_web_1', True, project='other')
+        self.states.handle({'status': 'start', 'id': '5'})
+        self.states.handle({'status': 'die', 'id': '5'})
+        self.assertEqual(self.client.inspect_container.call_count, 1)
+        self.assertFalse(self.states.is_running('5'))
+
+    def test_image_events_are_ignored(self):
+        self.states.handle({'status': 'pull', 'id': 'busybox:latest'})
+        self.assertFalse(self.client.inspect_container.called)
+
+    def test_destroy_event(self):
+        self.states.handle({'status': 'destroy', 'id': '2'})
+        self.assertEqual([c.name for c in self.states.containers(stopped=True)], ['myapp_web_1'])
+
+    def test_removed_before_inspect(self):
+        self.client.inspect_container.side_effect = APIError('Not found', mock.Mock())
+        self.states.handle({'status': 'die', 'id': '1'})
+        self.assertEqual(self.states.containers(), [])
+
+    def test_wait(self):
+        self.assertEqual(self.states.wait('2'), 2)
+
+        result = []
+        thread = threading.Thread(target=lambda: result.append(self.states.wait('1')))
+        thread.start()
+        self.client.inspect_container.return_value = inspect('1', 'myapp_web_1', False, exit_code=1)
+        self.states.handle({'status': 'die', 'id': '1'})
+        thread.join(5)
+        self.assertEqual(result, [1])
+
+    def test_wait_asks_the_daemon_when_unsynced(self):
+        self.states.synced = False
+        self.client.wait.return_value = 5
+        self.assertEqual(self.states.wait('1'), 5)
+        self.client.wait.assert_called_once_with('1')
+
+    def test_wait_asks_the_daemon_without_an_exit_code(self):
+        self.client.inspect_container.return_value = inspect('1', 'myapp_web_1', False, started=False)
+        self.states.handle({'status': 'create', 'id': '1'})
+        self.assertEqual(self.states.exit_code('1'), None)
+        self.client.wait.return_value = 7
+        self.assertEqual(self.states.wait('1'), 7)
+        self.client.wait.assert_called_once_with('1')
+
+    def test_containers_have_labels_without_inspecting(self):
+        [container] = self.states.containers()
+        self.assertEqual((container.service, container.number), ('web', 1))
+        self.assertFalse(self.client.inspect_container.called)
+
+    def test_events_split_across_chunks(self):
+        finished = threading.Event()
+
+        def events():
+            yield b'{"status": "die", "id"'
+            yield b': "1"}{"status": "destroy", "id": "2"}'
+            finished.wait(5)
+
+        self.client.events.return_value = events()
+        self.client.inspect_container.return_value = inspect('1', 'myapp_web_1', False, exit_code=1)
+        states = ContainerStates(self.client, 'myapp').start()
+        try:
+            self.assertEqual(states.wait('1'), 1)
+            self.assertEqual(states.wait('2'), None)
+        finally:
+            finished.set()
+            states.stop()
+        self.client.inspect_container.assert_called_once_with('1')
+
+    def test_resubscribes_when_stream_breaks(self):
+        subscribed = threading.Event()
+        calls = []
+
+        def events():
+            calls.append(True)
+            if len(calls) == 1:
+                raise IOError('connection reset')
+            subscribed.set()
+            return iter([])
+
+        self.client.events.side_effect = events
+        states = ContainerStates(self.client, 'myapp', resubscribe_interval=0.01).start()
+        try:
+            self.assertTrue(subscribed.wait(5))
+        finally:
+            states.stop()
+        self.assertEqual(calls[:2], [True, True])
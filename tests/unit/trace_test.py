@@ -0,0 +1,60 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+from compose import trace
+from .. import unittest
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1
+
+    def __call__(self):
+        self.now += 1
+        return self.now
+
+
+class Thing(object):
+    name = 'web'
+
+    @trace.traced('service')
+    def work(self, value):
+        with trace.span('inner', step=value):
+            return value * 2
+
+
+class TraceTest(unittest.TestCase):
+
+    def tearDown(self):
+        trace.stop()
+
+    def test_disabled(self):
+        self.assertFalse(trace.enabled())
+        self.assertIs(trace.span('anything'), trace.NO_SPAN)
+        self.assertEqual(Thing().work(2), 4)
+
+    def test_records_spans(self):
+        tracer = trace.start(clock=FakeClock())
+        self.assertEqual(Thing().work(2), 4)
+        self.assertIs(trace.stop(), tracer)
+
+        events = tracer.trace()['traceEvents']
+        [thread_name] = [e for e in events if e['ph'] == 'M']
+        spans = [e for e in events if e['ph'] == 'X']
+
+        self.assertEqual(thread_name['args'], {'name': 'MainThread'})
+        self.assertEqual(
+            [(e['name'], e['cat'], e['args']) for e in spans],
+            [('inner', 'compose', {'step': 2}), ('work', 'service', {'name': 'web'})])
+        inner, work = spans
+        self.assertEqual((work['ts'], work['dur']), (2e6, 3e6))
+        self.assertEqual((inner['ts'], inner['dur']), (3e6, 1e6))
+        self.assertEqual(inner['tid'], work['tid'])
+
+    def test_span_finished_on_error(self):
+        tracer = trace.start()
+        with self.assertRaises(ValueError):
+            with trace.span('failing'):
+                raise ValueError()
+        self.assertEqual([e['name'] for e in tracer.trace()['traceEvents'] if e['ph'] == 'X'], ['failing'])
@@ -0,0 +1,85 @@
+# encoding: utf-8
+from __future__ import unicode_literals
+from __future__ import absolute_import
+import json
+import random
+import threading
+import time
+
+from compose.utils import json_stream, run_concurrently
+from .. import unittest
+
+
+class JsonStreamTest(unittest.TestCase):
+    def test_one_object_per_chunk(self):
+        chunks = [b'{"status": "a"}', b'{"status": "b"}\r\n']
+        self.assertEqual(list(json_stream(chunks)), [{'status': 'a'}, {'status': 'b'}])
+
+    def test_several_objects_in_a_chunk(self):
+        chunks = [b'{"a": 1}\r\n{"b": 2}{"c": 3}\n']
+        self.assertEqual(list(json_stream(chunks)), [{'a': 1}, {'b': 2}, {'c': 3}])
+
+    def test_object_split_across_chunks(self):
+        chunks = [b'{"stream": "St', b'ep 0"', b'}\n{"a"', b': {"b": 1}}']
+        self.assertEqual(list(json_stream(chunks)), [{'stream': 'Step 0'}, {'a': {'b': 1}}])
+
+    def test_text_chunks(self):
+        self.assertEqual(list(json_stream(['{"a": ', '1}'])), [{'a': 1}])
+
+    def test_multibyte_character_split_across_chunks(self):
+        encoded = json.dumps({'stream': '•'}, ensure_ascii=False).encode('utf-8')
+        index = encoded.index(b'\xe2') + 1
+        chunks = [encoded[:index], encoded[index:]]
+        self.assertEqual(list(json_stream(chunks)), [{'stream': '•'}])
+
+    def test_random_chunk_sizes(self):
+        objects = [{'id': str(i), 'progressDetail': {'current': i, 'total': 100}} for i in range(100)]
+        data = b''.join(json.dumps(obj).encode('utf-8') + b'\r\n' for obj in objects)
+        rand = random.Random(0)
+
+        for _ in range(20):
+            chunks = []
+            offset = 0
+            while offset < len(data):
+                size = rand.randint(1, 64)
+                chunks.append(data[offset:offset + size])
+                offset += size
+            self.assertEqual(list(json_stream(chunks)), objects)
+
+    def test_incomplete_object_at_end_raises(self):
+        with self.assertRaises(ValueError):
+            list(json_stream([b'{"a": 1}', b'{"b": ']))
+
+
+class RunConcurrentlyTest(unittest.TestCase):
+
+    def test_bounded_workers(self):
+        lock = threading.Lock()
+        running = [0]
+        most = [0]
+        done = []
+
+        def func(item):
+            with lock:
+                running[0] += 1
+                most[0] = max(most[0], running[0])
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+                done.append(item)
+
+        run_concurrently(func, range(10), workers=3)
+        self.assertEqual(sorted(done), list(range(10)))
+        self.assertLessEqual(most[0], 3)
+
+    def test_reraises_after_all_items(self):
+        done = []
+
+        def func(item):
+            if item == 0:
+                raise ValueError(item)
+            done.append(item)
+
+        with self.assertRaises(ValueError):
+            run_concurrently(func, range(5), workers=1)
+        self.assertEqual(done, [1, 2, 3, 4])